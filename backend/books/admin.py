@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import Book, OPACSearchLog
+from django.db.models import Q
+from django.db.models.functions import Lower
+from library_system.changelists import ScalableChangeListMixin, prefix_range, search_user_ids
+from .inventory import normalize_barcode
+from .models import Book, BookCopy, OPACSearchLog
 
 
 @admin.register(Book)
@@ -26,10 +30,40 @@ class BookAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(BookCopy)
+class BookCopyAdmin(admin.ModelAdmin):
+    list_display = ('barcode', 'book', 'status', 'stack', 'shelf', 'last_seen_at')
+    list_filter = ('status',)
+    list_select_related = ('book',)
+    search_fields = ('barcode',)  # Enables the search box; see get_search_results
+    search_help_text = 'Exact barcode'
+    autocomplete_fields = ('book',)
+    ordering = ('barcode',)
+    readonly_fields = ('last_seen_at', 'created_at')
+    
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(barcode=normalize_barcode(search_term)), False
+
+
 @admin.register(OPACSearchLog)
-class OPACSearchLogAdmin(admin.ModelAdmin):
+class OPACSearchLogAdmin(ScalableChangeListMixin, admin.ModelAdmin):
     list_display = ('search_query', 'search_type', 'user', 'results_count', 'timestamp')
-    list_filter = ('search_type', 'timestamp')
-    search_fields = ('search_query', 'user__full_name', 'user__email')
+    list_filter = ('search_type',)
+    list_select_related = ('user',)
+    date_hierarchy = 'timestamp'
+    autocomplete_fields = ('user',)
+    search_fields = ('search_query',)  # Enables the search box; see get_search_results
+    search_help_text = "Start of the search text, or of the user's name or email"
     ordering = ('-timestamp',)
     readonly_fields = ('timestamp',)
+    
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip().lower()
+        if not term:
+            return queryset, False
+        queryset = queryset.annotate(query_key=Lower('search_query')).filter(
+            prefix_range('query_key', term) | Q(user_id__in=search_user_ids(term))
+        )
+        return queryset, False
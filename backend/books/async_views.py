@@ -0,0 +1,161 @@
+"""
+Async read-only OPAC endpoints.
+
+These mirror the public catalog views with Django async views and the async
+ORM, so under an ASGI server (e.g. uvicorn) slow clients on high-latency
+links wait on the event loop instead of each holding a worker thread. They
+run alongside the sync DRF views, authenticate bearer tokens optionally and
+share the OPAC throttles and replica routing.
+"""
+from functools import wraps
+from math import ceil
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from library_system import write_queue
+from library_system.db_router import replica_reads
+from library_system.throttling import AnonOPACThrottle, UserOPACThrottle
+from users.authentication import RoleClaimsJWTAuthentication
+
+from .models import Book
+from .opac import search_log, search_params, search_queryset
+from .serializers import BookAvailabilitySerializer
+
+
+PAGE_SIZE = 20
+MAX_SUGGESTIONS = 10
+MAX_AVAILABILITY_IDS = 100
+
+
+def _check_request(request):
+    """
+    Authenticate an optional bearer token and apply the OPAC throttles.
+    Sets request.user; returns an error response or None.
+    """
+    try:
+        result = RoleClaimsJWTAuthentication().authenticate(request)
+    except AuthenticationFailed as exc:
+        return JsonResponse({'detail': str(exc.detail)}, status=401)
+    request.user = result[0] if result else AnonymousUser()
+
+    for throttle in (AnonOPACThrottle(), UserOPACThrottle()):
+        if not throttle.allow_request(request, None):
+            wait = ceil(throttle.wait() or 1)
+            response = JsonResponse(
+                {'detail': f'Request was throttled. Expected available in {wait} seconds.'},
+                status=429
+            )
+            response['Retry-After'] = str(wait)
+            return response
+    return None
+
+
+def opac_endpoint(view_func):
+    """Public async GET endpoint with optional JWT auth and OPAC throttling"""
+    @require_GET
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        # Token checks and throttles only touch the cache
+        error = await sync_to_async(_check_request)(request)
+        if error is not None:
+            return error
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
+
+def _page_number(request):
+    try:
+        return max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        return 1
+
+
+def _page_link(request, page):
+    url = request.build_absolute_uri()
+    if page == 1:
+        return remove_query_param(url, 'page')
+    return replace_query_param(url, 'page', page)
+
+
+@opac_endpoint
+@replica_reads
+async def opac_search(request):
+    """Async OPAC search, paginated like the sync endpoint"""
+    params = search_params(request.GET)
+    queryset = search_queryset(params)
+    count = await queryset.acount()
+
+    user_id = request.user.pk if request.user.is_authenticated else None
+    await sync_to_async(write_queue.enqueue)([search_log(params, user_id, count)])
+
+    page = _page_number(request)
+    last_page = max(1, ceil(count / PAGE_SIZE))
+    if page > last_page:
+        return JsonResponse({'detail': 'Invalid page.'}, status=404)
+
+    offset = (page - 1) * PAGE_SIZE
+    books = [book async for book in queryset[offset:offset + PAGE_SIZE]]
+    return JsonResponse({
+        'count': count,
+        'next': _page_link(request, page + 1) if page < last_page else None,
+        'previous': _page_link(request, page - 1) if page > 1 else None,
+        'results': BookAvailabilitySerializer(books, many=True).data
+    })
+
+
+@opac_endpoint
+async def book_categories(request):
+    """Get list of available book categories"""
+    return JsonResponse([choice[0] for choice in Book.CATEGORY_CHOICES], safe=False)
+
+
+@opac_endpoint
+@replica_reads
+async def book_detail(request, pk):
+    """Public catalog record for one book"""
+    book = await Book.objects.filter(pk=pk).afirst()
+    if book is None:
+        return JsonResponse({'error': 'Book not found'}, status=404)
+    return JsonResponse(BookAvailabilitySerializer(book).data)
+
+
+@opac_endpoint
+@replica_reads
+async def suggestions(request):
+    """Title and author completions for a search box prefix"""
+    prefix = request.GET.get('q', '').strip()
+    if len(prefix) < 2:
+        return JsonResponse([], safe=False)
+
+    titles = Book.objects.filter(title__istartswith=prefix).values('id', 'title', 'author')
+    results = [row async for row in titles[:MAX_SUGGESTIONS]]
+    if len(results) < MAX_SUGGESTIONS:
+        authors = Book.objects.filter(author__istartswith=prefix).exclude(
+            id__in=[row['id'] for row in results]
+        ).values('id', 'title', 'author')
+        results += [row async for row in authors[:MAX_SUGGESTIONS - len(results)]]
+    return JsonResponse(results, safe=False)
+
+
+@opac_endpoint
+@replica_reads
+async def availability(request):
+    """Copy availability for a comma-separated list of book ids"""
+    try:
+        ids = [int(value) for value in request.GET.get('ids', '').split(',') if value.strip()]
+    except ValueError:
+        return JsonResponse({'error': 'ids must be a comma-separated list of integers'}, status=400)
+    if len(ids) > MAX_AVAILABILITY_IDS:
+        return JsonResponse({'error': f'At most {MAX_AVAILABILITY_IDS} ids per request'}, status=400)
+
+    rows = Book.objects.filter(id__in=ids).values('id', 'total_copies', 'available_copies')
+    results = []
+    async for row in rows:
+        row['is_available'] = row['available_copies'] > 0
+        results.append(row)
+    return JsonResponse(results, safe=False)
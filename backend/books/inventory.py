@@ -0,0 +1,332 @@
+"""
+Per-copy inventory: barcode registration, backfill and shelf stocktake.
+
+Book.total_copies and Book.available_copies remain the counters the rest of
+the system reads; copies record which physical item is where. A checkout
+that names only the book is lent one of its labelled copies (shelf_copy), so
+stocktakes never expect a lent copy on the shelf. Copies set aside for a
+hold are marked 'held' on return, but a hold that expires or is cancelled
+releases a count rather than a particular copy, so the copy stays 'held'
+until it is checked out; once no ready hold remains for the book it can be
+checked out like an available one.
+
+reconcile_availability() recomputes available_copies from the loans, holds
+and copies behind it and repairs counters that have drifted.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Book, BookCopy, parse_shelf_location
+
+
+BARCODE_PREFIX = 'LIB'
+LOOKUP_BATCH_SIZE = 500
+OUT_OF_SERVICE = ('missing', 'withdrawn')
+
+
+class InventoryError(Exception):
+    """Raised when copies cannot be registered as requested"""
+
+
+def generated_barcode(book_id, number):
+    return f'{BARCODE_PREFIX}{book_id:08d}{number:03d}'
+
+
+def normalize_barcode(barcode):
+    return str(barcode).strip().upper()
+
+
+def _adjust_available(deltas):
+    """Apply per-book changes to available_copies, grouped so equal changes share an UPDATE"""
+    by_delta = {}
+    for book_id, delta in deltas.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(book_id)
+    for delta, book_ids in by_delta.items():
+        Book.objects.filter(id__in=book_ids).update(
+            available_copies=Greatest(F('available_copies') + delta, 0)
+        )
+
+
+@transaction.atomic
+def register_copies(book, barcodes):
+    """
+    Label copies of a book. Barcodes first cover copies already counted in
+    total_copies but not yet labelled; any beyond that are new copies and
+    raise total_copies and available_copies.
+    """
+    barcodes = [normalize_barcode(barcode) for barcode in barcodes]
+    if len(set(barcodes)) != len(barcodes):
+        raise InventoryError('Duplicate barcodes in request')
+    taken = set(BookCopy.objects.filter(barcode__in=barcodes).values_list('barcode', flat=True))
+    if taken:
+        raise InventoryError(f"Barcodes already registered: {', '.join(sorted(taken))}")
+
+    book = Book.objects.select_for_update().get(id=book.id)
+    unlabelled = max(0, book.total_copies - book.copies.count())
+    stack, shelf = parse_shelf_location(book.shelf_location)
+    copies = BookCopy.objects.bulk_create([
+        BookCopy(book=book, barcode=barcode, stack=stack, shelf=shelf) for barcode in barcodes
+    ])
+
+    added = max(0, len(barcodes) - unlabelled)
+    if added:
+        book.total_copies += added
+        book.available_copies += added
+        book.save(update_fields=['total_copies', 'available_copies', 'updated_at'])
+    return copies
+
+
+def shelf_copy(book, for_hold=False):
+    """
+    Lock and return a labelled copy to lend when a checkout names the book
+    rather than a barcode: the copy set aside for a hold being collected,
+    otherwise one from the open shelf. None when no copy of the book is
+    labelled. The caller must hold the book's row lock.
+    """
+    from borrowing.models import Hold
+
+    if for_hold:
+        statuses = ('held', 'available')
+    elif Hold.objects.filter(book=book, status='ready').exists():
+        statuses = ('available',)
+    else:
+        statuses = ('available', 'held')
+    for status in statuses:
+        copy = BookCopy.objects.select_for_update().filter(book=book, status=status).order_by('barcode').first()
+        if copy is not None:
+            return copy
+    return None
+
+
+def backfill_copies(batch_size=1000, progress=None):
+    """
+    Create generated-barcode copies for every copy counted in total_copies
+    but not yet labelled, and link open loans to them. Statuses follow the
+    counters: copies set aside for ready holds are held, copies up to
+    available_copies are available and the rest are on loan.
+    """
+    from borrowing.models import BorrowRecord, Hold
+
+    created = 0
+    last_id = 0
+    while True:
+        books = list(Book.objects.filter(id__gt=last_id).order_by('id')[:batch_size])
+        if not books:
+            break
+        last_id = books[-1].id
+        ids = [book.id for book in books]
+        labelled = Counter()
+        for book_id, status, count in BookCopy.objects.filter(book_id__in=ids).order_by().values(
+            'book_id', 'status'
+        ).annotate(count=Count('id')).values_list('book_id', 'status', 'count'):
+            labelled[book_id, status] += count
+            labelled[book_id] += count
+        pending = [book for book in books if book.total_copies > labelled[book.id]]
+        if not pending:
+            continue
+
+        ids = [book.id for book in pending]
+        open_loans = {}
+        for loan in BorrowRecord.objects.filter(
+            book_id__in=ids, return_date__isnull=True, copy__isnull=True
+        ).only('id', 'book_id').order_by('id'):
+            open_loans.setdefault(loan.book_id, []).append(loan)
+        ready_holds = dict(
+            Hold.objects.filter(book_id__in=ids, status='ready').order_by().values('book_id')
+            .annotate(count=Count('id')).values_list('book_id', 'count')
+        )
+
+        copies, loans = [], []
+        for book in pending:
+            stack, shelf = parse_shelf_location(book.shelf_location)
+            available = max(0, book.available_copies - labelled[book.id, 'available'])
+            held = max(0, ready_holds.get(book.id, 0) - labelled[book.id, 'held'])
+            book_loans = open_loans.get(book.id, [])
+            for number in range(labelled[book.id] + 1, book.total_copies + 1):
+                if available:
+                    status, available = 'available', available - 1
+                elif held:
+                    status, held = 'held', held - 1
+                else:
+                    status = 'on_loan'
+                copy = BookCopy(
+                    book=book, barcode=generated_barcode(book.id, number), status=status,
+                    stack=stack, shelf=shelf
+                )
+                copies.append(copy)
+                if status == 'on_loan' and book_loans:
+                    loans.append((book_loans.pop(), copy))
+
+        with transaction.atomic():
+            BookCopy.objects.bulk_create(copies)
+            for loan, copy in loans:
+                loan.copy = copy
+            BorrowRecord.objects.bulk_update([loan for loan, _ in loans], ['copy'])
+        created += len(copies)
+        if progress:
+            progress(created)
+    return created
+
+
+def _lookup(barcodes):
+    """Copies for a set of barcodes, fetched in batches, keyed by barcode"""
+    barcodes = list(barcodes)
+    found = {}
+    for start in range(0, len(barcodes), LOOKUP_BATCH_SIZE):
+        for row in BookCopy.objects.filter(barcode__in=barcodes[start:start + LOOKUP_BATCH_SIZE]).values(
+            'id', 'barcode', 'book_id', 'status', 'stack', 'shelf'
+        ):
+            found[row['barcode']] = row
+    return found
+
+
+def stocktake(shelf_location, barcodes, apply=False, now=None):
+    """
+    Compare the barcodes scanned on one shelf with the copies expected there.
+
+    Returns barcode lists: confirmed (expected and scanned), missing
+    (expected, not scanned), found (marked missing, now scanned), misplaced
+    (belongs to another shelf), on_loan / held / withdrawn (scanned but not
+    expected on a shelf) and unknown (no such copy). With apply=True missing
+    copies are marked missing, found ones available again, available_copies
+    follows, and every scanned copy's last_seen_at is set.
+    """
+    stack, shelf = parse_shelf_location(shelf_location)
+    scanned = {normalize_barcode(barcode) for barcode in barcodes if str(barcode).strip()}
+
+    at_shelf = {
+        row['barcode']: row
+        for row in BookCopy.objects.filter(stack=stack, shelf=shelf).values(
+            'id', 'barcode', 'book_id', 'status', 'stack', 'shelf'
+        )
+    }
+    elsewhere = _lookup(scanned - at_shelf.keys())
+    known = {**elsewhere, **at_shelf}
+
+    def with_status(copies, status):
+        return {barcode for barcode, row in copies.items() if row['status'] == status}
+
+    expected = with_status(at_shelf, 'available')
+    result = {
+        'shelf_location': f'{stack}-{shelf}' if shelf else stack,
+        'scanned': len(scanned),
+        'expected': len(expected),
+        'confirmed': scanned & expected,
+        'missing': expected - scanned,
+        'found': scanned & with_status(known, 'missing'),
+        'misplaced': scanned & (with_status(elsewhere, 'available') | with_status(elsewhere, 'missing')),
+        'on_loan': scanned & with_status(known, 'on_loan'),
+        'held': scanned & with_status(known, 'held'),
+        'withdrawn': scanned & with_status(known, 'withdrawn'),
+        'unknown': scanned - known.keys(),
+        'applied': apply,
+    }
+
+    if apply:
+        now = now or timezone.now()
+        with transaction.atomic():
+            missing_ids = [at_shelf[barcode]['id'] for barcode in result['missing']]
+            found_ids = [known[barcode]['id'] for barcode in result['found']]
+            seen_ids = [known[barcode]['id'] for barcode in scanned & known.keys()]
+            # Lock the affected books so concurrent checkouts see the new counts
+            book_ids = {known[barcode]['book_id'] for barcode in result['missing'] | result['found']}
+            list(Book.objects.select_for_update().filter(id__in=book_ids).values_list('id'))
+
+            deltas = Counter()
+            for barcode in result['missing']:
+                deltas[at_shelf[barcode]['book_id']] -= 1
+            for barcode in result['found']:
+                deltas[known[barcode]['book_id']] += 1
+            for start in range(0, max(len(missing_ids), len(found_ids), len(seen_ids)), LOOKUP_BATCH_SIZE):
+                batch = slice(start, start + LOOKUP_BATCH_SIZE)
+                BookCopy.objects.filter(id__in=missing_ids[batch], status='available').update(status='missing')
+                BookCopy.objects.filter(id__in=found_ids[batch], status='missing').update(status='available')
+                BookCopy.objects.filter(id__in=seen_ids[batch]).update(last_seen_at=now)
+            _adjust_available(deltas)
+
+    for key in ('confirmed', 'missing', 'found', 'misplaced', 'on_loan', 'held', 'withdrawn', 'unknown'):
+        result[key] = sorted(result[key])
+    return result
+
+
+def unavailable_counts(book_ids=None):
+    """
+    Copies per book that cannot be lent: open loans, copies set aside for
+    ready holds and copies marked missing or withdrawn. One grouped query
+    per source, optionally limited to book_ids.
+    """
+    from borrowing.models import BorrowRecord, Hold
+
+    sources = [
+        BorrowRecord.objects.filter(return_date__isnull=True),
+        Hold.objects.filter(status='ready'),
+        BookCopy.objects.filter(status__in=OUT_OF_SERVICE),
+    ]
+    counts = Counter()
+    for queryset in sources:
+        if book_ids is not None:
+            queryset = queryset.filter(book_id__in=book_ids)
+        for book_id, count in queryset.order_by().values('book_id').annotate(
+            count=Count('id')
+        ).values_list('book_id', 'count'):
+            counts[book_id] += count
+    return counts
+
+
+def expected_available(total_copies, unavailable):
+    return min(total_copies, max(0, total_copies - unavailable))
+
+
+def reconcile_availability(apply=False, batch_size=1000, progress=None):
+    """
+    Find books whose available_copies differs from total_copies less the
+    copies that cannot be lent. Returns one dict per drifted book with the
+    recorded and expected counts. With apply=True each batch of drifted
+    books is locked, recounted and corrected with a bulk update, so loans
+    made since the scan are taken into account.
+    """
+    unavailable = unavailable_counts()
+    drifted = []
+    last_id = 0
+    while True:
+        rows = list(
+            Book.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'total_copies', 'available_copies')[:batch_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        for book_id, total, available in rows:
+            expected = expected_available(total, unavailable[book_id])
+            if expected != available:
+                drifted.append({
+                    'book_id': book_id, 'total_copies': total,
+                    'recorded': available, 'expected': expected,
+                })
+        if progress:
+            progress(last_id, len(drifted))
+
+    if apply:
+        for start in range(0, len(drifted), batch_size):
+            batch = drifted[start:start + batch_size]
+            with transaction.atomic():
+                books = list(Book.objects.select_for_update().filter(
+                    id__in=[row['book_id'] for row in batch]
+                ).only('id', 'total_copies', 'available_copies'))
+                recount = unavailable_counts([book.id for book in books])
+                changed = []
+                for book in books:
+                    expected = expected_available(book.total_copies, recount[book.id])
+                    if book.available_copies != expected:
+                        book.available_copies = expected
+                        changed.append(book)
+                Book.objects.bulk_update(changed, ['available_copies'])
+            expected = {book.id: book.available_copies for book in books}
+            for row in batch:
+                row['expected'] = expected.get(row['book_id'], row['expected'])
+    return drifted
@@ -0,0 +1,20 @@
+"""
+Management command to label every counted copy with a generated barcode
+"""
+from django.core.management.base import BaseCommand
+
+from books.inventory import BARCODE_PREFIX, backfill_copies
+
+
+class Command(BaseCommand):
+    help = 'Create barcoded copies for books whose total_copies are not all labelled yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Books handled per transaction')
+
+    def handle(self, *args, **options):
+        progress = lambda created: self.stdout.write(f'  {created} copies created')
+        created = backfill_copies(options['batch_size'], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} copies with {BARCODE_PREFIX}<book id><copy number> barcodes'
+        ))
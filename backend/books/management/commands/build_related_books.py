@@ -0,0 +1,35 @@
+"""
+Management command to rebuild or refresh "borrowed together" recommendations
+"""
+from django.core.management.base import BaseCommand
+
+from books.recommendations import (
+    MIN_CO_BORROWERS, RELATED_LIMIT, build_related, refresh_related, sparse
+)
+
+
+class Command(BaseCommand):
+    help = 'Score related books from co-borrowing history and store the top neighbours of each book'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--refresh', action='store_true',
+            help='Only rescore books touched by loans since the last run (from the circulation outbox)'
+        )
+        parser.add_argument('--limit', type=int, default=RELATED_LIMIT, help='Neighbours kept per book')
+        parser.add_argument(
+            '--min-co-borrowers', type=int, default=MIN_CO_BORROWERS,
+            help='Students who must have borrowed both books'
+        )
+
+    def handle(self, *args, **options):
+        if sparse is None:
+            self.stdout.write(self.style.WARNING('NumPy/SciPy are not installed: scoring with Python sets'))
+        progress = lambda books: self.stdout.write(f'  {books} books scored')
+        limit, min_co_borrowers = options['limit'], options['min_co_borrowers']
+        if options['refresh']:
+            books, rebuilt = refresh_related(limit, min_co_borrowers, progress)
+            action = 'Rebuilt (too many touched books for a refresh)' if rebuilt else 'Refreshed'
+        else:
+            books, action = build_related(limit, min_co_borrowers, progress), 'Rebuilt'
+        self.stdout.write(self.style.SUCCESS(f'{action} related books for {books} books'))
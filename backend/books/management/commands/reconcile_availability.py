@@ -0,0 +1,37 @@
+"""
+Management command to check available_copies against loans, holds and copies
+"""
+from django.core.management.base import BaseCommand
+
+from books.inventory import reconcile_availability
+from books.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Report (and with --apply repair) books whose available_copies has drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apply', action='store_true', help='Correct the drifted counters')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Books read and repaired per batch')
+        parser.add_argument('--show', type=int, default=20, help='Drifted books listed, largest drift first')
+
+    def handle(self, *args, **options):
+        drifted = reconcile_availability(options['apply'], options['batch_size'])
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All available_copies counters match'))
+            return
+
+        drifted.sort(key=lambda row: (-abs(row['recorded'] - row['expected']), row['book_id']))
+        shown = drifted[:options['show']]
+        titles = dict(Book.objects.filter(id__in=[row['book_id'] for row in shown]).values_list('id', 'title'))
+        for row in shown:
+            self.stdout.write(
+                f"  {row['book_id']:>8} {titles.get(row['book_id'], '')[:40]:<40} "
+                f"recorded {row['recorded']:>3}, expected {row['expected']:>3} of {row['total_copies']}"
+            )
+        over = sum(row['recorded'] > row['expected'] for row in drifted)
+        summary = f'{len(drifted)} drifted books ({over} over-reporting, {len(drifted) - over} under-reporting)'
+        if options['apply']:
+            self.stdout.write(self.style.SUCCESS(f'Repaired {summary}'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{summary}; rerun with --apply to repair'))
@@ -0,0 +1,58 @@
+"""
+Management command to run a shelf stocktake from a scanner export
+"""
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from books.inventory import stocktake
+
+
+class Command(BaseCommand):
+    help = 'Diff scanned barcodes against the copies expected on each shelf'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scans', help='CSV of shelf_location,barcode rows, or one barcode per line with --shelf'
+        )
+        parser.add_argument('--shelf', help='Shelf location (e.g. A1-B2) for a file of bare barcodes')
+        parser.add_argument('--apply', action='store_true', help='Mark missing and found copies')
+        parser.add_argument('--json', action='store_true', help='Print the full result for each shelf as JSON')
+
+    def handle(self, *args, **options):
+        shelves = {}
+        try:
+            with open(options['scans'], newline='') as scans_file:
+                for row in csv.reader(scans_file):
+                    row = [value.strip() for value in row if value.strip()]
+                    if not row or row[-1].lower() == 'barcode':
+                        continue
+                    if options['shelf']:
+                        shelves.setdefault(options['shelf'], []).append(row[-1])
+                    elif len(row) == 2:
+                        shelves.setdefault(row[0], []).append(row[1])
+                    else:
+                        raise CommandError(f'Expected shelf_location,barcode but got {row!r}; use --shelf')
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        for shelf_location, barcodes in shelves.items():
+            result = stocktake(shelf_location, barcodes, apply=options['apply'])
+            if options['json']:
+                self.stdout.write(json.dumps(result, indent=2))
+                continue
+            summary = ', '.join(
+                f'{len(result[key])} {key.replace("_", " ")}'
+                for key in ('confirmed', 'missing', 'found', 'misplaced', 'on_loan', 'held', 'withdrawn', 'unknown')
+                if result[key]
+            )
+            style = self.style.WARNING if result['missing'] or result['unknown'] else self.style.SUCCESS
+            self.stdout.write(style(
+                f"{result['shelf_location']}: {result['scanned']} scanned, {result['expected']} expected"
+                f"{' - ' + summary if summary else ''}"
+            ))
+            for barcode in result['missing']:
+                self.stdout.write(f'  missing {barcode}')
+        if options['apply']:
+            self.stdout.write(self.style.SUCCESS(f'Applied stocktake for {len(shelves)} shelves'))
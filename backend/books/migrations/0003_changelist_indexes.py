@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:38
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(django.db.models.functions.text.Lower('title'), name='book_title_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='opacsearchlog',
+            index=models.Index(fields=['timestamp', 'id'], name='search_log_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='opacsearchlog',
+            index=models.Index(django.db.models.functions.text.Lower('search_query'), name='search_log_query_lower_idx'),
+        ),
+    ]
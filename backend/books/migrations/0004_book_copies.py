@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_changelist_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookCopy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('barcode', models.CharField(max_length=32, unique=True)),
+                ('status', models.CharField(choices=[('available', 'Available'), ('on_loan', 'On Loan'), ('held', 'On Hold Shelf'), ('missing', 'Missing'), ('withdrawn', 'Withdrawn')], default='available', max_length=20)),
+                ('stack', models.CharField(blank=True, help_text='e.g., A1', max_length=20)),
+                ('shelf', models.CharField(blank=True, help_text='e.g., B2', max_length=20)),
+                ('last_seen_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='copies', to='books.book')),
+            ],
+            options={
+                'db_table': 'book_copies',
+                'ordering': ['barcode'],
+                'indexes': [models.Index(fields=['stack', 'shelf', 'status'], name='copy_location_idx')],
+            },
+        ),
+    ]
@@ -1,4 +1,7 @@
+import re
+
 from django.db import models
+from django.db.models.functions import Lower
 from django.core.validators import MinValueValidator
 
 
@@ -51,6 +54,10 @@ class Book(models.Model):
     class Meta:
         db_table = 'books'
         ordering = ['title']
+        indexes = [
+            # Case-insensitive title prefix search (admin search and pickers)
+            models.Index(Lower('title'), name='book_title_lower_idx'),
+        ]
 
 
 class OPACSearchLog(models.Model):
@@ -75,3 +82,86 @@ class OPACSearchLog(models.Model):
     class Meta:
         db_table = 'opac_search_logs'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='search_log_timestamp_idx'),
+            models.Index(Lower('search_query'), name='search_log_query_lower_idx'),
+        ]
+
+
+SHELF_LOCATION = re.compile(r'^\s*([A-Za-z]+\d+)\s*-\s*([A-Za-z]+\d+)\s*$')
+
+
+def parse_shelf_location(value):
+    """
+    Split a shelf location like "A1-B2" into its stack ("A1") and shelf
+    ("B2"). Other formats are kept whole as the stack.
+    """
+    match = SHELF_LOCATION.match(value or '')
+    if match:
+        return match.group(1).upper(), match.group(2).upper()
+    return (value or '').strip().upper()[:20], ''
+
+
+class BookCopy(models.Model):
+    """A physical copy of a book, identified by its barcode label"""
+    
+    STATUS_CHOICES = [
+        ('available', 'Available'),
+        ('on_loan', 'On Loan'),
+        ('held', 'On Hold Shelf'),
+        ('missing', 'Missing'),
+        ('withdrawn', 'Withdrawn'),
+    ]
+    
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='copies')
+    barcode = models.CharField(max_length=32, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='available')
+    stack = models.CharField(max_length=20, blank=True, help_text="e.g., A1")
+    shelf = models.CharField(max_length=20, blank=True, help_text="e.g., B2")
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    @property
+    def shelf_location(self):
+        return f"{self.stack}-{self.shelf}" if self.shelf else self.stack
+    
+    def save(self, *args, **kwargs):
+        # New copies are shelved where the catalog record says
+        if not self.stack and not self.shelf:
+            self.stack, self.shelf = parse_shelf_location(self.book.shelf_location)
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"{self.barcode} ({self.book.title})"
+    
+    class Meta:
+        db_table = 'book_copies'
+        ordering = ['barcode']
+        indexes = [
+            # Stocktake reads one shelf at a time
+            models.Index(fields=['stack', 'shelf', 'status'], name='copy_location_idx'),
+        ]
+
+
+class RelatedBook(models.Model):
+    """
+    A book often borrowed by the same students as another. Rebuilt by
+    books.recommendations; each book keeps its top neighbours by rank.
+    """
+    
+    # The (book, rank) unique index serves lookups, so no separate FK index
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='related_books', db_index=False)
+    related = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField(help_text="Cosine similarity of the two books' borrower sets")
+    co_borrowers = models.PositiveIntegerField(help_text="Students who borrowed both books")
+    
+    def __str__(self):
+        return f"{self.book_id} #{self.rank}: {self.related_id} ({self.score:.3f})"
+    
+    class Meta:
+        db_table = 'related_books'
+        ordering = ['book', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='unique_related_rank'),
+        ]
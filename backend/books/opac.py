@@ -0,0 +1,67 @@
+"""
+OPAC search helpers shared by the sync DRF views and the async read views.
+"""
+from django.db.models import Q
+
+from .models import Book, OPACSearchLog
+
+
+SEARCH_FIELDS = ('query', 'title', 'author', 'isbn', 'category')
+
+
+def search_params(query_params):
+    params = {field: query_params.get(field, '') for field in SEARCH_FIELDS}
+    params['available_only'] = query_params.get('available_only', 'false').lower() == 'true'
+    return params
+
+
+def search_queryset(params):
+    """Catalog queryset for parsed OPAC search parameters"""
+    queryset = Book.objects.all()
+    
+    # General search across multiple fields
+    if params['query']:
+        queryset = queryset.filter(
+            Q(title__icontains=params['query']) |
+            Q(author__icontains=params['query']) |
+            Q(isbn__icontains=params['query']) |
+            Q(description__icontains=params['query'])
+        )
+    
+    # Specific field searches
+    if params['title']:
+        queryset = queryset.filter(title__icontains=params['title'])
+    
+    if params['author']:
+        queryset = queryset.filter(author__icontains=params['author'])
+    
+    if params['isbn']:
+        queryset = queryset.filter(isbn__icontains=params['isbn'])
+    
+    if params['category']:
+        queryset = queryset.filter(category__iexact=params['category'])
+    
+    # Filter by availability
+    if params['available_only']:
+        queryset = queryset.filter(available_copies__gt=0)
+    
+    return queryset
+
+
+def search_log(params, user_id, results_count):
+    """Unsaved OPACSearchLog describing a search"""
+    search_query = params['query'] or (
+        f"title:{params['title']} author:{params['author']} "
+        f"isbn:{params['isbn']} category:{params['category']}"
+    )
+    
+    # A single specific field gives the search its type
+    used = [field for field in SEARCH_FIELDS if params[field]]
+    search_type = used[0] if len(used) == 1 and used[0] != 'query' else 'general'
+    
+    return OPACSearchLog(
+        user_id=user_id,
+        search_query=search_query.strip(),
+        search_type=search_type,
+        results_count=results_count
+    )
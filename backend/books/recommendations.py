@@ -0,0 +1,248 @@
+"""
+"Borrowed together" recommendations.
+
+Two books are related when the same students borrow them. The score is the
+cosine similarity of their borrower sets, |A & B| / sqrt(|A| * |B|), over
+current and archived loans. build_related() scores the whole catalog from a
+sparse student x book matrix and keeps each book's top neighbours in
+related_books. refresh_related() tails the circulation outbox and rescores
+only the books new loans touched: the borrowed book and the other books its
+borrower has read. Other books' scores against them shift slightly as
+borrower counts grow, which the next full build picks up.
+
+NumPy and SciPy are optional. Without them the same scores are computed
+from Python sets, which suits small catalogs but is much slower.
+"""
+import heapq
+import math
+from array import array
+from collections import Counter, defaultdict
+
+from django.db import connection, transaction
+
+from .models import RelatedBook
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+
+CONSUMER_NAME = 'related-books'
+RELATED_LIMIT = 10  # Neighbours kept per book
+MIN_CO_BORROWERS = 2  # Shared borrowers needed before two books count as related
+BLOCK_SIZE = 1000  # Books scored per sparse product and written per transaction
+LOAD_CHUNK_SIZE = 10000
+ID_BATCH_SIZE = 500
+INSERT_BATCH_SIZE = 1000  # Rows per multi-row INSERT, within the backend's parameter limit
+REFRESH_BOOK_LIMIT = 5000  # Past this many touched books a full build is cheaper
+
+
+def _loan_models():
+    from borrowing.models import ArchivedBorrowRecord, BorrowRecord
+
+    return BorrowRecord, ArchivedBorrowRecord
+
+
+def _borrow_pairs(field=None, ids=None):
+    """Stream (user_id, book_id) of current and archived loans, optionally where field is in ids"""
+    ids = list(ids) if ids is not None else None
+    for model in _loan_models():
+        if ids is None:
+            batches = [model.objects.all()]
+        else:
+            batches = (
+                model.objects.filter(**{f'{field}__in': ids[start:start + ID_BATCH_SIZE]})
+                for start in range(0, len(ids), ID_BATCH_SIZE)
+            )
+        for queryset in batches:
+            yield from queryset.order_by().values_list('user_id', 'book_id').iterator(chunk_size=LOAD_CHUNK_SIZE)
+
+
+def _borrower_counts(book_ids):
+    """Distinct borrowers per book across current and archived loans"""
+    tables = [model._meta.db_table for model in _loan_models()]
+    book_ids = list(book_ids)
+    counts = {}
+    for start in range(0, len(book_ids), ID_BATCH_SIZE):
+        batch = book_ids[start:start + ID_BATCH_SIZE]
+        placeholders = ', '.join(['%s'] * len(batch))
+        union = ' UNION '.join(
+            f'SELECT user_id, book_id FROM {table} WHERE book_id IN ({placeholders})' for table in tables
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT book_id, COUNT(*) FROM ({union}) pairs GROUP BY book_id', batch * len(tables)
+            )
+            counts.update(cursor.fetchall())
+    return counts
+
+
+def _top(scored, limit):
+    """The limit best (related_id, co_borrowers, score) by score, ties to the lower id"""
+    return heapq.nsmallest(limit, scored, key=lambda item: (-item[2], item[0]))
+
+
+def _neighbours_python(pairs, targets, borrowers, limit, min_co_borrowers):
+    readers, shelves = defaultdict(set), defaultdict(set)
+    for user_id, book_id in pairs:
+        readers[book_id].add(user_id)
+        shelves[user_id].add(book_id)
+    if borrowers is None:
+        borrowers = {book_id: len(users) for book_id, users in readers.items()}
+
+    for book_id in (sorted(readers) if targets is None else targets):
+        together = Counter()
+        for user_id in readers.get(book_id, ()):
+            together.update(shelves[user_id])
+        together.pop(book_id, None)
+        yield book_id, _top([
+            (related_id, count, count / math.sqrt(borrowers[book_id] * borrowers[related_id]))
+            for related_id, count in together.items() if count >= min_co_borrowers
+        ], limit)
+
+
+def _neighbours_sparse(pairs, targets, borrowers, limit, min_co_borrowers):
+    user_ids, book_ids = array('q'), array('q')
+    for user_id, book_id in pairs:
+        user_ids.append(user_id)
+        book_ids.append(book_id)
+    if not book_ids:
+        yield from ((book_id, []) for book_id in targets or ())
+        return
+    users = np.frombuffer(user_ids, dtype=np.int64)
+    books = np.frombuffer(book_ids, dtype=np.int64)
+    shape = (int(users.max()) + 1, int(books.max()) + 1)
+
+    # Student x book matrix; repeat loans of a book count once
+    matrix = sparse.csr_matrix((np.ones(len(users), dtype=np.float32), (users, books)), shape=shape)
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    by_book = matrix.T.tocsr()
+
+    if borrowers is None:
+        counts = np.diff(by_book.indptr).astype(np.float64)
+        targets = np.flatnonzero(counts)
+    else:
+        counts = np.zeros(shape[1], dtype=np.float64)
+        for book_id, count in borrowers.items():
+            if book_id < shape[1]:
+                counts[book_id] = count
+        targets = np.asarray(targets, dtype=np.int64)
+
+    for start in range(0, len(targets), BLOCK_SIZE):
+        block = targets[start:start + BLOCK_SIZE]
+        # Co-borrow counts of the block against every book: one sparse product
+        together = (by_book[block] @ matrix).tocsr()
+        for row, book_id in enumerate(block.tolist()):
+            span = slice(together.indptr[row], together.indptr[row + 1])
+            related, shared = together.indices[span], together.data[span].astype(np.int64)
+            keep = (related != book_id) & (shared >= min_co_borrowers)
+            related, shared = related[keep], shared[keep]
+            scores = shared / np.sqrt(counts[book_id] * counts[related])
+            if len(scores) > limit:
+                # Only candidates that can make the top limit go through the exact ordering
+                cutoff = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+                best = scores >= cutoff
+                related, shared, scores = related[best], shared[best], scores[best]
+            yield book_id, _top(zip(related.tolist(), shared.tolist(), scores.tolist()), limit)
+
+
+def _neighbours(pairs, targets=None, borrowers=None, limit=RELATED_LIMIT, min_co_borrowers=MIN_CO_BORROWERS):
+    """
+    Yield (book_id, [(related_id, co_borrowers, score), ...]) for each target
+    book, or for every book in pairs. borrowers gives each book's borrower
+    count when pairs hold only part of the history.
+    """
+    neighbours = _neighbours_python if sparse is None else _neighbours_sparse
+    return neighbours(pairs, targets, borrowers, limit, min_co_borrowers)
+
+
+def _write(block):
+    """Replace the stored neighbours of a block of books"""
+    # Multi-row INSERTs of plain tuples: model instances and per-row SQL
+    # compilation cost several times the database's own time here
+    qn = connection.ops.quote_name
+    columns = ('book_id', 'related_id', 'rank', 'score', 'co_borrowers')
+    rows = [
+        (book_id, related_id, rank, score, shared)
+        for book_id, neighbours in block
+        for rank, (related_id, shared, score) in enumerate(neighbours, start=1)
+    ]
+    batch_size = min(INSERT_BATCH_SIZE, (connection.features.max_query_params or INSERT_BATCH_SIZE) // len(columns))
+    insert = f"INSERT INTO {qn(RelatedBook._meta.db_table)} ({', '.join(map(qn, columns))}) VALUES "
+    placeholder = f"({', '.join(['%s'] * len(columns))})"
+    with transaction.atomic(), connection.cursor() as cursor:
+        RelatedBook.objects.filter(book_id__in=[book_id for book_id, _ in block]).delete()
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(insert + ', '.join([placeholder] * len(batch)), [value for row in batch for value in row])
+
+
+def _save(results, progress=None):
+    """Replace the stored neighbours of each book in results; returns the book ids written"""
+    written, block = set(), []
+    for item in results:
+        block.append(item)
+        if len(block) >= BLOCK_SIZE:
+            _write(block)
+            written.update(book_id for book_id, _ in block)
+            block = []
+            if progress:
+                progress(len(written))
+    if block:
+        _write(block)
+        written.update(book_id for book_id, _ in block)
+    return written
+
+
+def build_related(limit=RELATED_LIMIT, min_co_borrowers=MIN_CO_BORROWERS, progress=None):
+    """Score every borrowed book and replace related_books. Returns the number of books scored."""
+    from borrowing.events import commit, settled_offset
+
+    # Loans recorded after this point are rescored by the next refresh, even if this build saw them
+    offset = settled_offset()
+    written = _save(_neighbours(_borrow_pairs(), limit=limit, min_co_borrowers=min_co_borrowers), progress)
+
+    stale = list(set(RelatedBook.objects.values_list('book_id', flat=True).distinct()) - written)
+    for start in range(0, len(stale), ID_BATCH_SIZE):
+        RelatedBook.objects.filter(book_id__in=stale[start:start + ID_BATCH_SIZE]).delete()
+    commit(CONSUMER_NAME, offset)
+    return len(written)
+
+
+def refresh_related(limit=RELATED_LIMIT, min_co_borrowers=MIN_CO_BORROWERS, progress=None):
+    """
+    Rescore the books touched by loans since the last build or refresh.
+    Falls back to build_related() when more than REFRESH_BOOK_LIMIT books
+    are touched. Returns (books rescored, whether a full build ran).
+    """
+    from borrowing.events import MAX_BATCH_SIZE, commit, events_after, poll
+
+    offset, events = poll(CONSUMER_NAME, MAX_BATCH_SIZE)
+    borrowers, borrowed = set(), set()
+    while events:
+        for event in events:
+            if event.event_type == 'borrowed':
+                borrowers.add(event.user_id)
+                borrowed.add(event.book_id)
+        offset = events[-1].id
+        if len(borrowed) > REFRESH_BOOK_LIMIT:
+            return build_related(limit, min_co_borrowers, progress), True
+        events = events_after(offset, MAX_BATCH_SIZE)
+    if not borrowed:
+        commit(CONSUMER_NAME, offset)
+        return 0, False
+
+    touched = borrowed | {book_id for _, book_id in _borrow_pairs('user_id', borrowers)}
+    if len(touched) > REFRESH_BOOK_LIMIT:
+        return build_related(limit, min_co_borrowers, progress), True
+
+    # Every loan of every student who read a touched book: exact co-borrow counts for the touched books
+    readers = {user_id for user_id, _ in _borrow_pairs('book_id', touched)}
+    pairs = list(_borrow_pairs('user_id', readers))
+    counts = _borrower_counts({book_id for _, book_id in pairs})
+    written = _save(_neighbours(pairs, sorted(touched), counts, limit, min_co_borrowers), progress)
+    commit(CONSUMER_NAME, offset)
+    return len(written), False
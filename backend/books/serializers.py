@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Book, OPACSearchLog
+from .models import Book, BookCopy, OPACSearchLog, RelatedBook
 
 
 class BookSerializer(serializers.ModelSerializer):
@@ -51,3 +51,37 @@ class BookAvailabilitySerializer(serializers.ModelSerializer):
             'description', 'publication_year', 'publisher', 'total_copies',
             'available_copies', 'is_available', 'borrowed_copies'
         )
+
+
+class RelatedBookSerializer(serializers.ModelSerializer):
+    """A book borrowed together with another, with how strongly"""
+    book = BookAvailabilitySerializer(source='related', read_only=True)
+    
+    class Meta:
+        model = RelatedBook
+        fields = ('rank', 'score', 'co_borrowers', 'book')
+
+
+class BookCopySerializer(serializers.ModelSerializer):
+    book_title = serializers.CharField(source='book.title', read_only=True)
+    shelf_location = serializers.ReadOnlyField()
+    
+    class Meta:
+        model = BookCopy
+        fields = (
+            'id', 'barcode', 'book', 'book_title', 'status', 'stack', 'shelf',
+            'shelf_location', 'last_seen_at', 'created_at'
+        )
+        read_only_fields = ('book', 'last_seen_at', 'created_at')
+
+
+class RegisterCopiesSerializer(serializers.Serializer):
+    barcodes = serializers.ListField(
+        child=serializers.CharField(max_length=32), allow_empty=False, max_length=500
+    )
+
+
+class StocktakeSerializer(serializers.Serializer):
+    shelf_location = serializers.CharField(max_length=50, help_text="e.g., A1-B2")
+    barcodes = serializers.ListField(child=serializers.CharField(max_length=32), max_length=20000)
+    apply = serializers.BooleanField(default=False)
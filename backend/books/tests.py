@@ -1,3 +1,213 @@
-from django.test import TestCase
+import math
+import threading
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from borrowing.models import BorrowRecord, CirculationEvent
+from library_system import write_queue
+from library_system.datasets import explicit_dates, generate_dataset
+from users.models import User
+from . import recommendations
+from .inventory import register_copies, stocktake
+from .models import Book, BookCopy, OPACSearchLog, RelatedBook
+
+
+class WriteQueueTests(TestCase):
+    def search_log(self, query):
+        return OPACSearchLog(search_query=query, search_type='general', results_count=0)
+
+    @mock.patch.object(write_queue, 'RETRY_DELAY', 0)
+    def test_failed_batches_are_retried(self):
+        write = write_queue._write
+        failures = iter([OperationalError('database is locked')])
+
+        def flaky_write(items):
+            for exc in failures:
+                raise exc
+            write(items)
+
+        with mock.patch.object(write_queue, '_write', side_effect=flaky_write):
+            write_queue._write_with_retries([(OPACSearchLog, False, self.search_log('first'))])
+        self.assertEqual(list(OPACSearchLog.objects.values_list('search_query', flat=True)), ['first'])
+
+    @mock.patch.object(write_queue, 'RETRY_DELAY', 0)
+    def test_only_rows_failing_on_their_own_are_dropped(self):
+        items = [(OPACSearchLog, False, self.search_log(query)) for query in ('good', 'x' * 600, 'also good')]
+        write = write_queue._write
+
+        def strict_write(items):
+            if any(len(obj.search_query) > 500 for _, _, obj in items):
+                raise OperationalError('value too long')
+            write(items)
+
+        with mock.patch.object(write_queue, '_write', side_effect=strict_write), self.assertLogs(write_queue.logger):
+            write_queue._write_with_retries(items)
+        self.assertEqual(
+            sorted(OPACSearchLog.objects.values_list('search_query', flat=True)), ['also good', 'good']
+        )
+
+
+class DatasetTests(TransactionTestCase):
+    def test_generated_rows_leave_existing_books_alone(self):
+        # A real book whose ISBN shares the generator's prefix
+        real = Book.objects.create(
+            title='Real', author='Author', isbn='9791000000001', category='science',
+            total_copies=1, available_copies=1
+        )
+        counts = generate_dataset(
+            books=20, students=10, librarians=1, borrows=200, search_logs=20, as_of=date(2026, 1, 1)
+        )
+        self.assertEqual(counts['books'], 20)
+        real.refresh_from_db()
+        self.assertEqual(real.available_copies, 1)
+
+    def test_ids_are_read_back_when_bulk_inserts_do_not_return_them(self):
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            counts = generate_dataset(
+                books=20, students=10, librarians=1, borrows=200, search_logs=20, as_of=date(2026, 1, 1)
+            )
+        self.assertEqual(counts['borrow_records'], BorrowRecord.objects.count())
+        self.assertFalse(BorrowRecord.objects.exclude(user__role='student').exists())
+
+    def test_explicit_dates_only_apply_to_the_current_thread(self):
+        old = timezone.now() - timedelta(days=30)
+        other_thread = []
+
+        def create_elsewhere():
+            other_thread.append(OPACSearchLog.objects.create(search_query='now', search_type='general'))
+
+        with explicit_dates(OPACSearchLog, 'timestamp'):
+            kept = OPACSearchLog.objects.create(search_query='old', search_type='general', timestamp=old)
+            thread = threading.Thread(target=create_elsewhere)
+            thread.start()
+            thread.join()
+
+        self.assertEqual(kept.timestamp, old)
+        self.assertGreater(other_thread[0].timestamp, old + timedelta(days=29))
+
+
+class StocktakeTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(
+            title='Test Book', author='Author', isbn='9780000000001', category='science',
+            total_copies=3, available_copies=3, shelf_location='A1-B2'
+        )
+        register_copies(self.book, ['LIB1', 'LIB2', 'LIB3'])
+        librarian = User.objects.create_user(
+            email='librarian@example.com', username='librarian', full_name='Librarian',
+            password='pass12345', role='librarian'
+        )
+        self.students = [
+            User.objects.create_user(
+                email=f'student{i}@example.com', username=f'student{i}', full_name=f'Student {i}',
+                password='pass12345', role='student'
+            )
+            for i in range(2)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(librarian)
+
+    def borrow(self, student, **target):
+        response = self.client.post('/api/borrowing/borrow/', {'user_id': student.id, **target})
+        self.assertEqual(response.status_code, 201, response.data)
+        return BorrowRecord.objects.get(id=response.data['id'])
+
+    def test_lent_copies_are_not_expected_on_the_shelf(self):
+        by_book = self.borrow(self.students[0], book_id=self.book.id)
+        self.borrow(self.students[1], barcode='LIB3')
+        self.assertIsNotNone(by_book.copy)
+        on_shelf = ({'LIB1', 'LIB2'} - {by_book.copy.barcode}).pop()
+
+        result = stocktake('A1-B2', [on_shelf], apply=True)
+        self.assertEqual((result['confirmed'], result['missing']), ([on_shelf], []))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+
+        by_book.return_book()
+        self.assertEqual(BookCopy.objects.get(id=by_book.copy_id).status, 'available')
+        result = stocktake('A1-B2', [on_shelf, by_book.copy.barcode], apply=True)
+        self.assertEqual(result['missing'], [])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 2)
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.books = [
+            Book.objects.create(
+                title=f'Book {i}', author='Author', isbn=f'978000000000{i}', category='science',
+                total_copies=10, available_copies=10
+            )
+            for i in range(6)
+        ]
+        self.students = [
+            User.objects.create_user(
+                email=f'student{i}@example.com', username=f'student{i}', full_name=f'Student {i}',
+                password='pass12345', role='student'
+            )
+            for i in range(7)
+        ]
+        a, b, c, d, e, f = range(6)
+        # Borrowers: a {0, 1, 2, 4}, b {0, 1, 3, 4}, c {0, 2, 3}, d {3}, e and f {5, 6}
+        for student, books in enumerate([(a, b, c), (a, b), (a, c), (b, c, d), (a, b), (e, f), (e, f)]):
+            for book in books:
+                self.loan(student, book)
+
+    def loan(self, student, book):
+        BorrowRecord.objects.create(
+            user=self.students[student], book=self.books[book], due_date=timezone.now() + timedelta(days=14)
+        )
+
+    def related(self, book):
+        return [
+            (self.books.index(row.related), row.rank, round(row.score, 6), row.co_borrowers)
+            for row in RelatedBook.objects.filter(book=self.books[book]).select_related('related')
+        ]
+
+    def settle_events(self):
+        settled = timezone.now() - timedelta(seconds=60)
+        CirculationEvent.objects.update(created_at=settled)
+
+    def test_build_scores_co_borrowed_books(self):
+        self.assertEqual(recommendations.build_related(), 6)
+
+        a_c = round(2 / math.sqrt(4 * 3), 6)
+        self.assertEqual(self.related(0), [(1, 1, 0.75, 3), (2, 2, a_c, 2)])
+        self.assertEqual(self.related(1), [(0, 1, 0.75, 3), (2, 2, a_c, 2)])
+        # Equal scores rank the lower id first
+        self.assertEqual(self.related(2), [(0, 1, a_c, 2), (1, 2, a_c, 2)])
+        # One shared borrower with c is below MIN_CO_BORROWERS
+        self.assertEqual(self.related(3), [])
+        self.assertEqual(self.related(4), [(5, 1, 1.0, 2)])
+
+    def test_refresh_rescores_only_books_touched_since_the_build(self):
+        self.settle_events()
+        recommendations.build_related()
+        # Left alone by the refresh: none of its borrowers borrowed again
+        RelatedBook.objects.filter(book=self.books[4]).update(score=0.5)
+
+        self.loan(2, 1)
+        # b plus the other books student 2 has read
+        self.assertEqual(recommendations.refresh_related(), (3, False))
+
+        self.assertEqual(self.related(1), [
+            (0, 1, round(4 / math.sqrt(4 * 5), 6), 4), (2, 2, round(3 / math.sqrt(5 * 3), 6), 3)
+        ])
+        self.assertEqual(self.related(2), [
+            (1, 1, round(3 / math.sqrt(5 * 3), 6), 3), (0, 2, round(2 / math.sqrt(4 * 3), 6), 2)
+        ])
+        self.assertEqual(self.related(4), [(5, 1, 0.5, 2)])
+        self.assertEqual(recommendations.refresh_related(), (0, False))
+
+    def test_write_replaces_a_books_neighbours(self):
+        a, b, c, d = (book.id for book in self.books[:4])
+        recommendations._write([(a, [(b, 3, 0.9), (c, 2, 0.8)]), (d, [(b, 2, 0.7)])])
+        recommendations._write([(a, [(c, 4, 0.95)])])
+
+        self.assertEqual(self.related(0), [(2, 1, 0.95, 4)])
+        self.assertEqual(self.related(3), [(1, 1, 0.7, 2)])
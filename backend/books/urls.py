@@ -1,14 +1,27 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     # Book management
     path('', views.BookListCreateView.as_view(), name='book_list_create'),
     path('<int:pk>/', views.BookDetailView.as_view(), name='book_detail'),
     
+    # Copies and stocktake (Admin/Librarian only)
+    path('<int:pk>/copies/', views.book_copies, name='book_copies'),
+    path('copies/<str:barcode>/', views.copy_lookup, name='copy_lookup'),
+    path('stocktake/', views.shelf_stocktake, name='shelf_stocktake'),
+    
     # OPAC (Public access)
     path('search/', views.opac_search, name='opac_search'),
     path('categories/', views.book_categories, name='book_categories'),
+    path('<int:pk>/related/', views.related_books, name='related_books'),
+    
+    # Async OPAC read path (for ASGI deployments)
+    path('opac/search/', async_views.opac_search, name='async_opac_search'),
+    path('opac/categories/', async_views.book_categories, name='async_book_categories'),
+    path('opac/suggestions/', async_views.suggestions, name='async_book_suggestions'),
+    path('opac/availability/', async_views.availability, name='async_book_availability'),
+    path('opac/<int:pk>/', async_views.book_detail, name='async_book_detail'),
     
     # Analytics (Admin/Librarian only)
     path('search-logs/', views.search_logs, name='search_logs'),
@@ -1,14 +1,20 @@
 from rest_framework import generics, status, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
 from django.db.models import Q
 from django.utils import timezone
-from .models import Book, OPACSearchLog
+from .inventory import InventoryError, normalize_barcode, register_copies, stocktake
+from .models import Book, BookCopy, OPACSearchLog, RelatedBook
+from .opac import search_log, search_params, search_queryset
 from .serializers import (
     BookSerializer, BookSearchSerializer, OPACSearchLogSerializer,
-    BookAvailabilitySerializer
+    BookAvailabilitySerializer, BookCopySerializer, RegisterCopiesSerializer,
+    StocktakeSerializer, RelatedBookSerializer
 )
 from users.views import IsAdminUser, IsAdminOrLibrarian
+from library_system import write_queue
+from library_system.db_router import replica_reads
+from library_system.throttling import AnonOPACThrottle, UserOPACThrottle
 
 
 class BookListCreateView(generics.ListCreateAPIView):
@@ -47,66 +53,16 @@ class BookDetailView(generics.RetrieveUpdateDestroyAPIView):
 
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([AnonOPACThrottle, UserOPACThrottle])
+@replica_reads
 def opac_search(request):
     """Public OPAC search endpoint"""
-    search_params = {
-        'query': request.GET.get('query', ''),
-        'title': request.GET.get('title', ''),
-        'author': request.GET.get('author', ''),
-        'isbn': request.GET.get('isbn', ''),
-        'category': request.GET.get('category', ''),
-        'available_only': request.GET.get('available_only', 'false').lower() == 'true'
-    }
-    
-    # Build query
-    queryset = Book.objects.all()
-    
-    # General search across multiple fields
-    if search_params['query']:
-        queryset = queryset.filter(
-            Q(title__icontains=search_params['query']) |
-            Q(author__icontains=search_params['query']) |
-            Q(isbn__icontains=search_params['query']) |
-            Q(description__icontains=search_params['query'])
-        )
-    
-    # Specific field searches
-    if search_params['title']:
-        queryset = queryset.filter(title__icontains=search_params['title'])
-    
-    if search_params['author']:
-        queryset = queryset.filter(author__icontains=search_params['author'])
-    
-    if search_params['isbn']:
-        queryset = queryset.filter(isbn__icontains=search_params['isbn'])
-    
-    if search_params['category']:
-        queryset = queryset.filter(category__iexact=search_params['category'])
-    
-    # Filter by availability
-    if search_params['available_only']:
-        queryset = queryset.filter(available_copies__gt=0)
+    params = search_params(request.GET)
+    queryset = search_queryset(params)
     
     # Log the search
-    search_query = search_params['query'] or f"title:{search_params['title']} author:{search_params['author']} isbn:{search_params['isbn']} category:{search_params['category']}"
-    search_type = 'general'
-    
-    if search_params['title'] and not any([search_params['query'], search_params['author'], search_params['isbn'], search_params['category']]):
-        search_type = 'title'
-    elif search_params['author'] and not any([search_params['query'], search_params['title'], search_params['isbn'], search_params['category']]):
-        search_type = 'author'
-    elif search_params['isbn'] and not any([search_params['query'], search_params['title'], search_params['author'], search_params['category']]):
-        search_type = 'isbn'
-    elif search_params['category'] and not any([search_params['query'], search_params['title'], search_params['author'], search_params['isbn']]):
-        search_type = 'category'
-    
-    # Create search log
-    OPACSearchLog.objects.create(
-        user=request.user if request.user.is_authenticated else None,
-        search_query=search_query.strip(),
-        search_type=search_type,
-        results_count=queryset.count()
-    )
+    user_id = request.user.pk if request.user.is_authenticated else None
+    write_queue.enqueue([search_log(params, user_id, queryset.count())])
     
     # Paginate results
     from rest_framework.pagination import PageNumberPagination
@@ -120,6 +76,18 @@ def opac_search(request):
 
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([AnonOPACThrottle, UserOPACThrottle])
+@replica_reads
+def related_books(request, pk):
+    """Books often borrowed by the same students as this one (Public)"""
+    # One seek on the (book, rank) index, joined to the recommended books
+    related = RelatedBook.objects.filter(book_id=pk).select_related('related').order_by('rank')
+    return Response(RelatedBookSerializer(related, many=True).data)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+@throttle_classes([AnonOPACThrottle, UserOPACThrottle])
 def book_categories(request):
     """Get list of available book categories"""
     categories = [choice[0] for choice in Book.CATEGORY_CHOICES]
@@ -128,6 +96,7 @@ def book_categories(request):
 
 @api_view(['GET'])
 @permission_classes([IsAdminOrLibrarian])
+@replica_reads
 def search_logs(request):
     """Get OPAC search logs (Admin/Librarian only)"""
     logs = OPACSearchLog.objects.all()[:100]  # Last 100 searches
@@ -137,6 +106,7 @@ def search_logs(request):
 
 @api_view(['GET'])
 @permission_classes([IsAdminOrLibrarian])
+@replica_reads
 def book_statistics(request):
     """Get book statistics (Admin/Librarian only)"""
     total_books = Book.objects.count()
@@ -144,13 +114,16 @@ def book_statistics(request):
     available_copies = sum(book.available_copies for book in Book.objects.all())
     borrowed_copies = total_copies - available_copies
     
-    # Most popular books (by borrow count)
-    from borrowing.models import BorrowRecord
-    from django.db.models import Count
+    # Most popular books (by borrow count, including archived loans)
+    from borrowing.archive import combined_counts
     
-    popular_books = Book.objects.annotate(
-        borrow_count=Count('borrow_records')
-    ).order_by('-borrow_count')[:10]
+    top_counts = combined_counts(('book_id',), limit=10)
+    books_by_id = Book.objects.in_bulk([row['book_id'] for row in top_counts])
+    popular_books = [books_by_id[row['book_id']] for row in top_counts]
+    if len(popular_books) < 10:
+        popular_books += list(
+            Book.objects.exclude(id__in=books_by_id)[:10 - len(popular_books)]
+        )
     
     return Response({
         'total_books': total_books,
@@ -159,3 +132,50 @@ def book_statistics(request):
         'borrowed_copies': borrowed_copies,
         'popular_books': BookSerializer(popular_books, many=True).data
     })
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdminOrLibrarian])
+def book_copies(request, pk):
+    """List a book's copies, or label copies with barcodes (Admin/Librarian only)"""
+    try:
+        book = Book.objects.get(pk=pk)
+    except Book.DoesNotExist:
+        return Response({'error': 'Book not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if request.method == 'GET':
+        copies = BookCopy.objects.filter(book=book).select_related('book')
+        return Response(BookCopySerializer(copies, many=True).data)
+    
+    serializer = RegisterCopiesSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        copies = register_copies(book, serializer.validated_data['barcodes'])
+    except InventoryError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(BookCopySerializer(copies, many=True).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminOrLibrarian])
+def copy_lookup(request, barcode):
+    """Look up a scanned copy by barcode (Admin/Librarian only)"""
+    try:
+        copy = BookCopy.objects.select_related('book').get(barcode=normalize_barcode(barcode))
+    except BookCopy.DoesNotExist:
+        return Response({'error': 'Copy not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(BookCopySerializer(copy).data)
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminOrLibrarian])
+def shelf_stocktake(request):
+    """
+    Diff the barcodes scanned on a shelf against the copies expected there;
+    with apply=true, record missing and found copies (Admin/Librarian only)
+    """
+    serializer = StocktakeSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    return Response(stocktake(**serializer.validated_data))
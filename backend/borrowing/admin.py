@@ -1,12 +1,15 @@
 from django.contrib import admin
-from .models import BorrowRecord
+from library_system.changelists import LoanSearchMixin, ScalableChangeListMixin
+from .models import BorrowRecord, ArchivedBorrowRecord, CirculationEvent, EventConsumer, Hold, NoticeLog, ReportJob
 
 
 @admin.register(BorrowRecord)
-class BorrowRecordAdmin(admin.ModelAdmin):
+class BorrowRecordAdmin(LoanSearchMixin, ScalableChangeListMixin, admin.ModelAdmin):
     list_display = ('user', 'book', 'borrow_date', 'due_date', 'return_date', 'status', 'fine_amount', 'is_overdue')
-    list_filter = ('status', 'borrow_date', 'due_date', 'return_date')
-    search_fields = ('user__full_name', 'user__email', 'book__title', 'book__author')
+    list_filter = ('status', 'due_date', 'return_date')
+    list_select_related = ('user', 'book')
+    date_hierarchy = 'borrow_date'
+    autocomplete_fields = ('user', 'book', 'librarian')
     ordering = ('-borrow_date',)
     readonly_fields = ('borrow_date', 'is_overdue', 'days_overdue')
     
@@ -24,3 +27,57 @@ class BorrowRecordAdmin(admin.ModelAdmin):
             'fields': ('notes',)
         }),
     )
+
+
+@admin.register(ArchivedBorrowRecord)
+class ArchivedBorrowRecordAdmin(LoanSearchMixin, ScalableChangeListMixin, admin.ModelAdmin):
+    list_display = ('user', 'book', 'borrow_date', 'due_date', 'return_date', 'fine_amount', 'archived_at')
+    list_filter = ('return_date',)
+    list_select_related = ('user', 'book')
+    date_hierarchy = 'borrow_date'
+    ordering = ('-borrow_date',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(CirculationEvent)
+class CirculationEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event_type', 'borrow_record_id', 'user_id', 'book_id', 'fine_amount', 'created_at')
+    list_filter = ('event_type',)
+    ordering = ('-id',)
+
+
+@admin.register(EventConsumer)
+class EventConsumerAdmin(admin.ModelAdmin):
+    list_display = ('name', 'offset', 'updated_at')
+
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    list_display = ('user', 'book', 'position', 'status', 'created_at', 'ready_at', 'expires_at')
+    list_filter = ('status',)
+    list_select_related = ('user', 'book')
+    search_fields = ('user__full_name', 'user__email', 'book__title')
+    autocomplete_fields = ('user', 'book')
+    ordering = ('book', 'position')
+
+
+@admin.register(NoticeLog)
+class NoticeLogAdmin(admin.ModelAdmin):
+    list_display = ('user', 'borrow_record_id', 'notice_type', 'notice_date', 'sent_at')
+    list_filter = ('notice_type', 'notice_date')
+    list_select_related = ('user',)
+    ordering = ('-sent_at',)
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'progress', 'user', 'worker', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    list_select_related = ('user',)
+    ordering = ('-id',)
+    readonly_fields = ('result_name', 'result_size', 'heartbeat_at')
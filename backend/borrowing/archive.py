@@ -0,0 +1,173 @@
+"""
+Hot/cold storage for borrow records.
+
+Returned loans older than LIBRARY_SETTINGS['ARCHIVE_AFTER_DAYS'] are moved
+from borrow_records into borrow_records_archive so that active-loan queries
+only scan the hot table. History and statistics read both tables.
+"""
+import heapq
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import BorrowRecord, ArchivedBorrowRecord
+
+
+COPIED_FIELDS = (
+    'id', 'user_id', 'book_id', 'borrow_date', 'due_date', 'return_date',
+    'status', 'fine_amount', 'librarian_id', 'copy_id', 'notes'
+)
+
+
+class ArchiveError(Exception):
+    """Raised when an archive or restore batch would lose or duplicate rows"""
+
+
+def _library_setting(name, default):
+    return getattr(settings, 'LIBRARY_SETTINGS', {}).get(name, default)
+
+
+def _move_batch(source, target, ids):
+    """
+    Copy the rows with the given ids from source to target and delete them.
+    The batch checks itself: every row read must be found in the target and
+    deleted from the source, so loans made meanwhile do not matter.
+    """
+    rows = list(source.objects.select_for_update().filter(id__in=ids).values(*COPIED_FIELDS))
+    objs = [target(**row) for row in rows]
+    target.objects.bulk_create(objs)
+
+    # auto_now_add overwrites borrow_date on insert, so put the original back
+    if any(field.name == 'borrow_date' and field.auto_now_add for field in target._meta.fields):
+        for obj, row in zip(objs, rows):
+            obj.borrow_date = row['borrow_date']
+        target.objects.bulk_update(objs, ['borrow_date'])
+
+    inserted = target.objects.filter(id__in=[row['id'] for row in rows]).count()
+    if inserted != len(rows):
+        raise ArchiveError(
+            f"Read {len(rows)} rows from {source._meta.db_table} but found {inserted} "
+            f"in {target._meta.db_table}"
+        )
+
+    _, deleted_per_model = source.objects.filter(id__in=[row['id'] for row in rows]).delete()
+    deleted = deleted_per_model.get(source._meta.label, 0)
+    if deleted != len(rows):
+        raise ArchiveError(
+            f"Moved {len(rows)} rows to {target._meta.db_table} but deleted {deleted} "
+            f"from {source._meta.db_table}"
+        )
+    return len(rows)
+
+
+def _move_in_batches(source, target, queryset, batch_size, progress=None):
+    moved = 0
+
+    while True:
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+
+        with transaction.atomic():
+            moved += _move_batch(source, target, ids)
+
+        if progress:
+            progress(moved)
+
+    return moved
+
+
+def archivable_records(older_than_days=None):
+    """Returned loans old enough to be archived"""
+    if older_than_days is None:
+        older_than_days = _library_setting('ARCHIVE_AFTER_DAYS', 365)
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    return BorrowRecord.objects.filter(status='returned', return_date__lt=cutoff)
+
+
+def archive_returned_records(older_than_days=None, batch_size=None, progress=None):
+    """
+    Move returned loans older than the configured age into the archive table.
+    Each batch runs in its own transaction and checks that its rows moved intact.
+    Returns the number of records archived.
+    """
+    batch_size = batch_size or _library_setting('ARCHIVE_BATCH_SIZE', 1000)
+    return _move_in_batches(
+        BorrowRecord, ArchivedBorrowRecord, archivable_records(older_than_days),
+        batch_size, progress
+    )
+
+
+def restore_archived_records(queryset=None, batch_size=None, progress=None):
+    """
+    Move archived records back into the active table, e.g. to correct an
+    archived loan. Restores the whole archive when no queryset is given.
+    """
+    batch_size = batch_size or _library_setting('ARCHIVE_BATCH_SIZE', 1000)
+    if queryset is None:
+        queryset = ArchivedBorrowRecord.objects.all()
+    return _move_in_batches(ArchivedBorrowRecord, BorrowRecord, queryset, batch_size, progress)
+
+
+def combined_counts(group_by, limit=None, **filters):
+    """
+    Count borrow records across both tables grouped by the given fields,
+    largest first. Returns dicts with the group_by fields plus 'count'.
+    """
+    totals = {}
+    for model in (BorrowRecord, ArchivedBorrowRecord):
+        rows = model.objects.filter(**filters).order_by().values(*group_by).annotate(count=Count('id'))
+        for row in rows:
+            key = tuple(row[field] for field in group_by)
+            totals[key] = totals.get(key, 0) + row['count']
+
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    if limit is not None:
+        ranked = ranked[:limit]
+    return [dict(zip(group_by, key), count=count) for key, count in ranked]
+
+
+class CombinedHistory:
+    """
+    Read-only view over a hot and an archive queryset that supports the
+    order_by/filter/slice operations used by cursor pagination. Slices are
+    served by fetching the head of each ordered queryset and merging them.
+    """
+
+    def __init__(self, hot, archived, ordering=None):
+        self.hot = hot
+        self.archived = archived
+        self.ordering = ordering or ('-borrow_date', '-id')
+
+    def order_by(self, *fields):
+        return CombinedHistory(self.hot.order_by(*fields), self.archived.order_by(*fields), fields)
+
+    def filter(self, *args, **kwargs):
+        return CombinedHistory(
+            self.hot.filter(*args, **kwargs),
+            self.archived.filter(*args, **kwargs),
+            self.ordering
+        )
+
+    def count(self):
+        return self.hot.count() + self.archived.count()
+
+    def _sort_key(self, record):
+        return tuple(getattr(record, field.lstrip('-')) for field in self.ordering)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError("CombinedHistory only supports slicing")
+        start = index.start or 0
+        stop = index.stop
+
+        # Ordering fields all run in the same direction as the first one
+        descending = self.ordering[0].startswith('-')
+        merged = heapq.merge(
+            list(self.hot[:stop]), list(self.archived[:stop]),
+            key=self._sort_key, reverse=descending
+        )
+        return list(merged)[start:stop]
@@ -0,0 +1,169 @@
+"""
+Peak concurrent demand per title over a term.
+
+Loans and waiting holds are streamed in (book, start) order from the active
+and archive tables and swept per book: each interval becomes a start and an
+end event, and walking the sorted events gives how many loans (and loans
+plus waiting holds, the demand) were open at every moment. From that:
+- peak_loans / peak_demand: the most loans / loans and waiting holds at once;
+- zero_days, zero_pct, zero_episodes: how long, and how many separate times,
+  every copy was out (loans reached total_copies);
+- suggested_copies: the fewest copies that would have left all copies out
+  for at most target_pct of the term, given the observed demand.
+
+Loans can never exceed the copies on the shelf, so the waiting holds are
+what show demand a title could not meet. Copy counts are today's
+total_copies. Sorting the events is O(n log n) over all intervals.
+"""
+import heapq
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ArchivedBorrowRecord, BorrowRecord, Hold
+from .utilization import LOAD_CHUNK_SIZE, EpochSeconds, loan_count, overlapping_loans
+
+
+DEFAULT_TARGET_PCT = 5
+SORT_FIELDS = ('shortfall', 'peak_demand', 'zero_pct', 'loans')
+
+
+def _loan_intervals(start, end):
+    """(book_id, borrowed, returned, is_loan) of loans overlapping the term, per table in book order"""
+    now = timezone.now().timestamp()
+
+    def stream(model):
+        rows = overlapping_loans(model, start, end).order_by('book_id', 'borrow_date').values_list(
+            'book_id', EpochSeconds('borrow_date'), EpochSeconds('return_date')
+        )
+        for book_id, borrowed, returned in rows.iterator(chunk_size=LOAD_CHUNK_SIZE):
+            yield book_id, borrowed, now if returned is None else returned, True
+
+    return [stream(model) for model in (BorrowRecord, ArchivedBorrowRecord)]
+
+
+def _hold_intervals(start, end):
+    """
+    (book_id, placed, satisfied, is_loan) of holds waiting during the term.
+    A hold waits until a copy is set aside (ready_at). One that is still
+    waiting counts until now; one cancelled or expired without a copy counts
+    until its expiry, as cancellations are not timestamped.
+    """
+    now = timezone.now().timestamp()
+    rows = Hold.objects.filter(
+        Q(ready_at__isnull=True) | Q(ready_at__gt=start), created_at__lt=end
+    ).order_by('book_id', 'created_at').values_list(
+        'book_id', 'status', EpochSeconds('created_at'), EpochSeconds('ready_at'), EpochSeconds('expires_at')
+    )
+    for book_id, status, placed, ready, expires in rows.iterator(chunk_size=LOAD_CHUNK_SIZE):
+        if ready is not None:
+            satisfied = ready
+        elif status == 'waiting':
+            satisfied = now if expires is None else min(expires, now)
+        else:
+            satisfied = placed if expires is None else expires
+        yield book_id, placed, satisfied, False
+
+
+def sweep(intervals, start, end, copies, target_pct=DEFAULT_TARGET_PCT):
+    """
+    Sweep one book's (begin, finish, is_loan) intervals, clipped to
+    [start, end), and return its peak, zero-availability and suggested
+    copy figures.
+    """
+    events = []
+    for begin, finish, is_loan in intervals:
+        if begin < start:
+            begin = start
+        if finish > end:
+            finish = end
+        if finish > begin:
+            events.append((begin, 1, is_loan))
+            events.append((finish, -1, is_loan))
+    events.sort(key=itemgetter(0))
+
+    loans = demand = peak_loans = peak_demand = episodes = 0
+    zero_seconds, last, out = 0.0, start, False
+    time_at_demand = Counter()
+    # Apply all events at the same instant together, so a return and a
+    # checkout at the same moment do not open a new zero-availability episode
+    for at, group in groupby(events, key=itemgetter(0)):
+        time_at_demand[demand] += at - last
+        if out:
+            zero_seconds += at - last
+        last = at
+        for _, delta, is_loan in group:
+            demand += delta
+            if is_loan:
+                loans += delta
+        if demand > peak_demand:
+            peak_demand = demand
+        if loans > peak_loans:
+            peak_loans = loans
+        now_out = copies > 0 and loans >= copies
+        if now_out and not out:
+            episodes += 1
+        out = now_out
+    time_at_demand[demand] += end - last
+
+    # Fewest copies c for which demand >= c (every copy out) for at most target_pct of the term
+    allowed = (end - start) * target_pct / 100
+    suggested, time_at_or_above = peak_demand + 1, 0.0
+    for level in range(peak_demand, 0, -1):
+        time_at_or_above += time_at_demand[level]
+        if time_at_or_above > allowed:
+            break
+        suggested = level
+
+    return {
+        'peak_loans': peak_loans,
+        'peak_demand': peak_demand,
+        'zero_days': round(zero_seconds / 86400, 1),
+        'zero_pct': round(100 * zero_seconds / (end - start), 2),
+        'zero_episodes': episodes,
+        'suggested_copies': max(1, suggested),
+    }
+
+
+def peak_demand(start, end, target_pct=DEFAULT_TARGET_PCT, progress=None):
+    """
+    One row per title with its loans in the term and its sweep figures, in
+    catalog order. progress(swept, total) follows the loans swept so far.
+    """
+    from books.models import Book
+
+    start_ts, end_ts = start.timestamp(), end.timestamp()
+    total = loan_count(start, end) if progress else 0
+    swept, next_report = 0, LOAD_CHUNK_SIZE
+    streams = _loan_intervals(start, end) + [_hold_intervals(start, end)]
+    figures, loans = {}, Counter()
+    copies = dict(Book.objects.values_list('id', 'total_copies'))
+    for book_id, rows in groupby(heapq.merge(*streams, key=itemgetter(0)), key=itemgetter(0)):
+        intervals = [(begin, finish, is_loan) for _, begin, finish, is_loan in rows]
+        loans[book_id] = sum(is_loan and start_ts <= begin < end_ts for begin, _, is_loan in intervals)
+        figures[book_id] = sweep(intervals, start_ts, end_ts, copies.get(book_id, 0), target_pct)
+        swept += sum(is_loan for _, _, is_loan in intervals)
+        if progress and swept >= next_report:
+            progress(min(swept, total), total)
+            next_report = swept + LOAD_CHUNK_SIZE
+
+    idle = sweep([], start_ts, end_ts, 0, target_pct)
+    results = []
+    for book_id, title, author, total_copies in Book.objects.order_by('id').values_list(
+        'id', 'title', 'author', 'total_copies'
+    ).iterator(chunk_size=LOAD_CHUNK_SIZE):
+        row = figures.get(book_id, idle)
+        results.append({
+            'book_id': book_id, 'title': title, 'author': author,
+            'copies': total_copies, 'loans': loans[book_id], **row,
+            'shortfall': row['suggested_copies'] - total_copies,
+        })
+    return results
+
+
+def sort_rows(rows, field):
+    """Largest first, then by title"""
+    return sorted(rows, key=lambda row: (-row[field], row['title']))
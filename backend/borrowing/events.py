@@ -0,0 +1,139 @@
+"""
+Circulation event outbox.
+
+BorrowRecord.save() appends an event for every borrow, return, overdue
+transition and fine change in the same transaction as the record itself.
+Derived data (statistics, reports) can tail the outbox by event id and
+apply changes incrementally instead of re-scanning borrow_records.
+
+Ids are allocated when a row is inserted but become visible when its
+transaction commits, so concurrent checkouts can commit out of id order. A
+batch therefore stops at the first gap in the ids until the events after it
+are SETTLE_SECONDS old; by then the missing id has either committed or been
+rolled back for good, and a consumer never commits an offset past an event
+it has not seen.
+
+Nothing saves an open loan on the day it passes its due date, so
+mark_overdue() (the mark_overdue command, also run by send_notices) moves
+such loans to 'overdue' through save(), recording the transition.
+
+Only saves through BorrowRecord.save() are recorded. Bulk paths write no
+events: generate_dataset fills a fresh database, and archiving or restoring
+moves records between tables without changing them. Rebuild derived data
+(e.g. `build_related_books` without --refresh) after loading a dataset.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import BorrowRecord, CirculationEvent, EventConsumer
+
+
+DEFAULT_BATCH_SIZE = 100
+MAX_BATCH_SIZE = 1000
+SETTLE_SECONDS = 30  # How long a gap in event ids may stay open before it is skipped
+
+
+def _amount(value):
+    return Decimal(str(value or 0)).quantize(Decimal('0.01'))
+
+
+def record_changes(record, adding, loaded):
+    """Append outbox events describing how a borrow record changed"""
+    event_types = []
+    if adding:
+        event_types.append('borrowed')
+        if record.status == 'overdue':
+            event_types.append('overdue')
+    elif loaded:
+        if record.status != loaded['status'] and record.status in ('returned', 'overdue'):
+            event_types.append(record.status)
+        if _amount(record.fine_amount) != _amount(loaded['fine_amount']):
+            event_types.append('fine_changed')
+
+    if adding and _amount(record.fine_amount):
+        event_types.append('fine_changed')
+
+    CirculationEvent.objects.bulk_create([
+        CirculationEvent(
+            event_type=event_type,
+            borrow_record_id=record.id,
+            user_id=record.user_id,
+            book_id=record.book_id,
+            fine_amount=_amount(record.fine_amount)
+        )
+        for event_type in event_types
+    ])
+
+
+def mark_overdue(batch_size=500):
+    """
+    Move open loans whose due date has passed from 'borrowed' to 'overdue'.
+    Each record is saved in a locked batch, so its status, fine and events
+    change in one transaction. Returns the number of loans marked.
+    """
+    # save() treats a loan as overdue from the day after its due date
+    today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    marked, last_id = 0, 0
+    while True:
+        with transaction.atomic():
+            records = list(BorrowRecord.objects.select_for_update().filter(
+                id__gt=last_id, status='borrowed', return_date__isnull=True, due_date__lt=today
+            ).order_by('id')[:batch_size])
+            for record in records:
+                record.save()
+        marked += len(records)
+        if len(records) < batch_size:
+            return marked
+        last_id = records[-1].id
+
+
+def events_after(offset, limit=DEFAULT_BATCH_SIZE):
+    """
+    Events with an id greater than offset, oldest first, up to the first gap
+    in the ids that may still be filled by a transaction yet to commit
+    """
+    limit = max(1, min(limit, MAX_BATCH_SIZE))
+    batch = list(CirculationEvent.objects.filter(id__gt=offset).order_by('id')[:limit])
+    settled = timezone.now() - timedelta(seconds=SETTLE_SECONDS)
+    expected = offset + 1
+    for index, event in enumerate(batch):
+        if event.id != expected and event.created_at > settled:
+            return batch[:index]
+        expected = event.id + 1
+    return batch
+
+
+def settled_offset():
+    """
+    Id of the newest event at least SETTLE_SECONDS old: a safe offset for a
+    consumer that has just read borrow_records directly. Later events may be
+    seen again by its next poll.
+    """
+    settled = timezone.now() - timedelta(seconds=SETTLE_SECONDS)
+    # Walks the primary key backwards and stops at the first settled event
+    return CirculationEvent.objects.filter(created_at__lte=settled).order_by('-id').values_list(
+        'id', flat=True
+    ).first() or 0
+
+
+def poll(consumer_name, limit=DEFAULT_BATCH_SIZE):
+    """
+    Return (offset, events) for the next batch after the consumer's committed
+    offset. The offset is not advanced until commit() is called, so a consumer
+    that crashes mid-batch sees the same events again.
+    """
+    consumer, _ = EventConsumer.objects.get_or_create(name=consumer_name)
+    return consumer.offset, events_after(consumer.offset, limit)
+
+
+def commit(consumer_name, offset):
+    """Advance a consumer's committed offset; offsets never move backwards"""
+    with transaction.atomic():
+        consumer, _ = EventConsumer.objects.select_for_update().get_or_create(name=consumer_name)
+        if offset > consumer.offset:
+            consumer.offset = offset
+            consumer.save(update_fields=['offset', 'updated_at'])
+    return consumer.offset
@@ -0,0 +1,128 @@
+"""
+Hold (reservation) queue.
+
+Each book has a queue of waiting holds ordered by position. When a copy is
+returned it is set aside for the head of the queue, found with a single seek
+on the partial (book, position) index over waiting holds.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .models import Hold
+
+
+def _library_setting(name, default):
+    return getattr(settings, 'LIBRARY_SETTINGS', {}).get(name, default)
+
+
+def _not_expired(now):
+    return Q(expires_at__isnull=True) | Q(expires_at__gt=now)
+
+
+def place_hold(user, book):
+    """Append a waiting hold for the user to the end of the book's queue"""
+    from books.models import Book
+
+    with transaction.atomic():
+        # Lock the book row so concurrent holds get distinct positions
+        Book.objects.select_for_update().filter(id=book.id).first()
+        last_position = Hold.objects.filter(book=book, status='waiting').aggregate(
+            last=Max('position')
+        )['last'] or 0
+        expiry_days = _library_setting('HOLD_EXPIRY_DAYS', 30)
+        return Hold.objects.create(
+            user=user,
+            book=book,
+            position=last_position + 1,
+            expires_at=timezone.now() + timedelta(days=expiry_days)
+        )
+
+
+def next_waiting_hold(book, now=None, for_update=False):
+    """Head of the book's queue, skipping holds that expired but were not yet swept"""
+    now = now or timezone.now()
+    holds = Hold.objects.select_for_update() if for_update else Hold.objects
+    return holds.filter(book=book, status='waiting').filter(
+        _not_expired(now)
+    ).order_by('position').first()
+
+
+def allocate_copy(book):
+    """
+    Set an available copy aside for the next waiting hold. Adjusts
+    book.available_copies in memory; the caller saves the book, which it
+    must have read with select_for_update() in the current transaction.
+    Returns the hold that received the copy, or None.
+    """
+    if book.available_copies <= 0:
+        return None
+
+    now = timezone.now()
+    hold = next_waiting_hold(book, now, for_update=True)
+    if hold is None:
+        return None
+
+    hold.status = 'ready'
+    hold.ready_at = now
+    hold.expires_at = now + timedelta(days=_library_setting('HOLD_PICKUP_DAYS', 3))
+    hold.save(update_fields=['status', 'ready_at', 'expires_at'])
+    book.available_copies -= 1
+    return hold
+
+
+def queue_position(hold):
+    """1-based place of a waiting hold in its book's queue (0 once ready)"""
+    if hold.status != 'waiting':
+        return 0
+    ahead = Hold.objects.filter(
+        book_id=hold.book_id, status='waiting', position__lt=hold.position
+    ).filter(_not_expired(timezone.now())).count()
+    return ahead + 1
+
+
+def cancel_hold(hold):
+    """Cancel a hold, passing a copy set aside for it on to the next in line"""
+    from books.models import Book
+
+    with transaction.atomic():
+        was_ready = hold.status == 'ready'
+        hold.status = 'cancelled'
+        hold.save(update_fields=['status'])
+        if was_ready:
+            book = Book.objects.select_for_update().get(id=hold.book_id)
+            book.available_copies += 1
+            allocate_copy(book)
+            book.save()
+
+
+def expire_holds(now=None):
+    """
+    Expire lapsed holds in bulk. Copies that were set aside for expired
+    ready holds are released and offered to the next waiting hold.
+    Returns (expired waiting count, expired ready count).
+    """
+    from books.models import Book
+
+    now = now or timezone.now()
+    with transaction.atomic():
+        waiting = Hold.objects.filter(status='waiting', expires_at__lte=now).update(status='expired')
+
+        lapsed = Hold.objects.filter(status='ready', expires_at__lte=now)
+        released = {
+            row['book_id']: row['count']
+            for row in lapsed.order_by().values('book_id').annotate(count=Count('id'))
+        }
+        ready = lapsed.update(status='expired')
+
+        for book in Book.objects.select_for_update().filter(id__in=released):
+            book.available_copies += released[book.id]
+            for _ in range(released[book.id]):
+                if allocate_copy(book) is None:
+                    break
+            book.save()
+
+    return waiting, ready
@@ -0,0 +1,360 @@
+"""
+Background report jobs.
+
+Reports too slow for a request (full statistics, loan history dumps, the
+utilization and peak demand reports over a large collection) are submitted
+as ReportJob rows and run by `manage.py run_report_jobs`. There is no
+broker: the table is the queue. A worker claims the oldest queued job with a
+conditional UPDATE, so workers in any number of processes or hosts sharing
+the database never run the same job twice, and runs it on a thread pool.
+
+Each job writes one file to JOB_RESULT_DIR under a temporary name, renamed
+once complete, so a download never sees a partial result. Kinds that are not
+submittable are queued only by their own endpoints, e.g. the student import,
+whose uploaded file waits in JOB_RESULT_DIR/uploads until the job runs. Tasks call
+context.report(progress, message) between chunks: that records progress,
+refreshes the heartbeat and raises JobCancelled once cancellation has been
+requested. A running job whose heartbeat is older than JOB_STALE_SECONDS
+(its worker died) is marked failed.
+"""
+import csv
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Sum
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import demand, utilization
+from .archive import combined_counts
+from .models import ArchivedBorrowRecord, BorrowRecord, ReportJob
+from .serializers import HistoryExportSerializer, PeakDemandFilterSerializer, UtilizationFilterSerializer
+from users.serializers import StudentImportJobSerializer
+from library_system.renderers import escape_formula, write_csv
+
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_INTERVAL = 1.0  # Seconds between progress writes from one job
+HISTORY_CHUNK_SIZE = 5000
+UPLOAD_NAME = re.compile(r'[0-9a-f]{32}\.csv')
+
+JobKind = namedtuple('JobKind', ('run', 'params', 'extension', 'description', 'submittable'), defaults=(True,))
+
+
+class JobCancelled(Exception):
+    """Raised inside a task when its job has been cancelled"""
+
+
+class JobContext:
+    """Handed to a task to report progress; doubles as the cancellation check"""
+
+    def __init__(self, job):
+        self.job_id = job.id
+        self._reported_at = None
+
+    def report(self, progress, message=''):
+        now = time.monotonic()
+        if self._reported_at is not None and now - self._reported_at < PROGRESS_INTERVAL:
+            return
+        self._reported_at = now
+        updated = ReportJob.objects.filter(id=self.job_id, cancel_requested=False).update(
+            progress=round(min(max(progress, 0), 1), 4), message=message[:200], heartbeat_at=timezone.now()
+        )
+        if not updated:
+            raise JobCancelled()
+
+
+def _statistics(params, output, context):
+    """Catalog and loan totals, with loan counts for every title and every student"""
+    from books.models import Book
+
+    context.report(0, 'Counting copies')
+    copies = Book.objects.aggregate(
+        books=Count('id'), total=Sum('total_copies'), available=Sum('available_copies')
+    )
+    context.report(0.1, 'Counting loans')
+    active = BorrowRecord.objects.filter(status__in=['borrowed', 'overdue']).count()
+    overdue = BorrowRecord.objects.filter(status='overdue').count()
+    recent_date = timezone.now() - timedelta(days=30)
+    recent = sum(
+        model.objects.filter(borrow_date__gte=recent_date).count()
+        for model in (BorrowRecord, ArchivedBorrowRecord)
+    )
+    context.report(0.2, 'Counting loans per title')
+    by_book = combined_counts(('book_id', 'book__title', 'book__author'))
+    context.report(0.6, 'Counting loans per student')
+    by_user = combined_counts(('user_id', 'user__full_name', 'user__email'))
+    context.report(0.95, 'Writing')
+    json.dump({
+        'generated_at': timezone.now(),
+        'total_books': copies['books'],
+        'total_copies': copies['total'] or 0,
+        'available_copies': copies['available'] or 0,
+        'borrowed_copies': (copies['total'] or 0) - (copies['available'] or 0),
+        'total_borrows': sum(row['count'] for row in by_book),
+        'active_borrows': active,
+        'overdue_borrows': overdue,
+        'recent_borrows': recent,
+        'books': by_book,
+        'students': by_user,
+    }, output, cls=JSONEncoder)
+
+
+HISTORY_FIELDS = (
+    'id', 'user_id', 'user__email', 'user__full_name', 'book_id', 'book__title', 'book__isbn',
+    'borrow_date', 'due_date', 'return_date', 'status', 'fine_amount'
+)
+
+
+def _history_queryset(model, params):
+    queryset = model.objects.all()
+    if params.get('user_id'):
+        queryset = queryset.filter(user_id=params['user_id'])
+    if params.get('status'):
+        queryset = queryset.filter(status__in=params['status'])
+    if params.get('from_date'):
+        queryset = queryset.filter(borrow_date__gte=utilization.date_range(params['from_date'], params['from_date'])[0])
+    if params.get('to_date'):
+        queryset = queryset.filter(borrow_date__lt=utilization.date_range(params['to_date'], params['to_date'])[1])
+    return queryset
+
+
+def _borrow_history(params, output, context):
+    """Every loan in the active and archive tables matching the filters, in id order"""
+    context.report(0, 'Counting loans')
+    querysets = [
+        (_history_queryset(model, params), model is ArchivedBorrowRecord)
+        for model in (BorrowRecord, ArchivedBorrowRecord)
+    ]
+    total = sum(queryset.count() for queryset, _ in querysets)
+    writer = csv.writer(output)
+    writer.writerow([field.replace('__', '_') for field in HISTORY_FIELDS] + ['archived'])
+    written = 0
+    for queryset, archived in querysets:
+        rows = queryset.order_by('id').values_list(*HISTORY_FIELDS)
+        for row in rows.iterator(chunk_size=HISTORY_CHUNK_SIZE):
+            # Dates as ISO 8601, like the API
+            writer.writerow([
+                value.isoformat() if isinstance(value, datetime) else escape_formula(value) for value in row
+            ] + [archived])
+            written += 1
+            if written % HISTORY_CHUNK_SIZE == 0:
+                context.report(written / total, f'{written} of {total} loans')
+
+
+def _loan_progress(context, verb):
+    """Progress callback for the loan-by-loan reports, filling up to 90%"""
+    def report(done, total):
+        context.report(0.9 * done / total if total else 0, f'{done} of {total} loans {verb}')
+    return report
+
+
+def _utilization(params, output, context):
+    context.report(0, 'Reading loans')
+    start, end = utilization.date_range(params['from_date'], params['to_date'])
+    report = utilization.utilization(start, end, params['group'], progress=_loan_progress(context, 'read'))
+    context.report(0.9, 'Writing')
+    write_csv(output, utilization.sort_rows(report['results'], params['sort']))
+
+
+def _peak_demand(params, output, context):
+    context.report(0, 'Sweeping loans and holds')
+    start, end = utilization.date_range(params['from_date'], params['to_date'])
+    rows = demand.peak_demand(start, end, params['target_pct'], progress=_loan_progress(context, 'swept'))
+    context.report(0.9, 'Writing')
+    write_csv(output, demand.sort_rows(rows, params['sort']))
+
+
+def _import_students(params, output, context):
+    from users.importing import import_students
+
+    path = upload_path(params['upload'])
+    progress = lambda created, total: context.report(created / total, f'{created} of {total} students created')
+    try:
+        with open(path, encoding='utf-8-sig', newline='') as csv_file:
+            # Cancelling stops before the next batch; students already created stay
+            result = import_students(csv_file, progress=progress)
+    finally:
+        _discard(path)
+    json.dump(result, output, cls=JSONEncoder)
+
+
+JOB_KINDS = {
+    'statistics': JobKind(
+        _statistics, None, 'json', 'Catalog and loan totals with loan counts for every title and student'
+    ),
+    'borrow_history': JobKind(
+        _borrow_history, HistoryExportSerializer, 'csv',
+        'Current and archived loans, optionally for one student, by status and date range'
+    ),
+    'utilization': JobKind(
+        _utilization, UtilizationFilterSerializer, 'csv', 'Collection utilization per title or category'
+    ),
+    'peak_demand': JobKind(
+        _peak_demand, PeakDemandFilterSerializer, 'csv', 'Peak demand and suggested copies per title'
+    ),
+    'import_students': JobKind(
+        _import_students, StudentImportJobSerializer, 'json', 'Bulk student enrollment from an uploaded CSV',
+        submittable=False
+    ),
+}
+
+
+def parse_params(kind, params):
+    """Validate a kind's parameters; returns (validated, errors)"""
+    serializer_class = JOB_KINDS[kind].params
+    if serializer_class is None:
+        return {}, None
+    serializer = serializer_class(data=params)
+    if not serializer.is_valid():
+        return None, serializer.errors
+    return serializer.validated_data, None
+
+
+def submit(kind, params, user=None):
+    """
+    Queue a job with validated parameters. Defaults such as a report's date
+    range are resolved now and stored, so the result reflects submission time.
+    """
+    stored = json.loads(json.dumps(params, cls=JSONEncoder))
+    return ReportJob.objects.create(kind=kind, params=stored, user=user)
+
+
+def cancel(job):
+    """Cancel a queued job at once, or ask the worker running it to stop at its next progress report"""
+    ReportJob.objects.filter(id=job.id, status='queued').update(
+        status='cancelled', message='Cancelled', finished_at=timezone.now()
+    )
+    ReportJob.objects.filter(id=job.id, status='running').update(cancel_requested=True)
+    job.refresh_from_db()
+    return job
+
+
+def result_dir():
+    return settings.JOB_RESULT_DIR
+
+
+def save_upload(content):
+    """Store an uploaded CSV for a job to read; returns its name for the job's params"""
+    directory = os.path.join(result_dir(), 'uploads')
+    os.makedirs(directory, exist_ok=True)
+    name = f'{uuid.uuid4().hex}.csv'
+    with open(os.path.join(directory, name), 'wb') as upload:
+        upload.write(content)
+    return name
+
+
+def upload_path(name):
+    if not UPLOAD_NAME.fullmatch(name):
+        raise ValueError(f'Invalid upload name: {name}')
+    return os.path.join(result_dir(), 'uploads', name)
+
+
+def result_path(job):
+    """Path of a finished job's result file, or None if it has none (or it was pruned)"""
+    if job.status != 'succeeded' or not job.result_name:
+        return None
+    path = os.path.join(result_dir(), job.result_name)
+    return path if os.path.exists(path) else None
+
+
+def claim_next(worker):
+    """Mark the oldest queued job running for this worker and return it, or None if the queue is empty"""
+    while True:
+        job_id = ReportJob.objects.filter(status='queued').order_by('id').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+        now = timezone.now()
+        # Another worker may claim the same job first; then try the next one
+        if ReportJob.objects.filter(id=job_id, status='queued').update(
+            status='running', worker=worker[:100], started_at=now, heartbeat_at=now
+        ):
+            return ReportJob.objects.get(id=job_id)
+
+
+def heartbeat(job_ids):
+    """Refresh the heartbeat of running jobs, including ones busy in a step that reports no progress"""
+    if job_ids:
+        ReportJob.objects.filter(id__in=job_ids, status='running').update(heartbeat_at=timezone.now())
+
+
+def _finish(job_id, status, **fields):
+    ReportJob.objects.filter(id=job_id, status='running').update(
+        status=status, finished_at=timezone.now(), **fields
+    )
+
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def run_job(job):
+    """Run a claimed job to completion, recording its result file, failure or cancellation"""
+    try:
+        kind = JOB_KINDS.get(job.kind)
+        if kind is None:
+            _finish(job.id, 'failed', error=f'Unknown job kind: {job.kind}')
+            return
+        params, errors = parse_params(job.kind, job.params)
+        if errors:
+            _finish(job.id, 'failed', error=f'Invalid parameters: {json.dumps(errors)}')
+            return
+
+        os.makedirs(result_dir(), exist_ok=True)
+        name = f'{job.id}-{job.kind}.{kind.extension}'
+        path = os.path.join(result_dir(), name)
+        partial = f'{path}.part'
+        try:
+            with open(partial, 'w', newline='', encoding='utf-8') as output:
+                kind.run(params, output, JobContext(job))
+            os.replace(partial, path)
+        except JobCancelled:
+            _discard(partial)
+            _finish(job.id, 'cancelled', message='Cancelled')
+        except Exception as exc:
+            logger.exception('Report job #%s (%s) failed', job.id, job.kind)
+            _discard(partial)
+            _finish(job.id, 'failed', error=f'{type(exc).__name__}: {exc}')
+        else:
+            _finish(
+                job.id, 'succeeded', progress=1, message='Done',
+                result_name=name, result_size=os.path.getsize(path)
+            )
+    finally:
+        # Pool threads are reused; do not hold a broken or stale connection between jobs
+        connection.close_if_unusable_or_obsolete()
+
+
+def fail_stale_jobs(stale_seconds=None):
+    """Mark running jobs whose worker stopped sending heartbeats as failed; returns how many"""
+    stale_seconds = stale_seconds or settings.JOB_STALE_SECONDS
+    cutoff = timezone.now() - timedelta(seconds=stale_seconds)
+    return ReportJob.objects.filter(status='running', heartbeat_at__lt=cutoff).update(
+        status='failed', error='Worker stopped responding', finished_at=timezone.now()
+    )
+
+
+def prune_jobs(days=None):
+    """Delete finished jobs older than JOB_RESULT_DAYS with their result files; returns how many"""
+    days = settings.JOB_RESULT_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    old = ReportJob.objects.filter(status__in=['succeeded', 'failed', 'cancelled'], finished_at__lt=cutoff)
+    for name, params in old.values_list('result_name', 'params'):
+        if name:
+            _discard(os.path.join(result_dir(), name))
+        # Uploads of jobs cancelled before they ran
+        if UPLOAD_NAME.fullmatch(str(params.get('upload', ''))):
+            _discard(upload_path(params['upload']))
+    return old.delete()[0]
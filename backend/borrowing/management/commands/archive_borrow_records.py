@@ -0,0 +1,47 @@
+"""
+Management command to move old returned loans into the archive table
+"""
+from django.core.management.base import BaseCommand, CommandError
+from borrowing.archive import (
+    ArchiveError, archivable_records, archive_returned_records, restore_archived_records
+)
+from borrowing.models import ArchivedBorrowRecord
+
+
+class Command(BaseCommand):
+    help = 'Archive returned borrow records older than ARCHIVE_AFTER_DAYS, or restore them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Archive loans returned more than this many days ago')
+        parser.add_argument('--batch-size', type=int, help='Records moved per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many records would move')
+        parser.add_argument('--restore', action='store_true', help='Move archived records back to the active table')
+        parser.add_argument('--user-id', type=int, help='With --restore, only restore this user\'s records')
+
+    def handle(self, *args, **options):
+        progress = lambda moved: self.stdout.write(f'  {moved} records moved')
+
+        if options['restore']:
+            queryset = ArchivedBorrowRecord.objects.all()
+            if options['user_id']:
+                queryset = queryset.filter(user_id=options['user_id'])
+            if options['dry_run']:
+                self.stdout.write(f'{queryset.count()} records would be restored')
+                return
+            try:
+                moved = restore_archived_records(queryset, options['batch_size'], progress)
+            except ArchiveError as exc:
+                raise CommandError(str(exc))
+            action = 'Restored'
+        else:
+            if options['dry_run']:
+                count = archivable_records(options['days']).count()
+                self.stdout.write(f'{count} records would be archived')
+                return
+            try:
+                moved = archive_returned_records(options['days'], options['batch_size'], progress)
+            except ArchiveError as exc:
+                raise CommandError(str(exc))
+            action = 'Archived'
+
+        self.stdout.write(self.style.SUCCESS(f'{action} {moved} borrow records'))
@@ -0,0 +1,106 @@
+"""
+Management command to benchmark the API end to end against a throwaway
+database
+"""
+import platform
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+)
+from django.utils import timezone
+
+from library_system.benchmarking import (
+    SCENARIOS, BenchmarkRunner, compare, load_results, save_results, seed_dataset
+)
+
+
+class Command(BaseCommand):
+    help = 'Seed a test database, run API scenarios and report latency percentiles and query counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=2000, help='Books to seed')
+        parser.add_argument('--students', type=int, default=500, help='Students to seed')
+        parser.add_argument('--borrows', type=int, default=10000, help='Borrow records to seed')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for data and scenarios')
+        parser.add_argument('--iterations', type=int, default=50, help='Iterations per scenario')
+        parser.add_argument(
+            '--scenario', action='append', choices=list(SCENARIOS),
+            help='Scenario to run (repeatable, default: all)'
+        )
+        parser.add_argument('--output', help='Write results as JSON to this file')
+        parser.add_argument('--compare', help='Baseline JSON results to compare against')
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Flag endpoints whose p95 grew by more than this fraction (default 0.2)'
+        )
+        parser.add_argument(
+            '--fail-on-regression', action='store_true',
+            help='Exit with an error when regressions are found'
+        )
+
+    def handle(self, *args, **options):
+        scenarios = options['scenario'] or list(SCENARIOS)
+        baseline = load_results(options['compare']) if options['compare'] else None
+
+        # Never touch the configured database: run against fresh test databases
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, serialized_aliases=set())
+        try:
+            self.stdout.write(
+                f"Seeding {options['books']} books, {options['students']} students, "
+                f"{options['borrows']} borrow records..."
+            )
+            seed_dataset(options['books'], options['students'], options['borrows'], options['seed'])
+
+            runner = BenchmarkRunner(options['seed'])
+            for name in scenarios:
+                self.stdout.write(f"Running {name} x {options['iterations']}...")
+                runner.run(name, options['iterations'])
+            results = runner.summary()
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        results['meta'] = {
+            'started_at': timezone.now().isoformat(),
+            'dataset': {key: options[key] for key in ('books', 'students', 'borrows', 'seed')},
+            'iterations': options['iterations'],
+            'database': connection.vendor,
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+        }
+        self._report(results)
+
+        if options['output']:
+            save_results(options['output'], results)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options['threshold'])
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(f'REGRESSION {regression}'))
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{len(regressions)} regression(s) against {options["compare"]}')
+
+    def _report(self, results):
+        self.stdout.write('')
+        self.stdout.write(
+            f"{'endpoint':<42} {'reqs':>5} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'p99 ms':>8} {'req/s':>7} {'queries':>8}"
+        )
+        for endpoint, stats in results['endpoints'].items():
+            self.stdout.write(
+                f"{endpoint:<42} {stats['requests']:>5} {stats['errors']:>4} {stats['p50_ms']:>8.2f} "
+                f"{stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['requests_per_second']:>7.1f} "
+                f"{stats['queries_mean']:>8.1f}"
+            )
+        for name, stats in results['scenarios'].items():
+            self.stdout.write(
+                f"Scenario {name}: {stats['requests']} requests in {stats['seconds']:.2f}s "
+                f"({stats['requests_per_second']:.1f} req/s)"
+            )
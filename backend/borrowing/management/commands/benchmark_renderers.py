@@ -0,0 +1,101 @@
+"""
+Management command to compare DRF's JSON renderer with the fast JSON and
+MessagePack renderers on typical list payloads
+"""
+import gzip
+import io
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from library_system.parsers import FastJSONParser, MessagePackParser
+from library_system.renderers import FastJSONRenderer, MessagePackRenderer, msgpack, orjson
+
+
+def build_payloads(records, seed=0):
+    """Serialized book and borrow record lists built from unsaved instances"""
+    from books.models import Book
+    from books.serializers import BookSerializer
+    from borrowing.models import BorrowRecord
+    from borrowing.serializers import BorrowRecordSerializer
+    from users.models import User
+
+    rng = random.Random(seed)
+    now = timezone.now()
+    books = [
+        Book(
+            id=i, title=f'Introduction to Topic {i}', author=f'Author {i % 97}', isbn=f'978{i:010d}',
+            category='science', total_copies=3, available_copies=rng.randint(0, 3),
+            shelf_location=f'A{i % 20}-B{i % 7}', description='A survey of the field. ' * 5,
+            publication_year=1990 + i % 35, publisher='Campus Press', created_at=now, updated_at=now,
+        )
+        for i in range(1, records + 1)
+    ]
+    librarian = User(id=1, email='librarian@example.com', username='librarian', full_name='Desk Librarian',
+                     role='librarian', date_joined=now, created_at=now)
+    borrows = []
+    for i, book in enumerate(books, start=1):
+        student = User(id=i + 1, email=f'student{i}@example.com', username=f'student{i}',
+                       full_name=f'Student {i}', role='student', date_joined=now, created_at=now)
+        borrowed = now - timedelta(days=rng.randint(0, 30))
+        borrows.append(BorrowRecord(
+            id=i, book=book, user=student, librarian=librarian, borrow_date=borrowed,
+            due_date=borrowed + timedelta(days=14), status='borrowed', fine_amount=Decimal('0.00'),
+        ))
+    return {
+        'books': {'count': records, 'results': BookSerializer(books, many=True).data},
+        'borrow records': {'count': records, 'results': BorrowRecordSerializer(borrows, many=True).data},
+    }
+
+
+def _best(func, iterations):
+    best = float('inf')
+    for _ in range(iterations):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+class Command(BaseCommand):
+    help = 'Benchmark response encoding, decoding and compression for the available renderers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=1000, help='Records per payload (default 1000)')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed runs; the best is reported')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('orjson is not installed: FastJSONRenderer falls back to DRF'))
+        formats = [
+            ('drf json', JSONRenderer(), JSONParser()),
+            ('fast json', FastJSONRenderer(), FastJSONParser()),
+        ]
+        if msgpack is not None:
+            formats.append(('msgpack', MessagePackRenderer(), MessagePackParser()))
+        else:
+            self.stdout.write(self.style.WARNING('msgpack is not installed: skipping MessagePack'))
+
+        iterations = options['iterations']
+        for name, payload in build_payloads(options['records']).items():
+            self.stdout.write('')
+            self.stdout.write(f"{name} ({options['records']} records)")
+            self.stdout.write(
+                f"{'format':<10} {'encode ms':>10} {'decode ms':>10} {'bytes':>10} {'gzip bytes':>11} {'gzip ms':>8}"
+            )
+            baseline = None
+            for label, renderer, parser in formats:
+                encode_ms, body = _best(lambda: renderer.render(payload, renderer.media_type, {}), iterations)
+                decode_ms, _ = _best(lambda: parser.parse(io.BytesIO(body), parser.media_type, {}), iterations)
+                gzip_ms, compressed = _best(lambda: gzip.compress(body, 6), max(1, iterations // 4))
+                baseline = baseline or encode_ms
+                self.stdout.write(
+                    f'{label:<10} {encode_ms:>10.2f} {decode_ms:>10.2f} {len(body):>10} {len(compressed):>11} '
+                    f'{gzip_ms:>8.2f}  ({baseline / encode_ms:.1f}x encode)'
+                )
@@ -0,0 +1,203 @@
+"""
+Management command to benchmark SQLite write concurrency with and without the
+tuned production mode
+"""
+import os
+import queue
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from library_system.sqlite import DEFAULT_PRAGMAS
+
+
+SCHEMA = """
+CREATE TABLE books (id INTEGER PRIMARY KEY, available_copies INTEGER NOT NULL);
+CREATE TABLE borrow_records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, book_id INTEGER NOT NULL, user_id INTEGER NOT NULL,
+    borrow_date REAL NOT NULL, return_date REAL
+);
+CREATE TABLE opac_search_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, search_query TEXT NOT NULL, results_count INTEGER NOT NULL,
+    search_date REAL NOT NULL
+);
+"""
+
+# Same as Django's sqlite3 backend without OPTIONS
+BASELINE = {'pragmas': {}, 'begin': 'BEGIN', 'timeout': 5.0, 'queue': False}
+TUNED = {
+    'pragmas': DEFAULT_PRAGMAS, 'begin': 'BEGIN IMMEDIATE',
+    'timeout': DEFAULT_PRAGMAS['busy_timeout'] / 1000, 'queue': False
+}
+MODES = {
+    'baseline': BASELINE,
+    'tuned': TUNED,
+    'tuned+queue': {**TUNED, 'queue': True},
+}
+
+
+def _connect(path, mode):
+    conn = sqlite3.connect(path, timeout=mode['timeout'], isolation_level=None, check_same_thread=False)
+    for name, value in mode['pragmas'].items():
+        conn.execute(f'PRAGMA {name}={value}')
+    return conn
+
+
+def _setup(path, books):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany('INSERT INTO books VALUES (?, ?)', [(i, 1000000) for i in range(1, books + 1)])
+    conn.commit()
+    conn.close()
+
+
+def _log_writer(path, mode, logs, stop):
+    conn = _connect(path, mode)
+    while not (stop.is_set() and logs.empty()):
+        try:
+            rows = [logs.get(timeout=0.05)]
+        except queue.Empty:
+            continue
+        while len(rows) < 500:
+            try:
+                rows.append(logs.get_nowait())
+            except queue.Empty:
+                break
+        conn.execute(mode['begin'])
+        conn.executemany(
+            'INSERT INTO opac_search_logs (search_query, results_count, search_date) VALUES (?, ?, ?)', rows
+        )
+        conn.execute('COMMIT')
+    conn.close()
+
+
+def _worker(path, mode, operations, books, seed, logs, results):
+    rng = random.Random(seed)
+    conn = _connect(path, mode)
+    latencies, locked = [], 0
+    for _ in range(operations):
+        roll = rng.random()
+        book_id = rng.randint(1, books)
+        started = time.perf_counter()
+        try:
+            if roll < 0.6:
+                # OPAC search: a read followed by a search log write
+                count = conn.execute(
+                    'SELECT COUNT(*) FROM books WHERE id BETWEEN ? AND ?', (book_id, book_id + 50)
+                ).fetchone()[0]
+                row = (f'query {book_id}', count, time.time())
+                if mode['queue']:
+                    logs.put(row)
+                else:
+                    conn.execute(mode['begin'])
+                    conn.execute(
+                        'INSERT INTO opac_search_logs (search_query, results_count, search_date) '
+                        'VALUES (?, ?, ?)', row
+                    )
+                    conn.execute('COMMIT')
+            else:
+                # Checkout: read availability, then decrement and insert a loan
+                conn.execute(mode['begin'])
+                conn.execute('SELECT available_copies FROM books WHERE id = ?', (book_id,)).fetchone()
+                conn.execute('UPDATE books SET available_copies = available_copies - 1 WHERE id = ?', (book_id,))
+                conn.execute(
+                    'INSERT INTO borrow_records (book_id, user_id, borrow_date) VALUES (?, ?, ?)',
+                    (book_id, rng.randint(1, 5000), time.time())
+                )
+                conn.execute('COMMIT')
+            latencies.append(time.perf_counter() - started)
+        except sqlite3.OperationalError as exc:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            if 'locked' not in str(exc):
+                raise
+            locked += 1
+    conn.close()
+    results.append((latencies, locked))
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_benchmark(mode, threads, operations, books=500):
+    """Run the mixed OPAC/checkout workload against a fresh database file"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.sqlite3')
+        _setup(path, books)
+
+        logs, stop, results = queue.Queue(), threading.Event(), []
+        writer = None
+        if mode['queue']:
+            writer = threading.Thread(target=_log_writer, args=(path, mode, logs, stop))
+            writer.start()
+
+        workers = [
+            threading.Thread(target=_worker, args=(path, mode, operations, books, seed, logs, results))
+            for seed in range(threads)
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        stop.set()
+        if writer is not None:
+            writer.join()
+        elapsed = time.perf_counter() - started
+
+    latencies = [latency for worker_latencies, _ in results for latency in worker_latencies]
+    return {
+        'completed': len(latencies),
+        'locked': sum(locked for _, locked in results),
+        'seconds': elapsed,
+        'ops_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': _percentile(latencies, 0.50) * 1000,
+        'p95_ms': _percentile(latencies, 0.95) * 1000,
+        'p99_ms': _percentile(latencies, 0.99) * 1000,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare SQLite throughput and lock errors for the default and tuned modes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent request threads')
+        parser.add_argument('--operations', type=int, default=500, help='Operations per thread')
+        parser.add_argument(
+            '--mode', action='append', choices=list(MODES),
+            help='Mode to run (repeatable, default: all)'
+        )
+
+    def handle(self, *args, **options):
+        modes = options['mode'] or list(MODES)
+        self.stdout.write(
+            f"{options['threads']} threads x {options['operations']} operations "
+            f"(60% OPAC search + log, 40% checkout)"
+        )
+        self.stdout.write(f"{'mode':<12} {'ops/s':>9} {'locked':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+
+        results = {}
+        for name in modes:
+            result = run_benchmark(MODES[name], options['threads'], options['operations'])
+            results[name] = result
+            self.stdout.write(
+                f"{name:<12} {result['ops_per_second']:>9.0f} {result['locked']:>7} "
+                f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f}"
+            )
+
+        if 'baseline' in results and len(results) > 1:
+            baseline = results['baseline']['ops_per_second'] or 1
+            for name, result in results.items():
+                if name != 'baseline':
+                    self.stdout.write(self.style.SUCCESS(
+                        f"{name}: {result['ops_per_second'] / baseline:.1f}x baseline throughput, "
+                        f"{result['locked']} vs {results['baseline']['locked']} lock errors"
+                    ))
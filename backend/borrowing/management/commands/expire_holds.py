@@ -0,0 +1,15 @@
+"""
+Management command to expire lapsed holds in bulk
+"""
+from django.core.management.base import BaseCommand
+from borrowing.holds import expire_holds
+
+
+class Command(BaseCommand):
+    help = 'Expire lapsed holds and pass released copies to the next hold in line'
+
+    def handle(self, *args, **options):
+        waiting, ready = expire_holds()
+        self.stdout.write(self.style.SUCCESS(
+            f'Expired {waiting} waiting holds and {ready} uncollected ready holds'
+        ))
@@ -0,0 +1,13 @@
+"""
+Management command to mark open loans past their due date overdue
+"""
+from django.core.management.base import BaseCommand
+from borrowing.events import mark_overdue
+
+
+class Command(BaseCommand):
+    help = 'Move open loans past their due date to overdue, recording the transition in the event outbox'
+
+    def handle(self, *args, **options):
+        marked = mark_overdue()
+        self.stdout.write(self.style.SUCCESS(f'Marked {marked} loans overdue'))
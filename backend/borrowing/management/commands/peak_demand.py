@@ -0,0 +1,53 @@
+"""
+Management command to report peak concurrent demand and suggested copy counts per title
+"""
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from borrowing.demand import DEFAULT_TARGET_PCT, SORT_FIELDS, peak_demand, sort_rows
+from borrowing.utilization import date_range
+from library_system.renderers import write_csv
+
+
+class Command(BaseCommand):
+    help = 'Sweep loans and holds per title for peak simultaneous demand, time with every copy out and suggested copies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='from_date', type=date.fromisoformat, help='First day of the term (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='to_date', type=date.fromisoformat, help='Last day of the term (default today)')
+        parser.add_argument(
+            '--target-pct', type=float, default=DEFAULT_TARGET_PCT,
+            help='Share of the term every copy may be out when suggesting copy counts'
+        )
+        parser.add_argument('--sort', choices=SORT_FIELDS, default='shortfall')
+        parser.add_argument('--top', type=int, default=20, help='Titles listed')
+        parser.add_argument('--csv', help='Also write every title to this CSV file')
+
+    def handle(self, *args, **options):
+        to_date = options['to_date'] or timezone.localdate()
+        from_date = options['from_date'] or to_date - timedelta(days=364)
+        if from_date > to_date:
+            raise CommandError('--from cannot be after --to')
+
+        rows = sort_rows(peak_demand(*date_range(from_date, to_date), options['target_pct']), options['sort'])
+        if options['csv']:
+            with open(options['csv'], 'w', newline='') as csv_file:
+                write_csv(csv_file, rows)
+
+        self.stdout.write(
+            f"{'book':>8} {'title':<36} {'copies':>6} {'loans':>6} {'peak':>5} {'demand':>6} "
+            f"{'zero %':>7} {'times':>6} {'suggest':>7}"
+        )
+        for row in rows[:options['top']]:
+            self.stdout.write(
+                f"{row['book_id']:>8} {row['title'][:36]:<36} {row['copies']:>6} {row['loans']:>6} "
+                f"{row['peak_loans']:>5} {row['peak_demand']:>6} {row['zero_pct']:>7.2f} "
+                f"{row['zero_episodes']:>6} {row['suggested_copies']:>7}"
+            )
+        short = sum(row['shortfall'] > 0 for row in rows)
+        self.stdout.write(self.style.SUCCESS(
+            f'{from_date} to {to_date}: {len(rows)} titles, {short} would need more copies '
+            f"to keep every copy out at most {options['target_pct']:g}% of the time"
+        ))
@@ -0,0 +1,79 @@
+"""
+Management command to run queued background report jobs
+"""
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from borrowing.jobs import claim_next, fail_stale_jobs, heartbeat, prune_jobs, run_job
+from borrowing.models import ReportJob
+
+
+PRUNE_INTERVAL = 3600  # Seconds between clean-ups of old jobs and result files
+
+
+class Command(BaseCommand):
+    help = 'Claim queued report jobs and run them on a thread pool until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.JOB_WORKERS, help='Jobs run at the same time'
+        )
+        parser.add_argument(
+            '--poll-seconds', type=float, default=2.0, help='How often to look for new jobs when idle'
+        )
+        parser.add_argument('--once', action='store_true', help='Run the jobs queued now, then exit')
+
+    def _report(self, job_id):
+        job = ReportJob.objects.get(id=job_id)
+        style = self.style.SUCCESS if job.status == 'succeeded' else self.style.WARNING
+        detail = f': {job.error}' if job.error else ''
+        self.stdout.write(style(f'Job #{job.id} ({job.kind}) {job.status}{detail}'))
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        running = {}
+        pruned_at = None
+        self.stdout.write(f'Running report jobs as {worker} with {workers} workers')
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report-job') as executor:
+            try:
+                while True:
+                    for future in [future for future in running if future.done()]:
+                        self._report(running.pop(future))
+
+                    if pruned_at is None or time.monotonic() - pruned_at > PRUNE_INTERVAL:
+                        pruned_at = time.monotonic()
+                        pruned = prune_jobs()
+                        if pruned:
+                            self.stdout.write(f'Removed {pruned} old jobs')
+                    stale = fail_stale_jobs()
+                    if stale:
+                        self.stdout.write(self.style.WARNING(f'Marked {stale} stalled jobs failed'))
+                    heartbeat(list(running.values()))
+
+                    while len(running) < workers:
+                        job = claim_next(worker)
+                        if job is None:
+                            break
+                        self.stdout.write(f'Started job #{job.id} ({job.kind})')
+                        running[executor.submit(run_job, job)] = job.id
+
+                    if options['once'] and not running:
+                        break
+                    connection.close_if_unusable_or_obsolete()
+                    if running:
+                        wait(running, timeout=options['poll_seconds'], return_when=FIRST_COMPLETED)
+                    else:
+                        time.sleep(options['poll_seconds'])
+            except KeyboardInterrupt:
+                self.stdout.write(f'Stopping; waiting for {len(running)} running jobs to finish')
+                wait(running)
+                for job_id in running.values():
+                    self._report(job_id)
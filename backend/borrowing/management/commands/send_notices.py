@@ -0,0 +1,24 @@
+"""
+Management command to email due-soon and overdue reminders to students
+"""
+from django.core.management.base import BaseCommand
+from borrowing.notices import send_notices
+
+
+class Command(BaseCommand):
+    help = 'Send one due-soon/overdue reminder per student; reruns skip loans already noticed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--due-soon-days', type=int, help='Remind about loans due within this many days')
+        parser.add_argument('--batch-size', type=int, default=100, help='Notices sent per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Build notices without sending or recording them')
+
+    def handle(self, *args, **options):
+        notices, lines = send_notices(
+            due_soon_days=options['due_soon_days'],
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            stdout=self.stdout
+        )
+        verb = 'Would send' if options['dry_run'] else 'Sent'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {notices} notices covering {lines} loans'))
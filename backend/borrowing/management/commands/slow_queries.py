@@ -0,0 +1,76 @@
+"""
+Management command to rank the slow and repeated queries in the slow-query log
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from library_system.slow_queries import load
+
+
+SORT_KEYS = {
+    'total': 'total_ms',
+    'count': 'count',
+    'max': 'max_ms',
+    'p95': 'p95_ms',
+    'mean': 'mean_ms',
+}
+
+
+class Command(BaseCommand):
+    help = 'Print the query fingerprints that cost the most time, with the views and code that ran them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help='Fingerprints to show (default 10)')
+        parser.add_argument(
+            '--sort', choices=list(SORT_KEYS), default='total',
+            help='Rank by total, count, max, p95 or mean time (default total)'
+        )
+        parser.add_argument(
+            '--kind', choices=['slow', 'repeated', 'all'], default='all',
+            help='Only slow queries, only statements repeated within a request, or both'
+        )
+        parser.add_argument('--hours', type=float, help='Only entries flushed in the last N hours')
+        parser.add_argument('--log', help='Log file to read (default SLOW_QUERY_LOG)')
+
+    def handle(self, *args, **options):
+        path = options['log'] or settings.SLOW_QUERY_LOG
+        since = timezone.now() - timedelta(hours=options['hours']) if options['hours'] else None
+        try:
+            entries = load(path, since)
+        except FileNotFoundError:
+            raise CommandError(f'No slow-query log at {path}')
+
+        if options['kind'] != 'all':
+            entries = [entry for entry in entries if entry['kind'] == options['kind']]
+        if not entries:
+            self.stdout.write(self.style.SUCCESS('No slow or repeated queries logged'))
+            return
+
+        key = SORT_KEYS[options['sort']]
+        entries.sort(key=lambda entry: entry[key], reverse=True)
+        self.stdout.write(f"Top {min(options['top'], len(entries))} of {len(entries)} fingerprints by {options['sort']}")
+        for rank, entry in enumerate(entries[:options['top']], start=1):
+            self._report(rank, entry)
+
+    def _report(self, rank, entry):
+        self.stdout.write('')
+        if entry['kind'] == 'repeated':
+            occurrences = (
+                f"{entry['count']} requests, up to {entry.get('max_repeats', 0)} runs each (N+1?)"
+            )
+        else:
+            occurrences = f"{entry['count']} runs"
+        self.stdout.write(self.style.WARNING(
+            f"#{rank} [{entry['kind']}] {entry['fingerprint']}: {occurrences}, "
+            f"total {entry['total_ms']:.1f} ms, mean {entry['mean_ms']:.1f} ms, "
+            f"p95 {entry['p95_ms']:.1f} ms, max {entry['max_ms']:.1f} ms"
+        ))
+        sql = entry['sql']
+        self.stdout.write(f'  {sql[:400]}{"..." if len(sql) > 400 else ""}')
+        views = sorted(entry['views'].items(), key=lambda item: item[1], reverse=True)
+        self.stdout.write('  views: ' + ', '.join(f'{view} ({count})' for view, count in views))
+        for frame in entry['stack']:
+            self.stdout.write(f'    {frame}')
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0002_initial'),
+        ('borrowing', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['user', 'borrow_date'], name='borrow_user_date_idx'),
+        ),
+    ]
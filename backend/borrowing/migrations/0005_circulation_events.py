@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0004_archived_borrow_record'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CirculationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('borrowed', 'Borrowed'), ('returned', 'Returned'), ('overdue', 'Became Overdue'), ('fine_changed', 'Fine Changed')], max_length=20)),
+                ('borrow_record_id', models.BigIntegerField()),
+                ('user_id', models.BigIntegerField()),
+                ('book_id', models.BigIntegerField()),
+                ('fine_amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'circulation_events',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EventConsumer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('offset', models.BigIntegerField(default=0, help_text='Id of the last processed event')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'circulation_event_consumers',
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_changelist_indexes'),
+        ('borrowing', '0007_notice_logs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedborrowrecord',
+            index=models.Index(fields=['borrow_date', 'id'], name='archive_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrecord',
+            index=models.Index(fields=['borrow_date', 'id'], name='borrow_date_idx'),
+        ),
+    ]
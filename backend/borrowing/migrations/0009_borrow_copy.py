@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0004_book_copies'),
+        ('borrowing', '0008_changelist_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedborrowrecord',
+            name='copy',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_borrow_records', to='books.bookcopy'),
+        ),
+        migrations.AddField(
+            model_name='borrowrecord',
+            name='copy',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='borrow_records', to='books.bookcopy'),
+        ),
+    ]
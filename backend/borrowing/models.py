@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from datetime import timedelta
 from django.conf import settings
@@ -22,6 +22,9 @@ class BorrowRecord(models.Model):
     fine_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     librarian = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True, blank=True, 
                                 related_name='processed_borrows')
+    # The physical copy, when it was checked out by barcode
+    copy = models.ForeignKey('books.BookCopy', on_delete=models.SET_NULL, null=True, blank=True,
+                             related_name='borrow_records')
     notes = models.TextField(blank=True)
     
     def save(self, *args, **kwargs):
@@ -42,8 +45,26 @@ class BorrowRecord(models.Model):
             fine_per_day = getattr(settings, 'LIBRARY_SETTINGS', {}).get('FINE_PER_DAY', 1.0)
             self.fine_amount = max(0, days_overdue * fine_per_day)
         
-        super().save(*args, **kwargs)
+        # Write the record and its circulation events in one transaction
+        from .events import record_changes
+        with transaction.atomic():
+            adding = self._state.adding
+            super().save(*args, **kwargs)
+            record_changes(self, adding, getattr(self, '_loaded_values', {}))
+        self._loaded_values = {'status': self.status, 'fine_amount': self.fine_amount}
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status and fine so save() can detect transitions
+        loaded = dict(zip(field_names, values))
+        instance._loaded_values = {
+            'status': loaded.get('status'),
+            'fine_amount': loaded.get('fine_amount')
+        }
+        return instance
+    
+    @transaction.atomic
     def return_book(self, librarian=None):
         """Mark book as returned"""
         self.return_date = timezone.now()
@@ -59,9 +80,21 @@ class BorrowRecord(models.Model):
         
         self.save()
         
-        # Update book availability
-        self.book.available_copies += 1
-        self.book.save()
+        # Update book availability, reserving the copy for the next hold if any.
+        # The book row is locked so concurrent returns and checkouts of the
+        # same title apply their counts in turn and see each other's holds.
+        from books.models import Book
+        from .holds import allocate_copy
+        book = Book.objects.select_for_update().get(id=self.book_id)
+        book.available_copies += 1
+        hold = allocate_copy(book)
+        book.save(update_fields=['available_copies', 'updated_at'])
+        self.book = book
+        
+        if self.copy_id:
+            self.copy.status = 'held' if hold else 'available'
+            self.copy.last_seen_at = self.return_date
+            self.copy.save(update_fields=['status', 'last_seen_at'])
     
     @property
     def is_overdue(self):
@@ -81,6 +114,22 @@ class BorrowRecord(models.Model):
     class Meta:
         db_table = 'borrow_records'
         ordering = ['-borrow_date']
+        indexes = [
+            models.Index(fields=['user', 'borrow_date'], name='borrow_user_date_idx'),
+            # Newest-first listing and date_hierarchy in the admin
+            models.Index(fields=['borrow_date', 'id'], name='borrow_date_idx'),
+            models.Index(
+                fields=['due_date'],
+                condition=models.Q(return_date__isnull=True),
+                name='borrow_open_due_idx'
+            ),
+            # Open loans per book, counted when reconciling availability
+            models.Index(
+                fields=['book'],
+                condition=models.Q(return_date__isnull=True),
+                name='borrow_open_book_idx'
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'book'],
@@ -88,3 +137,204 @@ class BorrowRecord(models.Model):
                 name='unique_active_borrow'
             )
         ]
+
+
+class ArchivedBorrowRecord(models.Model):
+    """Returned borrow records moved out of the active borrow_records table"""
+    
+    # Keeps the primary key of the original BorrowRecord
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='archived_borrow_records')
+    book = models.ForeignKey('books.Book', on_delete=models.CASCADE, related_name='archived_borrow_records')
+    borrow_date = models.DateTimeField()
+    due_date = models.DateTimeField()
+    return_date = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=BorrowRecord.STATUS_CHOICES, default='returned')
+    fine_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    librarian = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='archived_processed_borrows')
+    copy = models.ForeignKey('books.BookCopy', on_delete=models.SET_NULL, null=True, blank=True,
+                             related_name='archived_borrow_records')
+    notes = models.TextField(blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    # Archived records are always returned loans
+    is_overdue = False
+    days_overdue = 0
+    
+    def __str__(self):
+        return f"{self.user.full_name} - {self.book.title} (archived)"
+    
+    class Meta:
+        db_table = 'borrow_records_archive'
+        ordering = ['-borrow_date']
+        indexes = [
+            models.Index(fields=['user', 'borrow_date'], name='archive_user_date_idx'),
+            models.Index(fields=['borrow_date', 'id'], name='archive_date_idx'),
+        ]
+
+
+class CirculationEvent(models.Model):
+    """
+    Append-only outbox of circulation changes, written in the same
+    transaction as the borrow record. Consumers tail it by id.
+    """
+    
+    EVENT_TYPES = [
+        ('borrowed', 'Borrowed'),
+        ('returned', 'Returned'),
+        ('overdue', 'Became Overdue'),
+        ('fine_changed', 'Fine Changed'),
+    ]
+    
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPES)
+    # Plain ids rather than foreign keys so events survive archiving and deletes
+    borrow_record_id = models.BigIntegerField()
+    user_id = models.BigIntegerField()
+    book_id = models.BigIntegerField()
+    fine_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"#{self.id} {self.event_type} (record {self.borrow_record_id})"
+    
+    class Meta:
+        db_table = 'circulation_events'
+        ordering = ['id']
+
+
+class EventConsumer(models.Model):
+    """Committed outbox offset of a named consumer"""
+    
+    name = models.CharField(max_length=100, unique=True)
+    offset = models.BigIntegerField(default=0, help_text="Id of the last processed event")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.offset}"
+    
+    class Meta:
+        db_table = 'circulation_event_consumers'
+
+
+class Hold(models.Model):
+    """Reservation queue entry for a book that is currently unavailable"""
+    
+    STATUS_CHOICES = [
+        ('waiting', 'Waiting'),
+        ('ready', 'Ready for Pickup'),
+        ('fulfilled', 'Fulfilled'),
+        ('cancelled', 'Cancelled'),
+        ('expired', 'Expired'),
+    ]
+    
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='holds')
+    book = models.ForeignKey('books.Book', on_delete=models.CASCADE, related_name='holds')
+    position = models.PositiveIntegerField(help_text="Sequence number within the book's queue")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='waiting')
+    created_at = models.DateTimeField(auto_now_add=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    
+    @property
+    def is_active(self):
+        return self.status in ('waiting', 'ready')
+    
+    def __str__(self):
+        return f"{self.user.full_name} - {self.book.title} #{self.position} ({self.status})"
+    
+    class Meta:
+        db_table = 'holds'
+        ordering = ['book', 'position']
+        indexes = [
+            # Head-of-queue lookup for allocation on return
+            models.Index(
+                fields=['book', 'position'],
+                condition=models.Q(status='waiting'),
+                name='hold_queue_idx'
+            ),
+            models.Index(fields=['status', 'expires_at'], name='hold_expiry_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'book'],
+                condition=models.Q(status__in=['waiting', 'ready']),
+                name='unique_active_hold'
+            )
+        ]
+
+
+class NoticeLog(models.Model):
+    """Record of a reminder sent for a loan, so notice runs are idempotent"""
+    
+    NOTICE_TYPES = [
+        ('due_soon', 'Due Soon'),
+        ('overdue', 'Overdue'),
+    ]
+    
+    borrow_record_id = models.BigIntegerField()
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='notices')
+    notice_type = models.CharField(max_length=20, choices=NOTICE_TYPES)
+    notice_date = models.DateField(help_text="Due date for due-soon notices, send date for overdue notices")
+    sent_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.notice_type} notice for record {self.borrow_record_id} ({self.notice_date})"
+    
+    class Meta:
+        db_table = 'notice_logs'
+        ordering = ['-sent_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['borrow_record_id', 'notice_type', 'notice_date'],
+                name='unique_notice'
+            )
+        ]
+
+
+class ReportJob(models.Model):
+    """A long report or export run in the background by `manage.py run_report_jobs`"""
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+    
+    kind = models.CharField(max_length=30)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    progress = models.FloatField(default=0, help_text="Share of the work done, from 0 to 1")
+    message = models.CharField(max_length=200, blank=True)
+    cancel_requested = models.BooleanField(default=False)
+    user = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True, blank=True,
+                             related_name='report_jobs')
+    worker = models.CharField(max_length=100, blank=True, help_text="host:pid of the worker that ran it")
+    result_name = models.CharField(max_length=200, blank=True, help_text="Result file name in JOB_RESULT_DIR")
+    result_size = models.BigIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed', 'cancelled')
+    
+    def __str__(self):
+        return f"#{self.id} {self.kind} ({self.status})"
+    
+    class Meta:
+        db_table = 'report_jobs'
+        ordering = ['-id']
+        indexes = [
+            # Oldest queued job first when a worker claims one
+            models.Index(
+                fields=['id'],
+                condition=models.Q(status='queued'),
+                name='report_job_queue_idx'
+            ),
+        ]
@@ -0,0 +1,149 @@
+"""
+Due-soon and overdue reminder notices.
+
+Open loans are streamed in one query ordered by student, grouped into one
+notice per student and sent over a single email connection. Every loan line
+that goes out is written to NoticeLog right after its batch is sent so reruns
+skip it. These rows bypass the low-priority write queue: losing one would send
+the notice again.
+"""
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from .events import mark_overdue
+from .models import BorrowRecord, NoticeLog
+
+
+def _library_setting(name, default):
+    return getattr(settings, 'LIBRARY_SETTINGS', {}).get(name, default)
+
+
+def _notice_key(record, now):
+    """(notice_type, notice_date) for an open loan; overdue notices repeat daily"""
+    if record.due_date < now:
+        return 'overdue', timezone.localdate(now)
+    return 'due_soon', timezone.localdate(record.due_date)
+
+
+def pending_notices(now=None, due_soon_days=None, chunk_size=2000):
+    """
+    Yield (user, [(notice_type, notice_date, record), ...]) for every student
+    with due-soon or overdue loans that have not been noticed yet.
+    """
+    now = now or timezone.now()
+    if due_soon_days is None:
+        due_soon_days = _library_setting('DUE_SOON_DAYS', 2)
+
+    # Everything already sent for today or a future due date, in one query
+    sent = set(
+        NoticeLog.objects.filter(notice_date__gte=timezone.localdate(now)).order_by().values_list(
+            'borrow_record_id', 'notice_type', 'notice_date'
+        )
+    )
+
+    records = BorrowRecord.objects.filter(
+        return_date__isnull=True,
+        due_date__lt=now + timedelta(days=due_soon_days),
+        user__role='student',
+        user__is_active=True
+    ).select_related('user', 'book').order_by('user_id', 'due_date')
+
+    for _, user_records in groupby(records.iterator(chunk_size=chunk_size), key=lambda r: r.user_id):
+        lines = []
+        for record in user_records:
+            notice_type, notice_date = _notice_key(record, now)
+            if (record.id, notice_type, notice_date) not in sent:
+                lines.append((notice_type, notice_date, record))
+        if lines:
+            yield lines[0][2].user, lines
+
+
+def render_notice(user, lines, now=None):
+    """Build the email for one student's due-soon and overdue loans"""
+    now = now or timezone.now()
+    overdue = [record for notice_type, _, record in lines if notice_type == 'overdue']
+    due_soon = [record for notice_type, _, record in lines if notice_type == 'due_soon']
+
+    parts = [f"Dear {user.full_name},", ""]
+    if overdue:
+        fine_per_day = _library_setting('FINE_PER_DAY', 1.0)
+        parts.append("The following books are overdue. Please return them as soon as possible:")
+        for record in overdue:
+            days = (timezone.localdate(now) - timezone.localdate(record.due_date)).days
+            parts.append(
+                f"  - {record.book.title} by {record.book.author}: due "
+                f"{timezone.localdate(record.due_date):%d %b %Y}, {days} day(s) overdue "
+                f"(fine so far PGK {days * fine_per_day:.2f})"
+            )
+        parts.append("")
+    if due_soon:
+        parts.append("The following books are due soon:")
+        for record in due_soon:
+            parts.append(
+                f"  - {record.book.title} by {record.book.author}: due "
+                f"{timezone.localdate(record.due_date):%d %b %Y}"
+            )
+        parts.append("")
+    parts.append("Balimo College Library")
+
+    if overdue:
+        subject = f"Library notice: {len(overdue)} overdue book(s)"
+    else:
+        subject = f"Library reminder: {len(due_soon)} book(s) due soon"
+    return EmailMessage(subject, "\n".join(parts), settings.DEFAULT_FROM_EMAIL, [user.email])
+
+
+def send_notices(now=None, due_soon_days=None, batch_size=100, dry_run=False, stdout=None):
+    """
+    Send one notice per student over a single reused connection.
+    Returns (notices sent, loan lines covered).
+    """
+    now = now or timezone.now()
+    if not dry_run:
+        # Loans that fell due since the last run become overdue, with their events
+        mark_overdue()
+    sent_notices = 0
+    sent_lines = 0
+    batch = []
+
+    connection = None if dry_run else get_connection()
+    if connection is not None:
+        connection.open()
+
+    def flush():
+        nonlocal sent_notices, sent_lines
+        if not batch:
+            return
+        if connection is not None:
+            connection.send_messages([message for message, _ in batch])
+            NoticeLog.objects.bulk_create([
+                NoticeLog(
+                    borrow_record_id=record.id,
+                    user_id=record.user_id,
+                    notice_type=notice_type,
+                    notice_date=notice_date
+                )
+                for _, lines in batch
+                for notice_type, notice_date, record in lines
+            ], ignore_conflicts=True)
+        sent_notices += len(batch)
+        sent_lines += sum(len(lines) for _, lines in batch)
+        batch.clear()
+        if stdout:
+            stdout.write(f'  {sent_notices} notices processed')
+
+    try:
+        for user, lines in pending_notices(now, due_soon_days):
+            batch.append((render_notice(user, lines, now), lines))
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    finally:
+        if connection is not None:
+            connection.close()
+
+    return sent_notices, sent_lines
@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class BorrowHistoryPagination(CursorPagination):
+    """Cursor pagination for borrow history, newest borrows first"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-borrow_date', '-id')
@@ -1,7 +1,10 @@
+from datetime import timedelta
 from rest_framework import serializers
+from django.urls import reverse
 from django.utils import timezone
 from django.conf import settings
-from .models import BorrowRecord
+from .models import BorrowRecord, CirculationEvent, Hold, ReportJob
+from . import demand, utilization
 from books.serializers import BookSerializer
 from users.serializers import UserSerializer
 
@@ -21,12 +24,15 @@ class BorrowRecordSerializer(serializers.ModelSerializer):
 
 class BorrowBookSerializer(serializers.Serializer):
     user_id = serializers.IntegerField()
-    book_id = serializers.IntegerField()
+    # Either the catalog record or the scanned barcode of the copy
+    book_id = serializers.IntegerField(required=False)
+    barcode = serializers.CharField(required=False, max_length=32)
     notes = serializers.CharField(required=False, allow_blank=True)
     
     def validate(self, attrs):
         from users.models import User
-        from books.models import Book
+        from books.models import Book, BookCopy
+        from books.inventory import normalize_barcode
         
         # Validate user exists and is a student
         try:
@@ -36,13 +42,32 @@ class BorrowBookSerializer(serializers.Serializer):
         except User.DoesNotExist:
             raise serializers.ValidationError("User not found")
         
-        # Validate book exists and is available
-        try:
-            book = Book.objects.get(id=attrs['book_id'])
-            if not book.is_available:
-                raise serializers.ValidationError("Book is not available")
-        except Book.DoesNotExist:
-            raise serializers.ValidationError("Book not found")
+        copy = None
+        if attrs.get('barcode'):
+            # Unique index seek on the barcode
+            try:
+                copy = BookCopy.objects.select_related('book').get(barcode=normalize_barcode(attrs['barcode']))
+            except BookCopy.DoesNotExist:
+                raise serializers.ValidationError("Copy not found")
+            if copy.status not in ('available', 'held'):
+                raise serializers.ValidationError(f"Copy is {copy.get_status_display().lower()}")
+            book = copy.book
+        elif 'book_id' in attrs:
+            # Validate book exists and is available, or has a copy held for this user
+            try:
+                book = Book.objects.get(id=attrs['book_id'])
+            except Book.DoesNotExist:
+                raise serializers.ValidationError("Book not found")
+        else:
+            raise serializers.ValidationError("Provide book_id or barcode")
+        
+        ready_hold = Hold.objects.filter(user=user, book=book, status='ready').first()
+        if not book.is_available and ready_hold is None:
+            raise serializers.ValidationError("Book is not available")
+        # A held copy left over from a hold that has since lapsed can go out normally
+        if (copy is not None and copy.status == 'held' and ready_hold is None
+                and Hold.objects.filter(book=book, status='ready').exists()):
+            raise serializers.ValidationError("Copy is set aside for a hold")
         
         # Check if user already has this book
         existing_borrow = BorrowRecord.objects.filter(
@@ -66,11 +91,15 @@ class BorrowBookSerializer(serializers.Serializer):
         
         attrs['user'] = user
         attrs['book'] = book
+        attrs['copy'] = copy
+        attrs['hold'] = ready_hold
         return attrs
 
 
 class ReturnBookSerializer(serializers.Serializer):
-    borrow_record_id = serializers.IntegerField()
+    # Either the loan or the scanned barcode of the returned copy
+    borrow_record_id = serializers.IntegerField(required=False)
+    barcode = serializers.CharField(required=False, max_length=32)
     notes = serializers.CharField(required=False, allow_blank=True)
     
     def validate_borrow_record_id(self, value):
@@ -82,6 +111,21 @@ class ReturnBookSerializer(serializers.Serializer):
             return borrow_record
         except BorrowRecord.DoesNotExist:
             raise serializers.ValidationError("Active borrow record not found")
+    
+    def validate(self, attrs):
+        from books.inventory import normalize_barcode
+        
+        if attrs.get('barcode'):
+            try:
+                attrs['borrow_record_id'] = BorrowRecord.objects.select_related('copy').get(
+                    copy__barcode=normalize_barcode(attrs['barcode']),
+                    status__in=['borrowed', 'overdue']
+                )
+            except BorrowRecord.DoesNotExist:
+                raise serializers.ValidationError("No active loan for this copy")
+        elif 'borrow_record_id' not in attrs:
+            raise serializers.ValidationError("Provide borrow_record_id or barcode")
+        return attrs
 
 
 class StudentBorrowHistorySerializer(serializers.ModelSerializer):
@@ -95,3 +139,140 @@ class StudentBorrowHistorySerializer(serializers.ModelSerializer):
             'id', 'book_details', 'borrow_date', 'due_date', 'return_date',
             'status', 'fine_amount', 'is_overdue', 'days_overdue'
         )
+
+
+class BorrowHistoryFilterSerializer(serializers.Serializer):
+    """Query parameters accepted by the borrow history endpoints"""
+    status = serializers.MultipleChoiceField(choices=BorrowRecord.STATUS_CHOICES, required=False)
+    from_date = serializers.DateField(required=False)
+    to_date = serializers.DateField(required=False)
+    summary = serializers.BooleanField(default=False)
+    
+    def validate(self, attrs):
+        if attrs.get('from_date') and attrs.get('to_date'):
+            if attrs['from_date'] > attrs['to_date']:
+                raise serializers.ValidationError("from_date cannot be after to_date")
+        return attrs
+
+
+class HistoryExportSerializer(BorrowHistoryFilterSerializer):
+    """Filters of a borrow history export job; every student's loans unless user_id is given"""
+    user_id = serializers.IntegerField(required=False)
+    summary = None
+
+
+class ReportRangeSerializer(serializers.Serializer):
+    """Date range and row limit of the collection reports; the range defaults to the last year"""
+    from_date = serializers.DateField(required=False)
+    to_date = serializers.DateField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=100)
+    
+    def validate(self, attrs):
+        attrs.setdefault('to_date', timezone.localdate())
+        attrs.setdefault('from_date', attrs['to_date'] - timedelta(days=364))
+        if attrs['from_date'] > attrs['to_date']:
+            raise serializers.ValidationError("from_date cannot be after to_date")
+        return attrs
+
+
+class UtilizationFilterSerializer(ReportRangeSerializer):
+    """Query parameters of the utilization report"""
+    group = serializers.ChoiceField(choices=utilization.GROUPS, default='title')
+    sort = serializers.ChoiceField(choices=utilization.SORT_FIELDS, default='utilization_pct')
+
+
+class PeakDemandFilterSerializer(ReportRangeSerializer):
+    """Query parameters of the peak demand report"""
+    target_pct = serializers.FloatField(min_value=0, max_value=100, default=demand.DEFAULT_TARGET_PCT)
+    sort = serializers.ChoiceField(choices=demand.SORT_FIELDS, default='shortfall')
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ReportJob
+        fields = (
+            'id', 'kind', 'params', 'status', 'progress', 'message', 'cancel_requested', 'error',
+            'result_size', 'download_url', 'created_at', 'started_at', 'finished_at'
+        )
+    
+    def get_download_url(self, obj):
+        if obj.status != 'succeeded':
+            return None
+        url = reverse('report_job_download', args=[obj.id])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class SubmitReportJobSerializer(serializers.Serializer):
+    kind = serializers.CharField()
+    params = serializers.DictField(required=False, default=dict)
+    
+    def validate(self, attrs):
+        from .jobs import JOB_KINDS, parse_params
+        
+        kinds = [kind for kind, spec in JOB_KINDS.items() if spec.submittable]
+        if attrs['kind'] not in kinds:
+            raise serializers.ValidationError({'kind': f"Unknown kind; choose from {', '.join(kinds)}"})
+        params, errors = parse_params(attrs['kind'], attrs['params'])
+        if errors:
+            raise serializers.ValidationError({'params': errors})
+        attrs['params'] = params
+        return attrs
+
+
+class CirculationEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CirculationEvent
+        fields = ('id', 'event_type', 'borrow_record_id', 'user_id', 'book_id', 'fine_amount', 'created_at')
+
+
+class EventCommitSerializer(serializers.Serializer):
+    offset = serializers.IntegerField(min_value=0)
+
+
+class HoldSerializer(serializers.ModelSerializer):
+    book_details = BookSerializer(source='book', read_only=True)
+    queue_position = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Hold
+        fields = (
+            'id', 'book', 'book_details', 'status', 'queue_position',
+            'created_at', 'ready_at', 'expires_at'
+        )
+    
+    def get_queue_position(self, obj):
+        from .holds import queue_position
+        return queue_position(obj)
+
+
+class PlaceHoldSerializer(serializers.Serializer):
+    book_id = serializers.IntegerField()
+    
+    def validate(self, attrs):
+        from books.models import Book
+        user = self.context['request'].user
+        
+        try:
+            book = Book.objects.get(id=attrs['book_id'])
+        except Book.DoesNotExist:
+            raise serializers.ValidationError("Book not found")
+        
+        if book.is_available:
+            raise serializers.ValidationError("Book is available to borrow now")
+        
+        if Hold.objects.filter(user=user, book=book, status__in=['waiting', 'ready']).exists():
+            raise serializers.ValidationError("You already have a hold on this book")
+        
+        if BorrowRecord.objects.filter(user=user, book=book, status__in=['borrowed', 'overdue']).exists():
+            raise serializers.ValidationError("You already have this book borrowed")
+        
+        max_holds = getattr(settings, 'LIBRARY_SETTINGS', {}).get('MAX_HOLDS_PER_STUDENT', 5)
+        active_holds = Hold.objects.filter(user=user, status__in=['waiting', 'ready']).count()
+        if active_holds >= max_holds:
+            raise serializers.ValidationError(f"You have reached the maximum of {max_holds} holds")
+        
+        attrs['book'] = book
+        return attrs
@@ -1,3 +1,256 @@
-from django.test import TestCase
+import io
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from books.models import Book
+from users.models import User
+from . import demand, events, holds, jobs, utilization
+from .archive import archive_returned_records
+from .models import ArchivedBorrowRecord, BorrowRecord, CirculationEvent, Hold, ReportJob
+
+
+class LibraryTestCase(TestCase):
+    def setUp(self):
+        self.librarian = User.objects.create_user(
+            email='librarian@example.com', username='librarian', full_name='Librarian',
+            password='pass12345', role='librarian'
+        )
+        self.students = [
+            User.objects.create_user(
+                email=f'student{i}@example.com', username=f'student{i}', full_name=f'Student {i}',
+                password='pass12345', role='student'
+            )
+            for i in range(3)
+        ]
+        self.book = Book.objects.create(
+            title='Test Book', author='Author', isbn='9780000000001', category='science',
+            total_copies=1, available_copies=1, shelf_location='A1-B2'
+        )
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def loan(self, student, book=None, **fields):
+        return BorrowRecord.objects.create(
+            user=student, book=book or self.book, due_date=timezone.now() + timedelta(days=14), **fields
+        )
+
+
+class ArchiveTests(LibraryTestCase):
+    def test_checkouts_during_archive_run_do_not_abort_it(self):
+        old = timezone.now() - timedelta(days=400)
+        for student in self.students:
+            self.loan(student, status='returned', return_date=old)
+        other = Book.objects.create(
+            title='Other', author='Author', isbn='9780000000002', category='science',
+            total_copies=3, available_copies=3
+        )
+
+        # A checkout lands between batches
+        moved = archive_returned_records(
+            batch_size=1, progress=lambda moved: self.loan(self.students[moved - 1], other)
+        )
+
+        self.assertEqual(moved, 3)
+        self.assertEqual(ArchivedBorrowRecord.objects.count(), 3)
+        self.assertEqual(BorrowRecord.objects.filter(book=other).count(), 3)
+
+
+class EventOutboxTests(LibraryTestCase):
+    def event(self, **fields):
+        return CirculationEvent.objects.create(
+            event_type='borrowed', borrow_record_id=1, user_id=1, book_id=1, **fields
+        )
+
+    def test_batch_stops_at_a_gap_until_it_settles(self):
+        first = self.event()
+        # The id in between belongs to a transaction that has not committed
+        after_gap = self.event(id=first.id + 2)
+
+        self.assertEqual(events.events_after(first.id - 1), [first])
+        self.assertEqual(events.settled_offset(), 0)
+
+        settled = timezone.now() - timedelta(seconds=events.SETTLE_SECONDS + 1)
+        CirculationEvent.objects.filter(id=after_gap.id).update(created_at=settled)
+        self.assertEqual(events.events_after(first.id - 1), [first, after_gap])
+        self.assertEqual(events.settled_offset(), after_gap.id)
+
+    def test_checkout_and_return_are_recorded(self):
+        record = self.loan(self.students[0])
+        record.status = 'returned'
+        record.return_date = timezone.now()
+        record.save()
+        self.assertEqual(
+            [event.event_type for event in events.events_after(0)], ['borrowed', 'returned']
+        )
+
+    def test_loan_going_overdue_is_recorded_once(self):
+        record = self.loan(self.students[0])
+        # Time passes without the record being saved
+        BorrowRecord.objects.filter(id=record.id).update(due_date=timezone.now() - timedelta(days=2))
+
+        self.assertEqual(events.mark_overdue(), 1)
+        self.assertEqual(events.mark_overdue(), 0)
+        record.refresh_from_db()
+        self.assertEqual(record.status, 'overdue')
+        self.assertEqual(
+            CirculationEvent.objects.filter(borrow_record_id=record.id, event_type='overdue').count(), 1
+        )
+
+
+class HoldQueueTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book.total_copies = self.book.available_copies = 2
+        self.book.save()
+        self.client = self.client_for(self.librarian)
+
+    def borrow(self, student):
+        return self.client.post('/api/borrowing/borrow/', {'user_id': student.id, 'book_id': self.book.id})
+
+    def test_returns_read_the_current_count(self):
+        first, second = (BorrowRecord.objects.get(id=self.borrow(student).data['id']) for student in self.students[:2])
+        # Both records hold a copy of the book read before either return
+        self.assertEqual([first.book.available_copies, second.book.available_copies], [0, 0])
+        first.return_book(self.librarian)
+        second.return_book(self.librarian)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 2)
+
+    def test_each_return_sets_a_copy_aside_for_a_different_hold(self):
+        loans = [BorrowRecord.objects.get(id=self.borrow(student).data['id']) for student in self.students[:2]]
+        waiting = [holds.place_hold(student, self.book) for student in (self.students[2], self.librarian)]
+        for loan in loans:
+            loan.return_book(self.librarian)
+
+        self.assertEqual([Hold.objects.get(id=hold.id).status for hold in waiting], ['ready', 'ready'])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+    def test_borrowing_meets_the_borrowers_waiting_hold(self):
+        for student in self.students[:2]:
+            self.borrow(student)
+        hold = holds.place_hold(self.students[2], self.book)
+        # A copy turns up without passing through the queue, e.g. a newly registered one
+        self.book.total_copies, self.book.available_copies = 3, 1
+        self.book.save()
+
+        response = self.borrow(self.students[2])
+        self.assertEqual(response.status_code, 201, response.data)
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, 'fulfilled')
+
+        # The next return is not set aside for a student who already has the book
+        BorrowRecord.objects.filter(user=self.students[0]).get().return_book(self.librarian)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+        self.assertFalse(Hold.objects.filter(status='ready').exists())
+
+    def test_checkout_rechecks_availability_under_the_lock(self):
+        for student in self.students[:2]:
+            self.assertEqual(self.borrow(student).status_code, 201)
+        response = self.borrow(self.students[2])
+        self.assertEqual(response.status_code, 400)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+
+@override_settings(JOB_RESULT_DIR=tempfile.mkdtemp())
+class CsvExportTests(LibraryTestCase):
+    # The title as a CSV cell, quoted so spreadsheets show it as text
+    ESCAPED = '"\'=HYPERLINK(""http://example.com"")"'
+
+    def setUp(self):
+        super().setUp()
+        self.book.title = '=HYPERLINK("http://example.com")'
+        self.book.save()
+        self.loan(self.students[0])
+        self.client = self.client_for(self.librarian)
+
+    def test_formula_like_cells_are_quoted(self):
+        response = self.client.get('/api/borrowing/demand/', {'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.ESCAPED, response.content.decode())
+
+        job = jobs.submit('borrow_history', {}, self.librarian)
+        jobs.run_job(jobs.claim_next('test'))
+        job.refresh_from_db()
+        with open(jobs.result_path(job)) as result:
+            self.assertIn(self.ESCAPED, result.read())
+
+
+
+class RecordedProgress:
+    """Stands in for a job's context, keeping every progress message"""
+
+    def __init__(self):
+        self.messages = []
+
+    def report(self, progress, message=''):
+        self.messages.append(message)
+
+
+@override_settings(JOB_RESULT_DIR=tempfile.mkdtemp())
+class ReportCapTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        for student in self.students:
+            self.loan(student, status='returned', return_date=timezone.now())
+        self.client = self.client_for(self.librarian)
+
+    def test_large_ranges_are_queued_as_jobs(self):
+        with self.settings(LIBRARY_SETTINGS={'SYNC_REPORT_MAX_LOANS': 2}):
+            response = self.client.get('/api/borrowing/utilization/')
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertEqual(ReportJob.objects.get().id, response.data['job_id'])
+
+        with self.settings(LIBRARY_SETTINGS={'SYNC_REPORT_MAX_LOANS': 3}):
+            self.assertEqual(self.client.get('/api/borrowing/demand/').status_code, 200)
+
+    def test_jobs_report_progress_while_reading_loans(self):
+        for kind, module, message in (
+            ('utilization', utilization, '3 of 3 loans read'), ('peak_demand', demand, '3 of 3 loans swept')
+        ):
+            params, _ = jobs.parse_params(kind, {})
+            progress = RecordedProgress()
+            with mock.patch.object(module, 'LOAD_CHUNK_SIZE', 1):
+                jobs.JOB_KINDS[kind].run(params, io.StringIO(), progress)
+            self.assertIn(message, progress.messages)
+
+
+class DemandSweepTests(SimpleTestCase):
+    DAY = 86400
+    TERM = (0, 10 * DAY)
+
+    def days(self, *intervals):
+        return [(begin * self.DAY, finish * self.DAY, is_loan) for begin, finish, is_loan in intervals]
+
+    def test_back_to_back_loans_are_one_episode(self):
+        # Returned and lent again at day 4; a gap from day 7 to 8
+        intervals = self.days((0, 4, True), (4, 7, True), (8, 9, True))
+        self.assertEqual(demand.sweep(intervals, *self.TERM, copies=1), {
+            'peak_loans': 1, 'peak_demand': 1, 'zero_days': 8.0, 'zero_pct': 80.0,
+            'zero_episodes': 2, 'suggested_copies': 2,
+        })
+        # All copies out for exactly the allowed share of the term is enough
+        self.assertEqual(demand.sweep(intervals, *self.TERM, copies=1, target_pct=80)['suggested_copies'], 1)
+
+    def test_waiting_holds_raise_demand_but_not_loans(self):
+        intervals = self.days(
+            (-3, 1, True), (1, 5, True), (2, 6, True),  # The first starts before the term
+            (3, 8, False), (4, 5, False), (9, 12, False),  # The last runs past it
+        )
+        # Demand by day: 1 1 2 3 4 2 1 1 0 1; both copies out from day 2 to 5
+        self.assertEqual(demand.sweep(intervals, *self.TERM, copies=2), {
+            'peak_loans': 2, 'peak_demand': 4, 'zero_days': 3.0, 'zero_pct': 30.0,
+            'zero_episodes': 1, 'suggested_copies': 5,
+        })
+        # Demand of 3 or more for 2 days fits 20%; 2 or more for 4 days does not
+        self.assertEqual(demand.sweep(intervals, *self.TERM, copies=2, target_pct=20)['suggested_copies'], 3)
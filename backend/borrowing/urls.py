@@ -10,9 +10,27 @@ urlpatterns = [
     path('my-borrows/', views.my_borrows, name='my_borrows'),
     path('my-current-borrows/', views.my_current_borrows, name='my_current_borrows'),
     
+    # Holds / reservations
+    path('holds/', views.my_holds, name='my_holds'),
+    path('holds/<int:hold_id>/position/', views.hold_position, name='hold_position'),
+    path('holds/<int:hold_id>/cancel/', views.cancel_hold, name='cancel_hold'),
+    path('book/<int:book_id>/holds/', views.book_holds, name='book_holds'),
+    
     # Librarian/Admin views
     path('records/', views.BorrowRecordListView.as_view(), name='borrow_records'),
     path('overdue/', views.overdue_books, name='overdue_books'),
     path('statistics/', views.borrowing_statistics, name='borrowing_statistics'),
+    path('utilization/', views.collection_utilization, name='collection_utilization'),
+    path('demand/', views.peak_demand, name='peak_demand'),
     path('user/<int:user_id>/history/', views.user_borrow_history, name='user_borrow_history'),
+    
+    # Background report jobs
+    path('jobs/', views.report_jobs, name='report_jobs'),
+    path('jobs/<int:job_id>/', views.report_job_detail, name='report_job_detail'),
+    path('jobs/<int:job_id>/cancel/', views.cancel_report_job, name='cancel_report_job'),
+    path('jobs/<int:job_id>/download/', views.download_report_job, name='report_job_download'),
+    
+    # Circulation event outbox
+    path('events/', views.circulation_events, name='circulation_events'),
+    path('events/consumers/<slug:name>/', views.event_consumer, name='event_consumer'),
 ]
@@ -0,0 +1,191 @@
+"""
+Collection utilization and turnover over a date range.
+
+For each title, or each category, over [start, end):
+- loans: loans started in the range;
+- loans_per_copy: loans divided by total_copies;
+- utilization_pct: share of the copies' time spent on loan, counting every
+  loan that overlaps the range, clipped to it (open loans run to now);
+- turnover: loans_per_copy relative to the whole collection's. 1.0 is
+  average use; above it a title or category circulates more than its
+  share of the copies.
+
+Loans are read from the active and archive tables in chunks into columnar
+arrays of (book, borrowed, returned) and summed per book with NumPy when it
+is installed, or in plain Python otherwise. Copy counts are today's
+total_copies.
+"""
+from array import array
+from datetime import datetime, time, timedelta
+
+from django.db.models import FloatField, Func, Q
+from django.utils import timezone
+
+from .models import ArchivedBorrowRecord, BorrowRecord
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+LOAD_CHUNK_SIZE = 20000
+GROUPS = ('title', 'category')
+SORT_FIELDS = ('utilization_pct', 'loans_per_copy', 'turnover', 'loans')
+
+
+def date_range(from_date, to_date):
+    """Aware datetimes bounding whole days from_date..to_date"""
+    start = timezone.make_aware(datetime.combine(from_date, time.min))
+    end = timezone.make_aware(datetime.combine(to_date + timedelta(days=1), time.min))
+    return start, end
+
+
+class EpochSeconds(Func):
+    """Seconds since the Unix epoch of a datetime column, computed by the database"""
+    template = 'CAST(EXTRACT(EPOCH FROM %(expressions)s) AS double precision)'
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # Datetimes are stored as UTC text; julianday() parses them without building datetimes,
+        # rounded to milliseconds to drop its floating point error
+        return self.as_sql(
+            compiler, connection, template='ROUND((julianday(%(expressions)s) - 2440587.5) * 86400.0, 3)', **extra_context
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='UNIX_TIMESTAMP(%(expressions)s)', **extra_context)
+
+
+def overlapping_loans(model, start, end):
+    """Loans in one table overlapping [start, end); open loans run to now"""
+    return model.objects.filter(Q(return_date__isnull=True) | Q(return_date__gt=start), borrow_date__lt=end)
+
+
+def loan_count(start, end):
+    """Loans overlapping [start, end) in the active and archive tables"""
+    return sum(overlapping_loans(model, start, end).count() for model in (BorrowRecord, ArchivedBorrowRecord))
+
+
+def _loan_columns(start, end, progress=None):
+    """
+    Book ids and borrow/return epoch seconds of the loans overlapping
+    [start, end). progress(read, total) is called after every chunk.
+    """
+    book_ids, borrowed, returned = array('q'), array('d'), array('d')
+    now = timezone.now().timestamp()
+    total = loan_count(start, end) if progress else 0
+    for model in (BorrowRecord, ArchivedBorrowRecord):
+        rows = overlapping_loans(model, start, end).order_by().values_list(
+            'book_id', EpochSeconds('borrow_date'), EpochSeconds('return_date')
+        )
+        for book_id, borrow_date, return_date in rows.iterator(chunk_size=LOAD_CHUNK_SIZE):
+            book_ids.append(book_id)
+            borrowed.append(borrow_date)
+            returned.append(now if return_date is None else return_date)
+            if progress and len(book_ids) % LOAD_CHUNK_SIZE == 0:
+                progress(len(book_ids), total)
+    return book_ids, borrowed, returned
+
+
+def _per_book_numpy(catalog_ids, columns, start, end):
+    if not catalog_ids:
+        return [], []
+    book_ids, borrowed, returned = (np.frombuffer(column, dtype=column.typecode) for column in columns)
+    if not len(book_ids):
+        return [0] * len(catalog_ids), [0.0] * len(catalog_ids)
+    catalog_ids = np.asarray(catalog_ids, dtype=np.int64)
+    index = np.searchsorted(catalog_ids, book_ids).clip(0, len(catalog_ids) - 1)
+    # Loans of books added after the catalog was read are left out
+    known = catalog_ids[index] == book_ids
+    index, borrowed, returned = index[known], borrowed[known], returned[known]
+    on_loan = np.clip(np.minimum(returned, end) - np.maximum(borrowed, start), 0, None)
+    started = (borrowed >= start) & (borrowed < end)
+    loans = np.bincount(index, weights=started, minlength=len(catalog_ids))
+    seconds = np.bincount(index, weights=on_loan, minlength=len(catalog_ids))
+    return loans.astype(np.int64).tolist(), seconds.tolist()
+
+
+def _per_book_python(catalog_ids, columns, start, end):
+    position = {book_id: index for index, book_id in enumerate(catalog_ids)}
+    loans, seconds = [0] * len(catalog_ids), [0.0] * len(catalog_ids)
+    for book_id, borrowed, returned in zip(*columns):
+        index = position.get(book_id)
+        if index is None:
+            continue
+        if start <= borrowed < end:
+            loans[index] += 1
+        seconds[index] += max(0.0, min(returned, end) - max(borrowed, start))
+    return loans, seconds
+
+
+def _ratio(numerator, denominator, digits):
+    return round(numerator / denominator, digits) if denominator else None
+
+
+def utilization(start, end, group='title', progress=None):
+    """
+    Utilization rows for every title or category, plus collection totals.
+    Returns {'days', 'summary', 'results'}; results are in catalog order.
+    progress(read, total) follows the loans as they are read.
+    """
+    from books.models import Book
+
+    catalog = list(Book.objects.order_by('id').values_list('id', 'title', 'author', 'category', 'total_copies'))
+    catalog_ids = [row[0] for row in catalog]
+    per_book = _per_book_python if np is None else _per_book_numpy
+    loans, seconds = per_book(
+        catalog_ids, _loan_columns(start, end, progress), start.timestamp(), end.timestamp()
+    )
+
+    if group == 'title':
+        keys = [
+            {'book_id': book_id, 'title': title, 'author': author, 'category': category}
+            for book_id, title, author, category, _ in catalog
+        ]
+        copies = [row[4] for row in catalog]
+    else:
+        totals = {}
+        for (_, _, _, category, total_copies), book_loans, book_seconds in zip(catalog, loans, seconds):
+            entry = totals.setdefault(category, [0, 0, 0.0])
+            entry[0] += total_copies
+            entry[1] += book_loans
+            entry[2] += book_seconds
+        categories = sorted(totals)
+        keys = [{'category': category} for category in categories]
+        copies, loans, seconds = (
+            [totals[category][field] for category in categories] for field in range(3)
+        )
+
+    days = (end - start).total_seconds() / 86400
+    collection_copies, collection_loans = sum(copies), sum(loans)
+    collection_rate = _ratio(collection_loans, collection_copies, 6)
+    results = []
+    for key, group_copies, group_loans, group_seconds in zip(keys, copies, loans, seconds):
+        loan_days = group_seconds / 86400
+        loans_per_copy = _ratio(group_loans, group_copies, 6)
+        results.append({
+            **key,
+            'copies': group_copies,
+            'loans': group_loans,
+            'loan_days': round(loan_days, 1),
+            'loans_per_copy': None if loans_per_copy is None else round(loans_per_copy, 3),
+            'utilization_pct': _ratio(100 * loan_days, group_copies * days, 2),
+            'turnover': _ratio(loans_per_copy or 0, collection_rate, 3) if group_copies else None,
+        })
+
+    return {
+        'days': round(days),
+        'summary': {
+            'copies': collection_copies,
+            'loans': collection_loans,
+            'loans_per_copy': _ratio(collection_loans, collection_copies, 3),
+            'utilization_pct': _ratio(100 * sum(seconds) / 86400, collection_copies * days, 2),
+        },
+        'results': results,
+    }
+
+
+def sort_rows(rows, field):
+    """Largest first; rows without a value (no copies) last"""
+    return sorted(rows, key=lambda row: (row[field] is None, -(row[field] or 0)))
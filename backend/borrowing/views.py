@@ -1,14 +1,102 @@
 from rest_framework import generics, status, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.settings import api_settings
 from rest_framework.response import Response
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse
+from django.urls import reverse
 from django.utils import timezone
-from django.db.models import Q
-from .models import BorrowRecord
+from django.db import transaction
+from django.db.models import Q, Count
+from datetime import datetime, time, timedelta
+from .models import BorrowRecord, ArchivedBorrowRecord, Hold, ReportJob
+from .archive import CombinedHistory, combined_counts
+from . import demand, events, holds, jobs, utilization
+from .pagination import BorrowHistoryPagination
 from .serializers import (
     BorrowRecordSerializer, BorrowBookSerializer, ReturnBookSerializer,
-    StudentBorrowHistorySerializer
+    StudentBorrowHistorySerializer, BorrowHistoryFilterSerializer,
+    CirculationEventSerializer, EventCommitSerializer,
+    HoldSerializer, PlaceHoldSerializer, UtilizationFilterSerializer,
+    PeakDemandFilterSerializer, ReportJobSerializer, SubmitReportJobSerializer
 )
+from books.inventory import shelf_copy
+from books.models import Book
 from users.views import IsAdminUser, IsAdminOrLibrarian
+from users.authentication import get_full_user
+from library_system.db_router import replica_reads
+from library_system.renderers import CSVRenderer
+
+
+def _library_setting(name, default):
+    return getattr(settings, 'LIBRARY_SETTINGS', {}).get(name, default)
+
+
+def _queue_large_report(request, kind, params, start, end):
+    """
+    Submit a report job instead of answering in the request when the range
+    holds more than SYNC_REPORT_MAX_LOANS loans. Returns the 202 response,
+    or None to answer synchronously.
+    """
+    loans = utilization.loan_count(start, end)
+    if loans <= _library_setting('SYNC_REPORT_MAX_LOANS', 200000):
+        return None
+    job = jobs.submit(kind, params, request.user)
+    return Response({
+        'message': f'{loans} loans in range; the report is running as job #{job.id}',
+        'job_id': job.id,
+        'job_url': request.build_absolute_uri(reverse('report_job_detail', args=[job.id])),
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+def _start_of_day(date):
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
+def _filter_borrow_history(queryset, params):
+    if params.get('status'):
+        queryset = queryset.filter(status__in=params['status'])
+    
+    # Compare against day boundaries so the (user, borrow_date) index is usable
+    if params.get('from_date'):
+        queryset = queryset.filter(borrow_date__gte=_start_of_day(params['from_date']))
+    if params.get('to_date'):
+        queryset = queryset.filter(
+            borrow_date__lt=_start_of_day(params['to_date'] + timedelta(days=1))
+        )
+    return queryset
+
+
+def borrow_history_response(request, queryset, serializer_class, archived=None):
+    """
+    Filter a borrow history queryset by the request's query parameters and
+    return either a cursor-paginated page or per-status counts (?summary=true).
+    When an archive queryset is given, both tables are read as one history.
+    """
+    filters = BorrowHistoryFilterSerializer(data=request.query_params)
+    if not filters.is_valid():
+        return Response(filters.errors, status=status.HTTP_400_BAD_REQUEST)
+    params = filters.validated_data
+    
+    querysets = [queryset] if archived is None else [queryset, archived]
+    querysets = [_filter_borrow_history(qs, params) for qs in querysets]
+    
+    if params['summary']:
+        counts = {choice[0]: 0 for choice in BorrowRecord.STATUS_CHOICES}
+        for qs in querysets:
+            for row in qs.order_by().values('status').annotate(count=Count('id')):
+                counts[row['status']] += row['count']
+        return Response({
+            'total': sum(counts.values()),
+            'by_status': counts
+        })
+    
+    history = querysets[0] if archived is None else CombinedHistory(*querysets)
+    paginator = BorrowHistoryPagination()
+    page = paginator.paginate_queryset(history, request)
+    serializer = serializer_class(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(['POST'])
@@ -20,18 +108,45 @@ def borrow_book(request):
         user = serializer.validated_data['user']
         book = serializer.validated_data['book']
         notes = serializer.validated_data.get('notes', '')
+        hold = serializer.validated_data.get('hold')
+        copy = serializer.validated_data.get('copy')
         
-        # Create borrow record
-        borrow_record = BorrowRecord.objects.create(
-            user=user,
-            book=book,
-            librarian=request.user,
-            notes=notes
-        )
-        
-        # Update book availability
-        book.available_copies -= 1
-        book.save()
+        with transaction.atomic():
+            # Lock the book so concurrent checkouts and returns apply their counts in turn
+            book = Book.objects.select_for_update().get(id=book.id)
+            if hold is None and book.available_copies <= 0:
+                return Response(
+                    {'non_field_errors': ['Book is not available']},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if copy is None:
+                # Lend a particular copy so stocktakes do not expect it on the shelf
+                copy = shelf_copy(book, for_hold=hold is not None)
+            
+            # Create borrow record
+            borrow_record = BorrowRecord.objects.create(
+                user=user,
+                book=book,
+                copy=copy,
+                librarian=get_full_user(request),
+                notes=notes
+            )
+            
+            if copy is not None:
+                copy.status = 'on_loan'
+                copy.last_seen_at = borrow_record.borrow_date
+                copy.save(update_fields=['status', 'last_seen_at'])
+            
+            if hold:
+                # The copy was already taken out of availability for this hold
+                hold.status = 'fulfilled'
+                hold.save(update_fields=['status'])
+            else:
+                # Update book availability
+                book.available_copies -= 1
+                book.save(update_fields=['available_copies', 'updated_at'])
+                # A hold still waiting in the queue is met by this loan
+                Hold.objects.filter(user=user, book=book, status='waiting').update(status='fulfilled')
         
         return Response(
             BorrowRecordSerializer(borrow_record).data,
@@ -55,7 +170,7 @@ def return_book(request):
             borrow_record.notes = f"{borrow_record.notes}\nReturn notes: {notes}"
         
         # Return the book
-        borrow_record.return_book(librarian=request.user)
+        borrow_record.return_book(librarian=get_full_user(request))
         
         return Response(
             BorrowRecordSerializer(borrow_record).data,
@@ -75,9 +190,11 @@ def my_borrows(request):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    borrows = BorrowRecord.objects.filter(user=request.user).order_by('-borrow_date')
-    serializer = StudentBorrowHistorySerializer(borrows, many=True)
-    return Response(serializer.data)
+    borrows = BorrowRecord.objects.filter(user=request.user).select_related('book')
+    archived = ArchivedBorrowRecord.objects.filter(user=request.user).select_related('book')
+    return borrow_history_response(
+        request, borrows, StudentBorrowHistorySerializer, archived=archived
+    )
 
 
 @api_view(['GET'])
@@ -93,10 +210,9 @@ def my_current_borrows(request):
     borrows = BorrowRecord.objects.filter(
         user=request.user,
         status__in=['borrowed', 'overdue']
-    ).order_by('-borrow_date')
+    ).select_related('book')
     
-    serializer = StudentBorrowHistorySerializer(borrows, many=True)
-    return Response(serializer.data)
+    return borrow_history_response(request, borrows, StudentBorrowHistorySerializer)
 
 
 class BorrowRecordListView(generics.ListAPIView):
@@ -137,36 +253,121 @@ def overdue_books(request):
     return Response(serializer.data)
 
 
+STATISTICS_CACHE_KEY = 'borrowing:statistics'
+
+
 @api_view(['GET'])
 @permission_classes([IsAdminOrLibrarian])
+@replica_reads
 def borrowing_statistics(request):
-    """Get borrowing statistics (Admin/Librarian only)"""
-    from django.db.models import Count, Avg
-    from datetime import timedelta
-    
-    total_borrows = BorrowRecord.objects.count()
+    """Get borrowing statistics (Admin/Librarian only), cached for STATISTICS_CACHE_SECONDS"""
+    statistics = cache.get(STATISTICS_CACHE_KEY)
+    if statistics is None:
+        statistics = _borrowing_statistics()
+        cache.set(STATISTICS_CACHE_KEY, statistics, _library_setting('STATISTICS_CACHE_SECONDS', 60))
+    return Response(statistics)
+
+
+def _borrowing_statistics():
+    """Totals and the most active students; the full breakdown is the statistics report job"""
+    total_borrows = BorrowRecord.objects.count() + ArchivedBorrowRecord.objects.count()
     active_borrows = BorrowRecord.objects.filter(status__in=['borrowed', 'overdue']).count()
     overdue_borrows = BorrowRecord.objects.filter(status='overdue').count()
     
-    # Most active students
-    active_students = BorrowRecord.objects.values(
-        'user__full_name', 'user__id'
-    ).annotate(
-        borrow_count=Count('id')
-    ).order_by('-borrow_count')[:10]
+    # Most active students, counting archived loans too
+    active_students = [
+        {
+            'user__full_name': row['user__full_name'],
+            'user__id': row['user__id'],
+            'borrow_count': row['count']
+        }
+        for row in combined_counts(('user__full_name', 'user__id'), limit=10)
+    ]
     
     # Recent borrows (last 30 days)
     recent_date = timezone.now() - timedelta(days=30)
-    recent_borrows = BorrowRecord.objects.filter(
-        borrow_date__gte=recent_date
-    ).count()
+    recent_borrows = sum(
+        model.objects.filter(borrow_date__gte=recent_date).count()
+        for model in (BorrowRecord, ArchivedBorrowRecord)
+    )
     
-    return Response({
+    return {
         'total_borrows': total_borrows,
         'active_borrows': active_borrows,
         'overdue_borrows': overdue_borrows,
         'recent_borrows': recent_borrows,
         'active_students': active_students
+    }
+
+
+@api_view(['GET'])
+@renderer_classes([*api_settings.DEFAULT_RENDERER_CLASSES, CSVRenderer])
+@permission_classes([IsAdminOrLibrarian])
+@replica_reads
+def collection_utilization(request):
+    """
+    Loans per copy, share of time on loan and turnover per title or category
+    over a date range (Admin/Librarian only). ?format=csv downloads every row;
+    JSON returns the top `limit` rows by `sort`. Ranges with more loans than
+    SYNC_REPORT_MAX_LOANS are queued as a report job (202).
+    """
+    filters = UtilizationFilterSerializer(data=request.query_params)
+    if not filters.is_valid():
+        return Response(filters.errors, status=status.HTTP_400_BAD_REQUEST)
+    params = filters.validated_data
+    
+    start, end = utilization.date_range(params['from_date'], params['to_date'])
+    queued = _queue_large_report(request, 'utilization', params, start, end)
+    if queued is not None:
+        return queued
+    report = utilization.utilization(start, end, params['group'])
+    rows = utilization.sort_rows(report['results'], params['sort'])
+    
+    if request.accepted_renderer.format == 'csv':
+        filename = f"utilization-{params['group']}-{params['from_date']}-{params['to_date']}.csv"
+        return Response(rows, headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+    return Response({
+        'from_date': params['from_date'],
+        'to_date': params['to_date'],
+        'group': params['group'],
+        'days': report['days'],
+        'summary': report['summary'],
+        'count': len(rows),
+        'results': rows[:params['limit']]
+    })
+
+
+@api_view(['GET'])
+@renderer_classes([*api_settings.DEFAULT_RENDERER_CLASSES, CSVRenderer])
+@permission_classes([IsAdminOrLibrarian])
+@replica_reads
+def peak_demand(request):
+    """
+    Peak simultaneous loans and holds, time with every copy out and a
+    suggested copy count per title over a date range (Admin/Librarian only).
+    ?format=csv downloads every title; JSON returns the top `limit` by `sort`.
+    Ranges with more loans than SYNC_REPORT_MAX_LOANS are queued as a report job (202).
+    """
+    filters = PeakDemandFilterSerializer(data=request.query_params)
+    if not filters.is_valid():
+        return Response(filters.errors, status=status.HTTP_400_BAD_REQUEST)
+    params = filters.validated_data
+    
+    start, end = utilization.date_range(params['from_date'], params['to_date'])
+    queued = _queue_large_report(request, 'peak_demand', params, start, end)
+    if queued is not None:
+        return queued
+    rows = demand.sort_rows(demand.peak_demand(start, end, params['target_pct']), params['sort'])
+    
+    if request.accepted_renderer.format == 'csv':
+        filename = f"peak-demand-{params['from_date']}-{params['to_date']}.csv"
+        return Response(rows, headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+    return Response({
+        'from_date': params['from_date'],
+        'to_date': params['to_date'],
+        'target_pct': params['target_pct'],
+        'count': len(rows),
+        'results': rows[:params['limit']]
     })
 
 
@@ -174,6 +375,198 @@ def borrowing_statistics(request):
 @permission_classes([IsAdminOrLibrarian])
 def user_borrow_history(request, user_id):
     """Get specific user's borrow history (Admin/Librarian only)"""
-    borrows = BorrowRecord.objects.filter(user_id=user_id).order_by('-borrow_date')
-    serializer = BorrowRecordSerializer(borrows, many=True)
+    borrows = BorrowRecord.objects.filter(user_id=user_id).select_related(
+        'user', 'book', 'librarian'
+    )
+    archived = ArchivedBorrowRecord.objects.filter(user_id=user_id).select_related(
+        'user', 'book', 'librarian'
+    )
+    return borrow_history_response(request, borrows, BorrowRecordSerializer, archived=archived)
+
+
+def _batch_size(request):
+    try:
+        return int(request.query_params.get('limit', events.DEFAULT_BATCH_SIZE))
+    except ValueError:
+        return events.DEFAULT_BATCH_SIZE
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminOrLibrarian])
+def circulation_events(request):
+    """Tail the circulation event outbox after a given offset (Admin/Librarian only)"""
+    try:
+        offset = int(request.query_params.get('after', 0))
+    except ValueError:
+        return Response({'error': 'after must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    batch = events.events_after(offset, _batch_size(request))
+    return Response({
+        'events': CirculationEventSerializer(batch, many=True).data,
+        'next_offset': batch[-1].id if batch else offset
+    })
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdminOrLibrarian])
+def event_consumer(request, name):
+    """
+    GET returns the next batch after a consumer's committed offset;
+    POST {"offset": n} commits the consumer's progress (Admin/Librarian only)
+    """
+    if request.method == 'POST':
+        serializer = EventCommitSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        offset = events.commit(name, serializer.validated_data['offset'])
+        return Response({'consumer': name, 'offset': offset})
+    
+    offset, batch = events.poll(name, _batch_size(request))
+    return Response({
+        'consumer': name,
+        'offset': offset,
+        'events': CirculationEventSerializer(batch, many=True).data,
+        'next_offset': batch[-1].id if batch else offset
+    })
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.IsAuthenticated])
+def my_holds(request):
+    """List the current student's active holds with queue positions, or place a new hold"""
+    if not request.user.is_student:
+        return Response(
+            {'error': 'Only students can place holds'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    if request.method == 'POST':
+        serializer = PlaceHoldSerializer(data=request.data, context={'request': request})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        hold = holds.place_hold(request.user, serializer.validated_data['book'])
+        return Response(HoldSerializer(hold).data, status=status.HTTP_201_CREATED)
+    
+    active_holds = Hold.objects.filter(
+        user=request.user,
+        status__in=['waiting', 'ready']
+    ).select_related('book').order_by('created_at')
+    serializer = HoldSerializer(active_holds, many=True)
+    return Response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def hold_position(request, hold_id):
+    """Get the queue position of one of the current user's holds"""
+    try:
+        hold = Hold.objects.get(id=hold_id, user=request.user)
+    except Hold.DoesNotExist:
+        return Response({'error': 'Hold not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response({
+        'id': hold.id,
+        'status': hold.status,
+        'queue_position': holds.queue_position(hold),
+        'expires_at': hold.expires_at
+    })
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def cancel_hold(request, hold_id):
+    """Cancel a hold (the owning student, or Admin/Librarian)"""
+    hold_filter = {'id': hold_id, 'status__in': ['waiting', 'ready']}
+    if request.user.is_student:
+        hold_filter['user'] = request.user
+    
+    try:
+        hold = Hold.objects.get(**hold_filter)
+    except Hold.DoesNotExist:
+        return Response({'error': 'Active hold not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    holds.cancel_hold(hold)
+    return Response(HoldSerializer(hold).data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminOrLibrarian])
+def book_holds(request, book_id):
+    """Get the waiting queue and ready holds for a book (Admin/Librarian only)"""
+    queue = Hold.objects.filter(
+        book_id=book_id,
+        status__in=['waiting', 'ready']
+    ).select_related('book').order_by('position')
+    serializer = HoldSerializer(queue, many=True)
     return Response(serializer.data)
+
+
+JOB_LIST_LIMIT = 50
+
+
+def _get_report_job(request, job_id):
+    """A report job the requester may see: their own, or any for admins"""
+    queryset = ReportJob.objects.filter(id=job_id)
+    if not request.user.is_admin:
+        queryset = queryset.filter(user_id=request.user.id)
+    return queryset.first()
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdminOrLibrarian])
+def report_jobs(request):
+    """
+    List your recent report jobs, or submit one to run in the background
+    (Admin/Librarian only). POST {"kind": ..., "params": {...}} returns 202
+    with the queued job; poll its status and download the result when done.
+    """
+    if request.method == 'GET':
+        recent = ReportJob.objects.filter(user_id=request.user.id)[:JOB_LIST_LIMIT]
+        return Response({
+            'kinds': {kind: spec.description for kind, spec in jobs.JOB_KINDS.items() if spec.submittable},
+            'results': ReportJobSerializer(recent, many=True, context={'request': request}).data
+        })
+    
+    serializer = SubmitReportJobSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    job = jobs.submit(serializer.validated_data['kind'], serializer.validated_data['params'], request.user)
+    return Response(ReportJobSerializer(job, context={'request': request}).data, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminOrLibrarian])
+def report_job_detail(request, job_id):
+    """Status and progress of a report job (Admin/Librarian only)"""
+    job = _get_report_job(request, job_id)
+    if job is None:
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(ReportJobSerializer(job, context={'request': request}).data)
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminOrLibrarian])
+def cancel_report_job(request, job_id):
+    """Cancel a queued job, or stop a running one at its next progress report (Admin/Librarian only)"""
+    job = _get_report_job(request, job_id)
+    if job is None:
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    if job.is_finished:
+        return Response({'error': f'Job has already {job.status}'}, status=status.HTTP_409_CONFLICT)
+    job = jobs.cancel(job)
+    return Response(ReportJobSerializer(job, context={'request': request}).data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminOrLibrarian])
+def download_report_job(request, job_id):
+    """Download the result file of a finished report job (Admin/Librarian only)"""
+    job = _get_report_job(request, job_id)
+    if job is None:
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    if job.status != 'succeeded':
+        return Response({'error': f'Job is {job.status}'}, status=status.HTTP_409_CONFLICT)
+    path = jobs.result_path(job)
+    if path is None:
+        return Response({'error': 'Result file has been removed'}, status=status.HTTP_404_NOT_FOUND)
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=job.result_name)
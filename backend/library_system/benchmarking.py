@@ -0,0 +1,221 @@
+"""
+End-to-end API benchmarks.
+
+Scenarios drive the real URL conf through the Django test client with JWT
+bearer tokens, so authentication, throttling, serializers and queries are
+all exercised. Every request's latency and query count is recorded under
+its endpoint; summaries report p50/p95/p99 latency, throughput and queries
+per request, and can be saved as JSON and compared against an earlier run.
+"""
+import json
+import random
+import time
+from collections import defaultdict
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from .datasets import TITLE_WORDS as SEARCH_WORDS, generate_dataset
+
+
+def seed_dataset(books=2000, students=500, borrows=10000, seed=0):
+    """Generate the benchmark's catalog, users and loan history"""
+    return generate_dataset(
+        books=books, students=students, librarians=2, borrows=borrows,
+        search_logs=borrows // 10, seed=seed
+    )
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class BenchmarkRunner:
+    """Issues requests through the test client and records their cost"""
+
+    def __init__(self, seed=0):
+        from users.models import User
+
+        self.rng = random.Random(seed)
+        self.client = Client()
+        self.samples = defaultdict(list)
+        self.wall_time = defaultdict(float)
+        self.scenario_requests = defaultdict(int)
+        self._requests = 0
+        self._tokens = {}
+        self.admin = User.objects.filter(role='admin').order_by('id').first()
+        self.librarian = User.objects.filter(role='librarian').order_by('id').first()
+        self.students = list(User.objects.filter(role='student').order_by('id')[:500])
+
+    def _token(self, user):
+        from users.tokens import LibraryRefreshToken
+
+        if user.pk not in self._tokens:
+            self._tokens[user.pk] = str(LibraryRefreshToken.for_user(user).access_token)
+        return self._tokens[user.pk]
+
+    def request(self, endpoint, method, path, user=None, data=None):
+        self._requests += 1
+        n = self._requests
+        # Spread requests over client addresses so per-IP throttles stay out of the numbers
+        headers = {'REMOTE_ADDR': f'10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}'}
+        if user is not None:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {self._token(user)}'
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            if method == 'GET':
+                response = self.client.get(path, data, **headers)
+            else:
+                response = self.client.post(path, data, content_type='application/json', **headers)
+            elapsed = time.perf_counter() - started
+        self.samples[endpoint].append((elapsed, len(queries), response.status_code))
+        return response
+
+    def run(self, name, iterations):
+        scenario = SCENARIOS[name]
+        requests_before = self._requests
+        started = time.perf_counter()
+        for _ in range(iterations):
+            scenario(self)
+        self.wall_time[name] += time.perf_counter() - started
+        self.scenario_requests[name] += self._requests - requests_before
+
+    def summary(self):
+        endpoints = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = [elapsed for elapsed, _, _ in samples]
+            query_counts = [count for _, count, _ in samples]
+            total = sum(latencies)
+            endpoints[endpoint] = {
+                'requests': len(samples),
+                'errors': sum(1 for _, _, code in samples if code >= 400),
+                'p50_ms': round(_percentile(latencies, 0.50) * 1000, 3),
+                'p95_ms': round(_percentile(latencies, 0.95) * 1000, 3),
+                'p99_ms': round(_percentile(latencies, 0.99) * 1000, 3),
+                'mean_ms': round(total / len(samples) * 1000, 3),
+                'requests_per_second': round(len(samples) / total, 1) if total else 0.0,
+                'queries_mean': round(sum(query_counts) / len(query_counts), 2),
+                'queries_max': max(query_counts),
+            }
+        scenarios = {
+            name: {
+                'seconds': round(seconds, 3),
+                'requests': self.scenario_requests[name],
+                'requests_per_second': round(self.scenario_requests[name] / seconds, 1) if seconds else 0.0,
+            }
+            for name, seconds in self.wall_time.items()
+        }
+        return {'endpoints': endpoints, 'scenarios': scenarios}
+
+
+def opac_browsing(runner):
+    """Anonymous and signed-in catalog searches, paging and lookups"""
+    rng = runner.rng
+    user = rng.choice([None, rng.choice(runner.students)])
+    word = rng.choice(SEARCH_WORDS)
+    runner.request('GET /api/books/search/', 'GET', '/api/books/search/', user, {'query': word})
+    runner.request('GET /api/books/search/ (page 2)', 'GET', '/api/books/search/', user, {'query': word, 'page': 2})
+    runner.request('GET /api/books/categories/', 'GET', '/api/books/categories/', user)
+    runner.request('GET /api/books/opac/search/', 'GET', '/api/books/opac/search/', user, {'query': word})
+    runner.request('GET /api/books/opac/suggestions/', 'GET', '/api/books/opac/suggestions/', user, {'q': word[:3]})
+
+
+def desk_checkout(runner):
+    """A burst of checkouts at the desk followed by their returns"""
+    from books.models import Book
+    from borrowing.models import BorrowRecord
+
+    rng = runner.rng
+    max_books = 3
+    for _ in range(10):
+        student = rng.choice(runner.students)
+        on_loan = set(BorrowRecord.objects.filter(
+            user=student, return_date__isnull=True
+        ).values_list('book_id', flat=True))
+        if len(on_loan) <= max_books - 2:
+            break
+    else:
+        return
+
+    candidates = Book.objects.filter(available_copies__gt=0).exclude(id__in=on_loan)
+    offset = rng.randint(0, max(0, candidates.count() - 2))
+    record_ids = []
+    for book_id in candidates.order_by('id').values_list('id', flat=True)[offset:offset + 2]:
+        response = runner.request(
+            'POST /api/borrowing/borrow/', 'POST', '/api/borrowing/borrow/', runner.librarian,
+            {'user_id': student.id, 'book_id': book_id}
+        )
+        if response.status_code == 201:
+            record_ids.append(response.json()['id'])
+    for record_id in record_ids:
+        runner.request(
+            'POST /api/borrowing/return/', 'POST', '/api/borrowing/return/', runner.librarian,
+            {'borrow_record_id': record_id}
+        )
+
+
+def dashboard(runner):
+    """Staff dashboards and a student's own loan pages"""
+    student = runner.rng.choice(runner.students)
+    runner.request('GET /api/borrowing/statistics/', 'GET', '/api/borrowing/statistics/', runner.admin)
+    runner.request('GET /api/books/statistics/', 'GET', '/api/books/statistics/', runner.admin)
+    runner.request('GET /api/borrowing/overdue/', 'GET', '/api/borrowing/overdue/', runner.librarian)
+    runner.request('GET /api/borrowing/my-borrows/', 'GET', '/api/borrowing/my-borrows/', student)
+    runner.request('GET /api/borrowing/my-current-borrows/', 'GET', '/api/borrowing/my-current-borrows/', student)
+
+
+def reports(runner):
+    """Bulk listing endpoints used for reports and exports"""
+    rng = runner.rng
+    student = rng.choice(runner.students)
+    runner.request('GET /api/borrowing/records/', 'GET', '/api/borrowing/records/', runner.librarian,
+                   {'page': rng.randint(1, 5)})
+    runner.request('GET /api/borrowing/user/<id>/history/', 'GET',
+                   f'/api/borrowing/user/{student.id}/history/', runner.librarian)
+    runner.request('GET /api/books/search-logs/', 'GET', '/api/books/search-logs/', runner.librarian)
+    runner.request('GET /api/auth/directory/', 'GET', '/api/auth/directory/', runner.librarian,
+                   {'q': 'student1'})
+
+
+SCENARIOS = {
+    'opac': opac_browsing,
+    'checkout': desk_checkout,
+    'dashboard': dashboard,
+    'reports': reports,
+}
+
+
+def compare(current, baseline, threshold=0.2, metric='p95_ms', min_ms=1.0):
+    """
+    Endpoints whose metric grew by more than `threshold` (a fraction) over
+    the baseline, ignoring changes smaller than `min_ms`, or whose query
+    count went up.
+    """
+    regressions = []
+    for endpoint, stats in current['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(endpoint)
+        if before is None:
+            continue
+        old, new = before[metric], stats[metric]
+        if new - old > min_ms and new > old * (1 + threshold):
+            regressions.append(f'{endpoint}: {metric} {old:.2f} -> {new:.2f}')
+        if stats['queries_max'] > before['queries_max']:
+            regressions.append(
+                f"{endpoint}: queries_max {before['queries_max']} -> {stats['queries_max']}"
+            )
+    return regressions
+
+
+def load_results(path):
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def save_results(path, results):
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
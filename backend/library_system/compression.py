@@ -0,0 +1,18 @@
+"""
+Response compression with a size threshold.
+
+Small responses (single records, token refreshes) gain little from gzip and
+cost CPU per request, so only bodies of at least GZIP_MIN_LENGTH bytes are
+compressed. Streaming responses are always compressed.
+"""
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """GZipMiddleware that leaves responses under GZIP_MIN_LENGTH uncompressed"""
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < getattr(settings, 'GZIP_MIN_LENGTH', 1024):
+            return response
+        return super().process_response(request, response)
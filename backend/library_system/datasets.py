@@ -0,0 +1,364 @@
+"""
+Deterministic synthetic data for profiling and benchmarks.
+
+Everything is drawn from one random.Random(seed) and dated relative to a
+fixed `as_of` day, so the same seed, sizes and as_of give identical rows on
+any machine. Categories and book popularity are skewed (popularity follows
+a Zipf curve, so popular titles take a large share of loans), student activity
+is skewed too, and loans are returned on time, late or not at all at
+realistic rates.
+
+Rows are inserted with bulk_create in batches with foreign key checks
+deferred, then checked once per table at the end.
+"""
+import random
+import threading
+from bisect import bisect
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+
+USERNAME_PREFIX = 'gen.'
+
+# auto_now_add fields whose assigned values explicit_dates() keeps, per context
+_explicit_fields = ContextVar('explicit_fields', default=frozenset())
+_wrap_lock = threading.Lock()
+
+CATEGORY_WEIGHTS = {
+    'fiction': 22, 'non-fiction': 12, 'science': 12, 'technology': 10, 'history': 10,
+    'biography': 6, 'education': 12, 'reference': 4, 'literature': 8, 'other': 4,
+}
+TITLE_WORDS = (
+    'river', 'island', 'mountain', 'garden', 'history', 'science', 'journey', 'village', 'ocean',
+    'forest', 'market', 'machine', 'language', 'number', 'energy', 'harvest', 'coast', 'memory',
+    'spirit', 'engineering', 'medicine', 'law', 'trade', 'music', 'storm', 'family', 'nation',
+)
+FIRST_NAMES = (
+    'John', 'Mary', 'Peter', 'Grace', 'James', 'Ruth', 'Michael', 'Esther', 'David', 'Anna',
+    'Joseph', 'Sarah', 'Paul', 'Martha', 'Samuel', 'Lydia', 'Daniel', 'Naomi', 'Thomas', 'Joy',
+)
+LAST_NAMES = (
+    'Kila', 'Wari', 'Tau', 'Namaliu', 'Somare', 'Aisi', 'Kaupa', 'Mek', 'Gima', 'Pokana',
+    'Toua', 'Bani', 'Kuman', 'Nelson', 'Smith', 'Brown', 'Moka', 'Sapi', 'Yama', 'Oa',
+)
+SEARCH_TYPE_WEIGHTS = {'general': 60, 'title': 20, 'author': 10, 'category': 7, 'isbn': 3}
+
+# Loan outcomes: returned on time, returned late, never returned (lost)
+ON_TIME_RATE = 0.84
+LATE_RATE = 0.14
+# Lost loans older than this were eventually returned or written off
+LOST_WRITE_OFF_DAYS = 120
+BOOK_POPULARITY = (0.9, 20)  # Zipf exponent and offset
+
+
+def _library_setting(name, default):
+    return getattr(settings, 'LIBRARY_SETTINGS', {}).get(name, default)
+
+
+def _keep_explicit_values(field):
+    """Wrap the field's pre_save once so it honours _explicit_fields"""
+    with _wrap_lock:
+        if getattr(field, 'keeps_explicit_dates', False):
+            return
+        pre_save = field.pre_save
+
+        def keep_explicit_pre_save(model_instance, add):
+            if field in _explicit_fields.get():
+                return getattr(model_instance, field.attname)
+            return pre_save(model_instance, add)
+
+        field.pre_save = keep_explicit_pre_save
+        field.keeps_explicit_dates = True
+
+
+@contextmanager
+def explicit_dates(model, *field_names):
+    """
+    Let bulk_create keep the given auto_now_add values instead of stamping
+    now. Only saves in the current thread or task are affected; other
+    requests in the process keep the usual timestamps.
+    """
+    fields = [model._meta.get_field(name) for name in field_names]
+    for field in fields:
+        _keep_explicit_values(field)
+    token = _explicit_fields.set(_explicit_fields.get() | frozenset(fields))
+    try:
+        yield
+    finally:
+        _explicit_fields.reset(token)
+
+
+def _zipf_cum_weights(count, exponent, offset=0):
+    """Cumulative Zipf-Mandelbrot weights; the offset flattens the head"""
+    return list(accumulate(1 / (rank + offset) ** exponent for rank in range(1, count + 1)))
+
+
+def _weighted(rng, cum_weights, items):
+    return items[bisect(cum_weights, rng.random() * cum_weights[-1])]
+
+
+class DatasetGenerator:
+    """Generate a library dataset; see generate_dataset()"""
+
+    def __init__(self, seed=0, as_of=None, batch_size=5000, progress=None):
+        self.rng = random.Random(seed)
+        as_of = as_of or timezone.localdate()
+        self.now = timezone.make_aware(datetime.combine(as_of, time(17, 0)))
+        self.batch_size = batch_size
+        self.progress = progress or (lambda message: None)
+
+    def _insert(self, model, objects, label, key):
+        """bulk_create objects and return them with primary keys set; key is a unique field"""
+        objects = list(objects)
+        for start in range(0, len(objects), self.batch_size):
+            batch = objects[start:start + self.batch_size]
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+                if not connection.features.can_return_rows_from_bulk_insert:
+                    # The backend does not return ids from bulk inserts: read them back
+                    ids = dict(model.objects.filter(
+                        **{f'{key}__in': [getattr(obj, key) for obj in batch]}
+                    ).values_list(key, 'id'))
+                    for obj in batch:
+                        obj.pk = ids[getattr(obj, key)]
+        self.progress(f'{label}: {len(objects)}')
+        return objects
+
+    def _insert_stream(self, model, rows, label):
+        """bulk_create rows from a generator without holding them all in memory"""
+        batch, total = [], 0
+        for obj in rows:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                with transaction.atomic():
+                    model.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+                if total % (self.batch_size * 20) == 0:
+                    self.progress(f'{label}: {total}...')
+        if batch:
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+            total += len(batch)
+        self.progress(f'{label}: {total}')
+        return total
+
+    def _date_in_window(self, days):
+        return self.now - timedelta(days=self.rng.random() * days)
+
+    def books(self, count, years):
+        from books.models import Book
+
+        rng = self.rng
+        categories = list(CATEGORY_WEIGHTS)
+        category_cum = list(accumulate(CATEGORY_WEIGHTS.values()))
+        author_count = max(1, count // 4)
+        author_cum = _zipf_cum_weights(author_count, 0.8)
+
+        # Copies follow popularity: book i (in id order) has popularity rank i
+        objects = []
+        for i in range(count):
+            copies = 1 + rng.randint(0, 2) + int(8 / (1 + i / max(1, count // 100)))
+            first_word, second_word = rng.sample(TITLE_WORDS, 2)
+            author = _weighted(rng, author_cum, range(author_count))
+            objects.append(Book(
+                title=f'The {first_word.title()} of the {second_word.title()} {i}',
+                author=f'{FIRST_NAMES[author % len(FIRST_NAMES)]} {LAST_NAMES[author // len(FIRST_NAMES) % len(LAST_NAMES)]} {author}',
+                isbn=f'979{i:010d}',
+                category=_weighted(rng, category_cum, categories),
+                total_copies=copies,
+                available_copies=copies,
+                shelf_location=f'{chr(65 + i % 26)}{i % 9 + 1}-{chr(65 + i // 26 % 26)}{i % 7 + 1}',
+                description=f'A study of {first_word} and {second_word}.',
+                publication_year=self.now.year - min(80, int(rng.expovariate(1 / 12))),
+                publisher=f'{LAST_NAMES[i % len(LAST_NAMES)]} Press',
+                created_at=self._date_in_window(years * 365),
+            ))
+        with explicit_dates(Book, 'created_at'):
+            objects = self._insert(Book, objects, 'books', 'isbn')
+        return [(book.id, book.total_copies) for book in objects]
+
+    def users(self, students, librarians, password, years):
+        from users.models import User
+
+        rng = self.rng
+        password_hash = make_password(password)
+
+        def user(role, n):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            return User(
+                email=f'{role}{n}@generated.example.com',
+                username=f'{USERNAME_PREFIX}{role}{n}',
+                full_name=f'{first} {last}',
+                password=password_hash,
+                role=role,
+                is_staff=role == 'admin',
+                created_at=self._date_in_window(years * 365),
+            )
+
+        objects = [user('admin', 0)]
+        objects += [user('librarian', n) for n in range(librarians)]
+        objects += [user('student', n) for n in range(students)]
+        with explicit_dates(User, 'created_at'):
+            objects = self._insert(User, objects, 'users', 'username')
+        return (
+            [user.id for user in objects if user.role == 'student'],
+            [user.id for user in objects if user.role == 'librarian'],
+        )
+
+    def borrow_records(self, count, books, student_ids, librarian_ids, years):
+        from borrowing.models import BorrowRecord
+
+        rng = self.rng
+        borrow_days = _library_setting('BORROW_PERIOD_DAYS', 14)
+        fine_per_day = Decimal(str(_library_setting('FINE_PER_DAY', 1.0)))
+        max_open = _library_setting('MAX_BOOKS_PER_STUDENT', 3)
+        book_cum = _zipf_cum_weights(len(books), *BOOK_POPULARITY)
+        # Student activity is skewed too, in a shuffled order
+        shuffled_students = list(student_ids)
+        rng.shuffle(shuffled_students)
+        student_cum = _zipf_cum_weights(len(shuffled_students), 0.6)
+        window = years * 365
+
+        open_by_student = {}
+        open_by_book = {}
+        open_pairs = set()
+        total_copies = dict(books)
+        book_ids = [book_id for book_id, _ in books]
+
+        def rows():
+            for _ in range(count):
+                book_id = _weighted(rng, book_cum, book_ids)
+                user_id = _weighted(rng, student_cum, shuffled_students)
+                borrow_date = self._date_in_window(window)
+                due_date = borrow_date + timedelta(days=borrow_days)
+
+                outcome = rng.random()
+                if outcome < ON_TIME_RATE:
+                    return_date = borrow_date + timedelta(days=rng.random() * borrow_days)
+                elif outcome < ON_TIME_RATE + LATE_RATE:
+                    return_date = due_date + timedelta(days=1 + rng.expovariate(1 / 6))
+                elif (self.now - borrow_date).days > LOST_WRITE_OFF_DAYS:
+                    return_date = due_date + timedelta(days=30 + rng.random() * 60)
+                else:
+                    return_date = None
+
+                # Loans whose return lies after as_of are still out, within the borrowing rules
+                if return_date is not None and return_date > self.now:
+                    return_date = None
+                if return_date is None and (
+                    (user_id, book_id) in open_pairs
+                    or open_by_student.get(user_id, 0) >= max_open
+                    or open_by_book.get(book_id, 0) >= total_copies[book_id]
+                ):
+                    return_date = min(self.now, due_date)
+
+                if return_date is None:
+                    open_pairs.add((user_id, book_id))
+                    open_by_student[user_id] = open_by_student.get(user_id, 0) + 1
+                    open_by_book[book_id] = open_by_book.get(book_id, 0) + 1
+                    end = self.now
+                    status = 'overdue' if self.now.date() > due_date.date() else 'borrowed'
+                else:
+                    end = return_date
+                    status = 'returned'
+                days_late = max(0, (end.date() - due_date.date()).days)
+
+                yield BorrowRecord(
+                    user_id=user_id,
+                    book_id=book_id,
+                    borrow_date=borrow_date,
+                    due_date=due_date,
+                    return_date=return_date,
+                    status=status,
+                    fine_amount=days_late * fine_per_day,
+                    librarian_id=rng.choice(librarian_ids) if librarian_ids else None,
+                )
+
+        with explicit_dates(BorrowRecord, 'borrow_date'):
+            total = self._insert_stream(BorrowRecord, rows(), 'borrow records')
+        return total, open_by_book
+
+    def search_logs(self, count, books, student_ids, years):
+        from books.models import Book, OPACSearchLog
+
+        rng = self.rng
+        book_cum = _zipf_cum_weights(len(books), *BOOK_POPULARITY)
+        book_ids = [book_id for book_id, _ in books]
+        types = list(SEARCH_TYPE_WEIGHTS)
+        type_cum = list(accumulate(SEARCH_TYPE_WEIGHTS.values()))
+        categories = list(CATEGORY_WEIGHTS)
+        titles = dict(Book.objects.filter(id__in=book_ids).values_list('id', 'title'))
+
+        def rows():
+            for _ in range(count):
+                search_type = _weighted(rng, type_cum, types)
+                book_id = _weighted(rng, book_cum, book_ids)
+                if search_type == 'category':
+                    query = f'title: author: isbn: category:{rng.choice(categories)}'
+                else:
+                    words = titles[book_id].split()
+                    query = ' '.join(words[1:3]).lower() if search_type == 'general' else words[1]
+                yield OPACSearchLog(
+                    user_id=rng.choice(student_ids) if student_ids and rng.random() < 0.3 else None,
+                    search_query=query,
+                    search_type=search_type,
+                    results_count=int(rng.expovariate(1 / 15)),
+                    timestamp=self._date_in_window(years * 365),
+                )
+
+        with explicit_dates(OPACSearchLog, 'timestamp'):
+            return self._insert_stream(OPACSearchLog, rows(), 'search logs')
+
+    def update_availability(self, books, open_by_book):
+        from books.models import Book
+
+        changed = [
+            Book(id=book_id, available_copies=copies - open_by_book[book_id])
+            for book_id, copies in books if open_by_book.get(book_id)
+        ]
+        for start in range(0, len(changed), self.batch_size):
+            with transaction.atomic():
+                Book.objects.bulk_update(changed[start:start + self.batch_size], ['available_copies'])
+
+
+def generate_dataset(books=100000, students=20000, librarians=10, borrows=2000000, search_logs=500000,
+                     years=3, seed=0, as_of=None, password='student123', batch_size=5000, progress=None):
+    """
+    Create a synthetic library. Returns a dict of row counts. All generated
+    users have usernames starting with USERNAME_PREFIX and the same password.
+    """
+    from books.models import Book, OPACSearchLog
+    from borrowing.models import BorrowRecord
+    from users.models import User
+
+    generator = DatasetGenerator(seed, as_of, batch_size, progress)
+    tables = [model._meta.db_table for model in (Book, User, BorrowRecord, OPACSearchLog)]
+
+    # Foreign keys are checked once per table at the end rather than per row
+    with connection.constraint_checks_disabled():
+        book_rows = generator.books(books, years)
+        student_ids, librarian_ids = generator.users(students, librarians, password, years)
+        borrow_count, open_by_book = generator.borrow_records(
+            borrows, book_rows, student_ids, librarian_ids, years
+        )
+        generator.update_availability(book_rows, open_by_book)
+        log_count = generator.search_logs(search_logs, book_rows, student_ids, years)
+    connection.check_constraints(table_names=tables)
+
+    return {
+        'books': len(book_rows),
+        'users': len(student_ids) + len(librarian_ids) + 1,
+        'borrow_records': borrow_count,
+        'open_loans': sum(open_by_book.values()),
+        'search_logs': log_count,
+        'as_of': generator.now.date().isoformat(),
+    }
@@ -0,0 +1,160 @@
+"""
+Read-replica database routing.
+
+Writes always go to 'default'. Reads go to 'default' too, except inside views
+wrapped with @replica_reads (OPAC, statistics, exports), where they are spread
+over the healthy replica aliases listed in settings.DATABASE_REPLICAS.
+
+After a user's successful write, ReplicaPinningMiddleware pins that user to
+the primary for REPLICA_PIN_SECONDS so they read their own writes despite
+replication lag. Replicas that are missing or fail a query are skipped
+until the next check, falling back to the primary when none are healthy.
+"""
+import os
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import DatabaseError
+
+
+PIN_KEY = 'db:pin:{}'
+
+_use_replica = ContextVar('use_replica', default=False)
+_health = {}
+
+
+def _library_setting(name, default):
+    return getattr(settings, 'LIBRARY_SETTINGS', {}).get(name, default)
+
+
+def _is_healthy(alias):
+    interval = _library_setting('REPLICA_HEALTH_CHECK_SECONDS', 30)
+    healthy, checked_at = _health.get(alias, (True, 0.0))
+    if time.monotonic() - checked_at < interval:
+        return healthy
+
+    connection = connections[alias]
+    if connection.vendor == 'sqlite' and not os.path.exists(connection.settings_dict['NAME']):
+        # Connecting would create an empty file in its place
+        healthy = False
+    else:
+        try:
+            # A query against the schema, not just a connection
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1 FROM django_migrations LIMIT 1')
+            healthy = True
+        except DatabaseError:
+            healthy = False
+    _health[alias] = (healthy, time.monotonic())
+    return healthy
+
+
+def healthy_replicas():
+    return [alias for alias in getattr(settings, 'DATABASE_REPLICAS', []) if _is_healthy(alias)]
+
+
+def pin_to_primary(user_id):
+    cache.set(PIN_KEY.format(user_id), True, _library_setting('REPLICA_PIN_SECONDS', 5))
+
+
+def is_pinned(user_id):
+    return cache.get(PIN_KEY.format(user_id)) is not None
+
+
+def replica_reads(view_func):
+    """
+    Route the view's reads to a replica unless the requesting user recently
+    wrote and is pinned to the primary. Apply below @api_view, or below the
+    decorator that authenticates the request for async views.
+    """
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            user = getattr(request, 'user', None)
+            pinned = (
+                user is not None and user.is_authenticated
+                and await sync_to_async(is_pinned)(user.pk)
+            )
+            # The async ORM runs queries in a thread that inherits this context
+            token = _use_replica.set(not pinned)
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+        return async_wrapper
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        user = getattr(request, 'user', None)
+        pinned = user is not None and user.is_authenticated and is_pinned(user.pk)
+        token = _use_replica.set(not pinned)
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    """Send writes to the primary and opted-in reads to healthy replicas"""
+
+    def db_for_read(self, model, **hints):
+        if not _use_replica.get():
+            return DEFAULT_DB_ALIAS
+        replicas = healthy_replicas()
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """Pin users to the primary for a short while after a successful write"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _should_pin(self, request, response):
+        # DRF copies the authenticated user back onto the Django request
+        user = getattr(request, 'user', None)
+        return (
+            request.method not in ('GET', 'HEAD', 'OPTIONS')
+            and response.status_code < 400
+            and user is not None
+            and user.is_authenticated
+        )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self._should_pin(request, response):
+            pin_to_primary(request.user.pk)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        # Reads never pin, so they skip the thread hop
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            if await sync_to_async(self._should_pin)(request, response):
+                await sync_to_async(pin_to_primary)(request.user.pk)
+        return response
@@ -0,0 +1,318 @@
+"""
+Request, database and cache metrics in Prometheus text format.
+
+Each process counts in plain dicts (a few dict updates per request) and
+every METRICS_FLUSH_SECONDS writes a snapshot to
+METRICS_DIR/<pid>-<process uuid>.json, replacing the file atomically. The
+uuid is drawn once per process, so a worker that reuses a dead worker's
+pid starts a file of its own instead of overwriting the dead one's totals. The /metrics view sums the snapshots of all
+gunicorn workers, so counters survive worker restarts; clear METRICS_DIR
+when the service restarts.
+
+Requests are labelled by URL route (e.g. api/books/<int:pk>/) to keep label
+cardinality bounded. SQL is counted by an execute wrapper attached once to
+every new connection, and cache hits and misses by the instrumented cache
+backends below.
+"""
+import atexit
+import ipaddress
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache as BaseLocMemCache
+from django.core.cache.backends.redis import RedisCache as BaseRedisCache
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'library_http_requests_total': ('counter', 'Requests by route, method and status code'),
+    'library_http_request_duration_seconds': ('histogram', 'Request latency by route'),
+    'library_db_queries_total': ('counter', 'SQL queries run while serving each route'),
+    'library_db_query_seconds_total': ('counter', 'Time spent in SQL while serving each route'),
+    'library_cache_requests_total': ('counter', 'Cache lookups by result (hit or miss)'),
+    'library_metrics_processes': ('gauge', 'Worker processes that have reported metrics'),
+}
+
+_current = ContextVar('metrics_request', default=None)
+_lock = threading.Lock()
+# Hot-path state keyed by raw tuples; labels are only built when snapshotting
+_requests = defaultdict(int)  # (route, method, status) -> count
+_routes = {}  # route -> [latency bucket counts, latency sum, queries, query seconds]
+_counters = defaultdict(float)  # (metric, labels) -> value, for everything else
+_last_flush = 0.0
+_process = (None, None)  # (pid, uuid) naming this process's snapshot file
+
+
+class RequestStats:
+    __slots__ = ('queries', 'query_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+def inc(name, labels, value=1):
+    """labels is a tuple of (name, value) pairs"""
+    with _lock:
+        _counters[(name, labels)] += value
+
+
+def record_request(route, method, status, elapsed, queries, query_seconds):
+    with _lock:
+        _requests[(route, method, status)] += 1
+        stats = _routes.get(route)
+        if stats is None:
+            stats = _routes[route] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0, 0.0]
+        stats[0][bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+        stats[1] += elapsed
+        stats[2] += queries
+        stats[3] += query_seconds
+
+
+def _metrics_dir():
+    return str(getattr(settings, 'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'library-metrics')))
+
+
+def snapshot():
+    with _lock:
+        counters = [[name, list(labels), value] for (name, labels), value in _counters.items()]
+        counters += [
+            ['library_http_requests_total', [['route', route], ['method', method], ['status', str(status)]], count]
+            for (route, method, status), count in _requests.items()
+        ]
+        histograms = []
+        for route, (buckets, total, queries, query_seconds) in _routes.items():
+            labels = [['route', route]]
+            histograms.append(['library_http_request_duration_seconds', labels, list(buckets), total])
+            counters.append(['library_db_queries_total', labels, queries])
+            counters.append(['library_db_query_seconds_total', labels, query_seconds])
+    return {'counters': counters, 'histograms': histograms}
+
+
+def _snapshot_name():
+    global _process
+    pid, process_id = _process
+    # A forked worker inherits the parent's uuid, so draw a new one per pid
+    if pid != os.getpid():
+        pid, process_id = _process = (os.getpid(), uuid.uuid4().hex)
+    return f'{pid}-{process_id}.json'
+
+
+def flush():
+    """Write this process's snapshot for the /metrics view to merge"""
+    global _last_flush
+    _last_flush = time.perf_counter()
+    directory = _metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, _snapshot_name())
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as snapshot_file:
+        json.dump(snapshot(), snapshot_file)
+    os.replace(temp_path, path)
+
+
+atexit.register(flush)
+
+
+def collect():
+    """Merge every process's snapshot into (counters, histograms, process count)"""
+    counters = defaultdict(float)
+    histograms = {}
+    directory = _metrics_dir()
+    processes = 0
+    for name in os.listdir(directory) if os.path.isdir(directory) else []:
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as snapshot_file:
+                data = json.load(snapshot_file)
+        except (OSError, ValueError):
+            continue
+        processes += 1
+        for metric, labels, value in data['counters']:
+            counters[(metric, tuple(map(tuple, labels)))] += value
+        for metric, labels, buckets, total in data['histograms']:
+            key = (metric, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [[0] * len(buckets), 0.0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+    return counters, histograms, processes
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def render():
+    """Prometheus text exposition format (0.0.4)"""
+    counters, histograms, processes = collect()
+    lines = []
+    by_metric = defaultdict(list)
+    for (metric, labels), value in counters.items():
+        by_metric[metric].append((labels, value))
+    for (metric, labels), histogram in histograms.items():
+        by_metric[metric].append((labels, histogram))
+
+    for metric in sorted(by_metric):
+        kind, help_text = HELP.get(metric, ('untyped', metric))
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for labels, value in sorted(by_metric[metric], key=lambda item: item[0]):
+            if kind != 'histogram':
+                lines.append(f'{metric}{_labels(labels)} {value:g}')
+                continue
+            buckets, total = value
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+                cumulative += count
+                lines.append(f'{metric}_bucket{_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{metric}_sum{_labels(labels)} {total:g}')
+            lines.append(f'{metric}_count{_labels(labels)} {cumulative}')
+
+    kind, help_text = HELP['library_metrics_processes']
+    lines += [
+        f'# HELP library_metrics_processes {help_text}',
+        f'# TYPE library_metrics_processes {kind}',
+        f'library_metrics_processes {processes}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - started
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    # At the front of the list, below any context-managed wrappers (e.g.
+    # profiling), which push and pop at the end and so never remove it. Its
+    # order relative to the slow query log does not matter; neither
+    # reads the other's timings
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _count_query)
+
+
+connection_created.connect(_install_query_counter)
+
+
+class MetricsMiddleware:
+    """Record count, latency, status and SQL cost of every request"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.flush_seconds = getattr(settings, 'METRICS_FLUSH_SECONDS', 5)
+        # Connections opened before the middleware loaded missed connection_created
+        for connection in connections.all(initialized_only=True):
+            _install_query_counter(None, connection)
+
+    def _record(self, request, response, started, stats):
+        now = time.perf_counter()
+        match = request.resolver_match
+        record_request(
+            match.route if match is not None else 'unmatched', request.method, response.status_code,
+            now - started, stats.queries, stats.query_seconds
+        )
+        if now - _last_flush >= self.flush_seconds:
+            flush()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, started, stats)
+        return response
+
+
+def _client_allowed(request):
+    networks = getattr(settings, 'METRICS_ALLOWED_NETWORKS', ['127.0.0.1/32', '::1/128'])
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False) for network in networks)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint for internal networks and admins"""
+    from users.authentication import is_admin_request
+
+    if not (_client_allowed(request) or is_admin_request(request)):
+        return HttpResponseForbidden('Forbidden\n')
+    flush()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class CacheMetricsMixin:
+    """Count hits and misses of get(); BaseCache.get_many() goes through get()"""
+    _missing = object()
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self._missing, version)
+        if value is self._missing:
+            inc('library_cache_requests_total', (('result', 'miss'),))
+            return default
+        inc('library_cache_requests_total', (('result', 'hit'),))
+        return value
+
+
+class LocMemCache(CacheMetricsMixin, BaseLocMemCache):
+    pass
+
+
+class RedisCache(CacheMetricsMixin, BaseRedisCache):
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = super().get_many(keys, version)
+        inc('library_cache_requests_total', (('result', 'hit'),), len(found))
+        inc('library_cache_requests_total', (('result', 'miss'),), len(keys) - len(found))
+        return found
@@ -0,0 +1,381 @@
+"""
+On-demand request profiling.
+
+A request is profiled when an admin asks for it with an `X-Profile: 1`
+header or `?profile=1` (use `memory` instead of `1` to add tracemalloc
+allocation statistics), or when it is picked by PROFILE_SAMPLE_RATE. The
+profile holds cProfile stats plus every SQL query's timing, and is written
+to PROFILE_DIR as a .prof file (pstats) and a .json summary. Only the newest
+PROFILE_MAX_FILES profiles are kept.
+
+Under ASGI, work that async views hand to other threads (including async ORM
+queries) is not captured; profile the sync endpoints for full detail.
+
+cProfile (process-wide on Python 3.12+, per thread before, which under ASGI
+means shared by every request on the event loop) and tracemalloc cannot
+run twice at once, so only one request is profiled at a time; a request
+arriving meanwhile is served unprofiled with an X-Profile-Note header.
+"""
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from users.authentication import is_admin_request
+
+
+PROFILE_ID = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$')
+MAX_QUERIES_KEPT = 25
+MAX_SQL_LENGTH = 2000
+MAX_VISITS = 50000  # Bounds speedscope conversion of very branchy profiles
+
+_profile_lock = threading.Lock()
+
+
+def profile_dir():
+    return str(getattr(settings, 'PROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles')))
+
+
+def _requested_mode(request):
+    value = request.headers.get('X-Profile') or request.GET.get('profile')
+    if value in ('1', 'true', 'cpu'):
+        return 'cpu'
+    if value == 'memory':
+        return 'memory'
+    return None
+
+
+def _sampled():
+    rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0.0)
+    return rate > 0 and random.random() < rate
+
+
+class QueryTimer:
+    """connection.execute_wrapper recording each query's duration"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((
+                context['connection'].alias, sql, (time.perf_counter() - started) * 1000, many
+            ))
+
+    def summary(self):
+        repeated = Counter(sql for _, sql, _, _ in self.queries)
+        slowest = sorted(self.queries, key=lambda query: query[2], reverse=True)[:MAX_QUERIES_KEPT]
+        return {
+            'count': len(self.queries),
+            'total_ms': round(sum(query[2] for query in self.queries), 3),
+            'slowest': [
+                {'database': alias, 'sql': sql[:MAX_SQL_LENGTH], 'ms': round(ms, 3), 'many': many}
+                for alias, sql, ms, many in slowest
+            ],
+            # The same statement many times in one request usually means N+1 queries
+            'repeated': [
+                {'sql': sql[:MAX_SQL_LENGTH], 'count': count}
+                for sql, count in repeated.most_common(10) if count > 1
+            ],
+        }
+
+
+class RequestProfile:
+    """Collects cProfile, SQL and optional allocation data for one request"""
+
+    def __init__(self, request, mode, trigger):
+        self.request = request
+        self.mode = mode
+        self.trigger = trigger
+        self.profiler = cProfile.Profile()
+        self.queries = QueryTimer()
+        self.note = None
+        self._connections = []
+        self._holds_lock = False
+        self._started_tracing = False
+
+    def start(self):
+        """Start profiling; False (with a note) when another profile is running"""
+        if not _profile_lock.acquire(blocking=False):
+            self.note = 'Not profiled: another profile was running'
+            return False
+        self._holds_lock = True
+        try:
+            if self.mode == 'memory':
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(10)
+                    self._started_tracing = True
+                self._snapshot = tracemalloc.take_snapshot()
+            self.started = time.perf_counter()
+            self.profiler.enable()
+        except ValueError as exc:
+            # Another profiling tool (e.g. a debugger or coverage) owns the hooks
+            self._release()
+            self.note = f'Not profiled: {exc}'
+            return False
+        except BaseException:
+            self._release()
+            raise
+        # Only once profiling is running, so a failed start leaves no wrapper behind
+        for connection in connections.all():
+            connection.execute_wrappers.append(self.queries)
+            self._connections.append(connection)
+        return True
+
+    def _remove_query_timer(self):
+        # By identity: wrappers installed after ours may not have been removed yet
+        for connection in self._connections:
+            wrappers = connection.execute_wrappers
+            for index in range(len(wrappers) - 1, -1, -1):
+                if wrappers[index] is self.queries:
+                    del wrappers[index]
+        self._connections = []
+
+    def _release(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        if self._holds_lock:
+            self._holds_lock = False
+            _profile_lock.release()
+
+    def discard(self):
+        """Undo start() for a request that raised instead of responding"""
+        self.profiler.disable()
+        self._remove_query_timer()
+        self._release()
+
+    def stop(self, response):
+        self.profiler.disable()
+        duration = (time.perf_counter() - self.started) * 1000
+        self._remove_query_timer()
+
+        allocations = None
+        try:
+            if self.mode == 'memory':
+                snapshot = tracemalloc.take_snapshot()
+                allocations = [
+                    {'location': str(stat.traceback[0]), 'size_kb': round(stat.size_diff / 1024, 1),
+                     'count': stat.count_diff}
+                    for stat in snapshot.compare_to(self._snapshot, 'lineno')[:25]
+                ]
+        finally:
+            self._release()
+
+        now = timezone.now()
+        profile_id = f'{now:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}'
+        user = getattr(self.request, 'user', None)
+        summary = {
+            'id': profile_id,
+            'created_at': now.isoformat(),
+            'method': self.request.method,
+            'path': self.request.get_full_path(),
+            'status': response.status_code,
+            'duration_ms': round(duration, 3),
+            'trigger': self.trigger,
+            'mode': self.mode,
+            'user_id': user.pk if user is not None and getattr(user, 'is_authenticated', False) else None,
+            'sql': self.queries.summary(),
+            'allocations': allocations,
+        }
+        save_profile(profile_id, self.profiler, summary)
+        response['X-Profile-Id'] = profile_id
+        return response
+
+
+def save_profile(profile_id, profiler, summary):
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    profiler.dump_stats(os.path.join(directory, f'{profile_id}.prof'))
+    with open(os.path.join(directory, f'{profile_id}.json'), 'w') as summary_file:
+        json.dump(summary, summary_file)
+    prune_profiles()
+
+
+def prune_profiles():
+    """Delete the oldest profiles beyond PROFILE_MAX_FILES"""
+    keep = getattr(settings, 'PROFILE_MAX_FILES', 200)
+    directory = profile_dir()
+    ids = sorted(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+    for profile_id in ids[:max(0, len(ids) - keep)]:
+        for suffix in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles():
+    """Stored profile summaries, newest first, without their SQL detail"""
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith('.json'):
+            continue
+        try:
+            summary = load_profile(name[:-5])
+        except (OSError, ValueError):
+            continue
+        summary['sql'] = {key: summary['sql'][key] for key in ('count', 'total_ms')}
+        summary.pop('allocations', None)
+        profiles.append(summary)
+    return profiles
+
+
+def profile_path(profile_id, suffix):
+    """Path of a stored profile file, or None for unknown or malformed ids"""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(profile_dir(), profile_id + suffix)
+    return path if os.path.exists(path) else None
+
+
+def load_profile(profile_id):
+    path = profile_path(profile_id, '.json')
+    if path is None:
+        raise FileNotFoundError(profile_id)
+    with open(path) as summary_file:
+        return json.load(summary_file)
+
+
+def to_speedscope(profile_id, min_fraction=0.0005):
+    """
+    Convert a stored cProfile into speedscope's sampled format. cProfile keeps
+    caller/callee totals rather than stacks, so each callee's time is split
+    across a caller's stacks in proportion to that caller's time in each.
+    """
+    stats = pstats.Stats(profile_path(profile_id, '.prof')).stats
+    frames, frame_index = [], {}
+    samples, weights = [], []
+    visits = [0]
+
+    def frame(func):
+        if func not in frame_index:
+            filename, line, name = func
+            frame_index[func] = len(frames)
+            frames.append({'name': name, 'file': filename, 'line': line})
+        return frame_index[func]
+
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge))
+    # Entry points are functions with calls from outside the profiled region;
+    # recursive wrappers (e.g. middleware) are both entry points and callees
+    roots = []
+    for func, (_, calls, _, _, callers) in stats.items():
+        external = calls - sum(edge[1] for edge in callers.values())
+        if external > 0 and func[2] != "<method 'disable' of '_lsprof.Profiler' objects>":
+            roots.append((func, external / calls))
+    total = sum(stats[func][3] * share for func, share in roots) or 1.0
+
+    def walk(func, stack, fraction):
+        # fraction: share of func's total cumulative time spent under this stack
+        _, _, self_time, cumulative, _ = stats[func]
+        # Recursive calls fold into the outermost one, whose cumulative time includes them
+        if cumulative * fraction < total * min_fraction or func in stack or visits[0] >= MAX_VISITS:
+            return
+        visits[0] += 1
+        stack = stack + [func]
+        if self_time * fraction > 0:
+            samples.append([frame(f) for f in stack])
+            weights.append(self_time * fraction)
+        for callee, (_, _, _, edge_cumulative) in callees.get(func, []):
+            callee_cumulative = stats[callee][3]
+            if callee_cumulative:
+                # Recursion can make an edge's time exceed the callee's outermost total
+                walk(callee, stack, min(1.0, edge_cumulative / callee_cumulative) * fraction)
+
+    for root, share in roots:
+        walk(root, [], share)
+
+    summary = load_profile(profile_id)
+    name = f"{summary['method']} {summary['path']}"
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights,
+        }],
+        'name': name,
+        'exporter': 'library_system.profiling',
+    }
+
+
+class ProfilingMiddleware:
+    """Profile requests that an admin asked for or that were sampled"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        mode, trigger = _requested_mode(request), 'requested'
+        if mode is not None and not is_admin_request(request):
+            mode = None
+        if mode is None and _sampled():
+            mode, trigger = 'cpu', 'sampled'
+        if mode is None:
+            return self.get_response(request)
+
+        profile = RequestProfile(request, mode, trigger)
+        if not profile.start():
+            response = self.get_response(request)
+            response['X-Profile-Note'] = profile.note
+            return response
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            profile.discard()
+            raise
+        return profile.stop(response)
+
+    async def __acall__(self, request):
+        mode, trigger = _requested_mode(request), 'requested'
+        if mode is not None and not await sync_to_async(is_admin_request)(request):
+            mode = None
+        if mode is None and _sampled():
+            mode, trigger = 'cpu', 'sampled'
+        if mode is None:
+            return await self.get_response(request)
+
+        profile = RequestProfile(request, mode, trigger)
+        if not profile.start():
+            response = await self.get_response(request)
+            response['X-Profile-Note'] = profile.note
+            return response
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            profile.discard()
+            raise
+        profile.profiler.disable()
+        return await sync_to_async(profile.stop)(response)
@@ -0,0 +1,106 @@
+"""
+Fast JSON, MessagePack and CSV renderers.
+
+orjson and msgpack are optional: without orjson the JSON renderer falls back
+to DRF's encoder, and MessagePack is only offered (see REST_FRAMEWORK in
+settings) when msgpack is installed. Types orjson and msgpack cannot encode
+natively, and datetimes, go through DRF's JSONEncoder so the output matches
+what the default renderer produces.
+
+CSV cells holding text that starts like a formula are prefixed with a quote
+so spreadsheets show it instead of evaluating it (CSV injection).
+"""
+import csv
+import io
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+_encoder = JSONEncoder()
+
+# Leading characters that make spreadsheets treat a cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def encode_default(obj):
+    """Convert what the fast encoders cannot handle, like DRF's JSONEncoder"""
+    return _encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer backed by orjson for compact responses"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Indented output (e.g. Accept: application/json; indent=4) keeps DRF's formatting
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(
+            data, default=encode_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+        # Escape the line separators JavaScript rejects in string literals, as DRF does
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """application/msgpack for bulk-sync clients; request it with Accept or ?format=msgpack"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
+
+
+def escape_formula(value):
+    """Prefix text a spreadsheet would evaluate with a quote; other values pass through"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def write_csv(output, rows):
+    """Write flat dicts as CSV with a header from the first row's keys"""
+    writer = csv.DictWriter(output, fieldnames=list(rows[0]) if rows else [], extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows({key: escape_formula(value) for key, value in row.items()} for row in rows)
+
+
+class CSVRenderer(BaseRenderer):
+    """text/csv downloads of report rows: a list of flat dicts, or the 'results' of a report"""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict):
+            # A report's rows, or a single record such as a validation error
+            rows = data['results'] if 'results' in data else [{
+                key: '; '.join(map(str, value)) if isinstance(value, list) else value
+                for key, value in data.items()
+            }]
+        else:
+            rows = data
+        buffer = io.StringIO()
+        write_csv(buffer, rows)
+        return buffer.getvalue().encode(self.charset)
@@ -3,8 +3,11 @@ Django settings for library_system project.
 """
 
 import os
+import tempfile
+from importlib.util import find_spec
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
+from django.core.exceptions import ImproperlyConfigured
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -39,14 +42,19 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'library_system.metrics.MetricsMiddleware',
+    'library_system.slow_queries.SlowQueryMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'library_system.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'library_system.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'library_system.db_router.ReplicaPinningMiddleware',
 ]
 
 ROOT_URLCONF = 'library_system.urls'
@@ -77,6 +85,59 @@ DATABASES = {
     }
 }
 
+# Concurrency tuning for SQLite deployments (WAL, pragmas, IMMEDIATE transactions)
+if config('SQLITE_TUNING', default=True, cast=bool):
+    from .sqlite import database_options
+    DATABASES['default']['OPTIONS'] = database_options(
+        cache_size=config('SQLITE_CACHE_SIZE', default=-64000, cast=int),
+        mmap_size=config('SQLITE_MMAP_SIZE', default=268435456, cast=int),
+        busy_timeout=config('SQLITE_BUSY_TIMEOUT', default=20000, cast=int),
+    )
+
+# Send low-priority writes (search logs) through one background writer thread
+ASYNC_LOW_PRIORITY_WRITES = config('ASYNC_LOW_PRIORITY_WRITES', default=False, cast=bool)
+
+# Request profiling (library_system.profiling): admins opt in per request with
+# an X-Profile header or ?profile=1; a sample rate > 0 also profiles that share of traffic
+PROFILE_DIR = config('PROFILE_DIR', default=str(BASE_DIR / 'profiles'))
+PROFILE_SAMPLE_RATE = config('PROFILE_SAMPLE_RATE', default=0.0, cast=float)
+PROFILE_MAX_FILES = config('PROFILE_MAX_FILES', default=200, cast=int)
+
+# Background report jobs (borrowing.jobs), run by `manage.py run_report_jobs`. Result
+# files are kept JOB_RESULT_DAYS; a running job silent for JOB_STALE_SECONDS is marked failed
+JOB_RESULT_DIR = config('JOB_RESULT_DIR', default=str(BASE_DIR / 'job_results'))
+JOB_WORKERS = config('JOB_WORKERS', default=2, cast=int)
+JOB_RESULT_DAYS = config('JOB_RESULT_DAYS', default=7, cast=int)
+JOB_STALE_SECONDS = config('JOB_STALE_SECONDS', default=300, cast=int)
+
+# Prometheus metrics (library_system.metrics). Every worker writes snapshots to
+# METRICS_DIR; clear it when the service restarts
+METRICS_DIR = config('METRICS_DIR', default=os.path.join(tempfile.gettempdir(), 'library-metrics'))
+METRICS_FLUSH_SECONDS = config('METRICS_FLUSH_SECONDS', default=5, cast=int)
+METRICS_ALLOWED_NETWORKS = config('METRICS_ALLOWED_NETWORKS', default='127.0.0.1/32,::1/128', cast=Csv())
+
+# Responses smaller than this many bytes are sent uncompressed (library_system.compression)
+GZIP_MIN_LENGTH = config('GZIP_MIN_LENGTH', default=1024, cast=int)
+
+# Slow-query log (library_system.slow_queries): queries slower than SLOW_QUERY_MS and
+# statements run SLOW_QUERY_REPEAT+ times in one request, ranked by `manage.py slow_queries`
+SLOW_QUERY_MS = config('SLOW_QUERY_MS', default=100, cast=float)
+SLOW_QUERY_REPEAT = config('SLOW_QUERY_REPEAT', default=10, cast=int)
+SLOW_QUERY_LOG = config('SLOW_QUERY_LOG', default=str(BASE_DIR / 'slow_queries.log'))
+SLOW_QUERY_FLUSH_SECONDS = config('SLOW_QUERY_FLUSH_SECONDS', default=60, cast=int)
+SLOW_QUERY_MAX_FINGERPRINTS = config('SLOW_QUERY_MAX_FINGERPRINTS', default=500, cast=int)
+
+# Read replicas used for OPAC, statistics and export reads (library_system.db_router).
+# DB_REPLICAS is a comma-separated list of SQLite files, or of hosts for PostgreSQL.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(config('DB_REPLICAS', default='', cast=Csv()), start=1):
+    alias = f'replica{index}'
+    location = 'NAME' if 'sqlite3' in DATABASES['default']['ENGINE'] else 'HOST'
+    DATABASES[alias] = {**DATABASES['default'], location: replica, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['library_system.db_router.ReplicaRouter']
+
 # For production, use PostgreSQL:
 # DATABASES = {
 #     'default': {
@@ -124,13 +185,33 @@ AUTH_USER_MODEL = 'users.User'
 # Django REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.RoleClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson-backed JSON when installed (library_system.renderers), MessagePack when msgpack is
+    'DEFAULT_RENDERER_CLASSES': [
+        'library_system.renderers.FastJSONRenderer',
+        *(['library_system.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'library_system.parsers.FastJSONParser',
+        *(['library_system.parsers.MessagePackParser'] if find_spec('msgpack') else []),
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # Requests allowed per sliding window for library_system.throttling
+    'DEFAULT_THROTTLE_RATES': {
+        'opac_anon': config('THROTTLE_OPAC_ANON', default='60/min'),
+        'opac_user': config('THROTTLE_OPAC_USER', default='120/min'),
+        'auth': config('THROTTLE_AUTH', default='10/min'),
+    },
+    # X-Forwarded-For entries to trust when identifying clients behind a proxy
+    'NUM_PROXIES': config('NUM_PROXIES', default=None, cast=lambda v: None if v in (None, '') else int(v)),
 }
 
 # JWT Settings
@@ -160,8 +241,49 @@ SIMPLE_JWT = {
     'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
     
     'JTI_CLAIM': 'jti',
+    
+    # Rebuild role claims from the database whenever a token is refreshed
+    'TOKEN_REFRESH_SERIALIZER': 'users.tokens.RoleClaimsTokenRefreshSerializer',
+}
+
+# Cache (user objects, token claim revocations). With several workers use a
+# shared backend, e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='library-system'),
+    }
 }
 
+# Per-process caches are not seen by the other workers
+SHARED_CACHE = CACHES['default']['BACKEND'].rsplit('.', 1)[-1] not in ('LocMemCache', 'DummyCache')
+
+# Trust the role claims in access tokens instead of loading the user on every request
+# (users.authentication). Revocations live in the cache, so this needs a shared one
+ROLE_CLAIMS_AUTH = config('ROLE_CLAIMS_AUTH', default=SHARED_CACHE, cast=bool)
+if ROLE_CLAIMS_AUTH and not SHARED_CACHE:
+    raise ImproperlyConfigured(
+        'ROLE_CLAIMS_AUTH needs a cache shared by every worker (e.g. CACHE_BACKEND='
+        'django.core.cache.backends.redis.RedisCache); revocations in a per-process cache '
+        'only reach the worker that made them'
+    )
+
+# Web server worker processes (read by gunicorn too). Rate limit counters live in
+# the cache, so a per-process one would multiply every limit by the worker count
+WEB_CONCURRENCY = config('WEB_CONCURRENCY', default=1, cast=int)
+if WEB_CONCURRENCY > 1 and not SHARED_CACHE:
+    raise ImproperlyConfigured(
+        f'WEB_CONCURRENCY={WEB_CONCURRENCY} needs a cache shared by every worker (e.g. CACHE_BACKEND='
+        'django.core.cache.backends.redis.RedisCache); with a per-process cache rate limits and '
+        'token revocations only apply per worker'
+    )
+
+# Use the hit/miss counting subclasses (library_system.metrics) where available
+CACHES['default']['BACKEND'] = {
+    'django.core.cache.backends.locmem.LocMemCache': 'library_system.metrics.LocMemCache',
+    'django.core.cache.backends.redis.RedisCache': 'library_system.metrics.RedisCache',
+}.get(CACHES['default']['BACKEND'], CACHES['default']['BACKEND'])
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",  # React development server
@@ -175,4 +297,25 @@ LIBRARY_SETTINGS = {
     'MAX_BOOKS_PER_STUDENT': 3,
     'BORROW_PERIOD_DAYS': 14,
     'FINE_PER_DAY': 1.0,  # PGK per day for overdue books
+    'ARCHIVE_AFTER_DAYS': 365,  # Returned loans older than this move to the archive table
+    'ARCHIVE_BATCH_SIZE': 1000,
+    'MAX_HOLDS_PER_STUDENT': 5,
+    'HOLD_EXPIRY_DAYS': 30,  # Waiting holds lapse after this many days
+    'HOLD_PICKUP_DAYS': 3,  # Days a student has to collect a copy set aside for them
+    'DUE_SOON_DAYS': 2,  # Send a reminder this many days before the due date
+    'USER_CACHE_TTL': 60,  # Seconds a full user object is cached for views that need it
+    'REPLICA_PIN_SECONDS': 5,  # Reads stay on the primary this long after a user's write
+    'REPLICA_HEALTH_CHECK_SECONDS': 30,
+    'SYNC_REPORT_MAX_LOANS': 200000,  # Larger utilization/demand ranges are queued as report jobs
+    'STATISTICS_CACHE_SECONDS': 60,  # Dashboard statistics are recomputed at most this often
 }
+
+# Email (reminder notices). Use the filebased or locmem backend for testing.
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+EMAIL_FILE_PATH = config('EMAIL_FILE_PATH', default=str(BASE_DIR / 'sent_emails'))
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='library@balimocollege.edu.pg')
@@ -0,0 +1,281 @@
+"""
+Slow-query log.
+
+An execute wrapper on every connection times each query. Queries slower than
+SLOW_QUERY_MS are aggregated by fingerprint (the SQL with literals and
+placeholder lists normalized away) together with the view that ran them and
+a summary of the project frames on the stack. Statements repeated at least
+SLOW_QUERY_REPEAT times within one request are recorded as well, under kind
+'repeated', since N+1 queries are usually fast one by one.
+
+Each process keeps at most SLOW_QUERY_MAX_FINGERPRINTS aggregates and every
+SLOW_QUERY_FLUSH_SECONDS appends them as JSON lines to SLOW_QUERY_LOG, where
+`manage.py slow_queries` ranks them.
+"""
+import atexit
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import traceback
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+
+MAX_SQL_LENGTH = 2000
+MAX_SAMPLES = 100  # Durations kept per fingerprint for the p95
+MAX_VIEWS = 10
+STACK_DEPTH = 6
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:(?:%s|\?)\s*,\s*)+(?:%s|\?)\s*\)')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_WHITESPACE = re.compile(r'\s+')
+
+_request = ContextVar('slow_query_request', default=None)
+_lock = threading.Lock()
+_store = {}
+_last_flush = time.monotonic()
+_project_root = str(settings.BASE_DIR)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def normalize(sql):
+    """SQL with literals replaced by ? and IN lists of any length collapsed"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    """(fingerprint id, normalized SQL)"""
+    normalized = normalize(sql)
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12], normalized
+
+
+def stack_summary():
+    """Innermost project frames outside this module, e.g. books/views.py:88 in opac_search"""
+    frames = []
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        filename = frame.filename
+        if not filename.startswith(_project_root) or 'site-packages' in filename or filename == __file__:
+            continue
+        frames.append(f'{os.path.relpath(filename, _project_root)}:{frame.lineno} in {frame.name}')
+        if len(frames) == STACK_DEPTH:
+            break
+    return frames
+
+
+def _current_view():
+    state = _request.get()
+    if state is not None:
+        return state.view
+    if len(sys.argv) > 1 and sys.argv[0].endswith('manage.py'):
+        return f'manage.py {sys.argv[1]}'
+    return 'unknown'
+
+
+class RequestQueries:
+    """Per-request view name and count/time of each statement"""
+    __slots__ = ('view', 'statements')
+
+    def __init__(self):
+        self.view = 'unresolved'
+        self.statements = {}
+
+
+def record(kind, sql, ms, view, stack, count=1):
+    """Add one occurrence to the fingerprint's aggregate"""
+    key, normalized = fingerprint(sql)
+    with _lock:
+        entry = _store.get((kind, key))
+        if entry is None:
+            if len(_store) >= _setting('SLOW_QUERY_MAX_FINGERPRINTS', 500):
+                # Make room by dropping the aggregate that has cost the least so far
+                del _store[min(_store, key=lambda item: _store[item]['total_ms'])]
+            entry = _store[(kind, key)] = {
+                'kind': kind, 'fingerprint': key, 'sql': normalized[:MAX_SQL_LENGTH],
+                'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'samples': [],
+                'views': {}, 'stack': stack, 'example': sql[:MAX_SQL_LENGTH],
+            }
+        entry['count'] += 1
+        entry['total_ms'] += ms
+        if count > 1:
+            entry['max_repeats'] = max(entry.get('max_repeats', 0), count)
+        if ms > entry['max_ms']:
+            entry['max_ms'] = ms
+            entry['stack'] = stack
+            entry['example'] = sql[:MAX_SQL_LENGTH]
+        samples = entry['samples']
+        if len(samples) < MAX_SAMPLES:
+            samples.append(ms)
+        else:
+            # Reservoir sampling keeps a uniform sample for the p95
+            slot = random.randrange(entry['count'])
+            if slot < MAX_SAMPLES:
+                samples[slot] = ms
+        views = entry['views']
+        if view in views or len(views) < MAX_VIEWS:
+            views[view] = views.get(view, 0) + 1
+    _maybe_flush()
+
+
+def _log_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        ms = (time.perf_counter() - started) * 1000
+        state = _request.get()
+        if state is not None:
+            statement = state.statements.get(sql)
+            if statement is None:
+                state.statements[sql] = [1, ms, None]
+            else:
+                statement[0] += 1
+                statement[1] += ms
+                if statement[0] == _setting('SLOW_QUERY_REPEAT', 10):
+                    # The loop issuing the repeats is on the stack now
+                    statement[2] = stack_summary()
+        if ms >= _setting('SLOW_QUERY_MS', 100):
+            record('slow', sql, ms, _current_view(), stack_summary())
+
+
+def _install_query_log(sender, connection, **kwargs):
+    # At the front of the list, below any context-managed wrappers (e.g.
+    # profiling), which push and pop at the end and so never remove it. Its
+    # order relative to the metrics query counter does not matter; neither
+    # reads the other's timings
+    if _log_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _log_query)
+
+
+connection_created.connect(_install_query_log)
+
+
+def _maybe_flush():
+    if time.monotonic() - _last_flush >= _setting('SLOW_QUERY_FLUSH_SECONDS', 60):
+        flush()
+
+
+def flush():
+    """Append this process's aggregates to SLOW_QUERY_LOG and start afresh"""
+    global _last_flush
+    with _lock:
+        entries = list(_store.values())
+        _store.clear()
+        _last_flush = time.monotonic()
+    if not entries:
+        return
+    flushed_at = timezone.now().isoformat()
+    pid = os.getpid()
+    lines = [json.dumps({**entry, 'flushed_at': flushed_at, 'pid': pid}) for entry in entries]
+    path = _setting('SLOW_QUERY_LOG', os.path.join(_project_root, 'slow_queries.log'))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # One write per flush keeps lines from different workers whole
+    with open(path, 'a') as log_file:
+        log_file.write('\n'.join(lines) + '\n')
+
+
+atexit.register(flush)
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def load(path=None, since=None):
+    """Merge the log's aggregates by (kind, fingerprint); since filters by flush time"""
+    path = path or _setting('SLOW_QUERY_LOG', os.path.join(_project_root, 'slow_queries.log'))
+    merged = {}
+    with open(path) as log_file:
+        for line in log_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if since is not None and entry['flushed_at'] < since.isoformat():
+                continue
+            key = (entry['kind'], entry['fingerprint'])
+            total = merged.get(key)
+            if total is None:
+                merged[key] = {**entry, 'views': dict(entry['views']), 'samples': list(entry['samples'])}
+                continue
+            if entry['max_ms'] > total['max_ms']:
+                total.update(max_ms=entry['max_ms'], stack=entry['stack'], example=entry['example'])
+            total['count'] += entry['count']
+            total['total_ms'] += entry['total_ms']
+            total['samples'] += entry['samples']
+            total['max_repeats'] = max(total.get('max_repeats', 0), entry.get('max_repeats', 0))
+            for view, count in entry['views'].items():
+                total['views'][view] = total['views'].get(view, 0) + count
+    for entry in merged.values():
+        entry['p95_ms'] = _percentile(entry.pop('samples'), 0.95)
+        entry['mean_ms'] = entry['total_ms'] / entry['count']
+    return list(merged.values())
+
+
+class SlowQueryMiddleware:
+    """Name the view behind each query and record statements repeated within a request"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Connections opened before the middleware loaded missed connection_created
+        for connection in connections.all(initialized_only=True):
+            _install_query_log(None, connection)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _request.get()
+        if state is not None:
+            state.view = request.resolver_match.view_name or request.resolver_match._func_path
+        return None
+
+    def _finish(self, state):
+        threshold = _setting('SLOW_QUERY_REPEAT', 10)
+        for sql, (count, ms, stack) in state.statements.items():
+            if count >= threshold:
+                record('repeated', sql, ms, state.view, stack, count)
+        _maybe_flush()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = RequestQueries()
+        token = _request.set(state)
+        try:
+            return self.get_response(request)
+        finally:
+            _request.reset(token)
+            self._finish(state)
+
+    async def __acall__(self, request):
+        state = RequestQueries()
+        token = _request.set(state)
+        try:
+            return await self.get_response(request)
+        finally:
+            _request.reset(token)
+            self._finish(state)
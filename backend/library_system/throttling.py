@@ -0,0 +1,94 @@
+"""
+Sliding window throttles for the public OPAC and authentication endpoints.
+
+Each client may make `num_requests` requests per period, configured through
+REST_FRAMEWORK's DEFAULT_THROTTLE_RATES (e.g. 'opac_anon': '60/min'). Requests
+are counted per fixed window with cache.add and cache.incr, which are atomic
+on every backend, so concurrent requests cannot both spend the last slot; the
+previous window's count is weighted by how much of it still overlaps the
+sliding window. Counters live in the default cache, so limits hold across
+workers only when CACHES points at a shared backend (see WEB_CONCURRENCY).
+Each check costs an add, an incr and a get.
+"""
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """Sliding window throttle keyed by user id when authenticated, else client IP"""
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = f'user-{request.user.pk}'
+        else:
+            ident = f'ip-{self.get_ident(request)}'
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def _count(self, key):
+        self.cache.add(key, 0, self.duration * 2)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Evicted between add and incr
+            self.cache.add(key, 1, self.duration * 2)
+            return 1
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        now = self.timer()
+        window = int(now // self.duration)
+        current_key = f'{self.key}:{window}'
+        count = self._count(current_key)
+        previous = self.cache.get(f'{self.key}:{window - 1}', 0)
+        overlap = 1 - (now - window * self.duration) / self.duration
+        if previous * overlap + count <= self.num_requests:
+            return True
+
+        # Refused requests do not count against the client
+        try:
+            self.cache.decr(current_key)
+        except ValueError:
+            pass
+        excess = previous * overlap + count - self.num_requests
+        if previous:
+            self.retry_after = min(excess * self.duration / previous, self.duration)
+        else:
+            self.retry_after = overlap * self.duration
+        return False
+
+    def wait(self):
+        return getattr(self, 'retry_after', None)
+
+
+class AnonOPACThrottle(SlidingWindowThrottle):
+    """Public catalog endpoints for anonymous clients, per IP"""
+    scope = 'opac_anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return super().get_cache_key(request, view)
+
+
+class UserOPACThrottle(SlidingWindowThrottle):
+    """Public catalog endpoints for signed-in users, per user"""
+    scope = 'opac_user'
+
+    def get_cache_key(self, request, view):
+        if not (request.user and request.user.is_authenticated):
+            return None
+        return super().get_cache_key(request, view)
+
+
+class AuthThrottle(SlidingWindowThrottle):
+    """Login, registration and token refresh, per IP"""
+    scope = 'auth'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': f'ip-{self.get_ident(request)}'}
@@ -7,6 +7,9 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
     TokenVerifyView,
 )
+from .throttling import AuthThrottle
+from . import views
+from .metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -17,6 +20,14 @@ urlpatterns = [
     path('api/borrowing/', include('borrowing.urls')),
     
     # JWT token endpoints
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/refresh/', TokenRefreshView.as_view(throttle_classes=[AuthThrottle]), name='token_refresh'),
     path('api/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
+    
+    # Prometheus metrics (internal networks and admins)
+    path('metrics', metrics_view, name='metrics'),
+    
+    # Request profiles (Admin only)
+    path('api/profiles/', views.profile_list, name='profile_list'),
+    path('api/profiles/<str:profile_id>/', views.profile_detail, name='profile_detail'),
+    path('api/profiles/<str:profile_id>/download/', views.profile_download, name='profile_download'),
 ]
@@ -0,0 +1,48 @@
+"""
+Admin endpoints for stored request profiles (library_system.profiling).
+"""
+import json
+
+from django.http import FileResponse, HttpResponse
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from users.views import IsAdminUser
+
+from .profiling import list_profiles, load_profile, profile_path, to_speedscope
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_list(request):
+    """Stored request profiles, newest first (Admin only)"""
+    return Response(list_profiles())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_detail(request, profile_id):
+    """Summary, SQL timings and allocations of one profile (Admin only)"""
+    try:
+        return Response(load_profile(profile_id))
+    except FileNotFoundError:
+        return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_download(request, profile_id):
+    """Download a profile as pstats (?output=pstats, default) or speedscope JSON (Admin only)"""
+    path = profile_path(profile_id, '.prof')
+    if path is None:
+        return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    output = request.query_params.get('output', 'pstats')
+    if output == 'speedscope':
+        response = HttpResponse(json.dumps(to_speedscope(profile_id)), content_type='application/json')
+        response['Content-Disposition'] = f'attachment; filename="{profile_id}.speedscope.json"'
+        return response
+    if output != 'pstats':
+        return Response({'error': 'output must be pstats or speedscope'}, status=status.HTTP_400_BAD_REQUEST)
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{profile_id}.prof')
@@ -0,0 +1,132 @@
+"""
+In-process queue for low-priority writes.
+
+SQLite allows one writer at a time, so request threads that each insert a
+search log or notice row contend for the write lock with checkouts. Objects
+handed to enqueue() are instead collected by a single background thread and
+written with one bulk_create per model and batch, inside one transaction.
+
+Enabled with ASYNC_LOW_PRIORITY_WRITES; otherwise (and when the queue is
+full) enqueue() writes synchronously. Only use it for rows nothing reads
+back within the same request. A batch that fails is retried, then written
+row by row so only rows that fail on their own are dropped (and logged);
+rows whose loss would change behaviour (e.g. NoticeLog, which stops notices
+being sent twice) should be written directly instead.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from itertools import groupby
+
+from django.conf import settings
+from django.db import connection, transaction
+
+
+logger = logging.getLogger(__name__)
+
+MAX_QUEUED = 10000
+MAX_BATCH = 500
+RETRIES = 3
+RETRY_DELAY = 0.5  # Seconds, doubled after each failed attempt
+
+_queue = queue.Queue(maxsize=MAX_QUEUED)
+_writer = None
+_writer_pid = None
+_lock = threading.Lock()
+
+
+def _write(items):
+    """items: [(model, ignore_conflicts, obj), ...]"""
+    key = lambda item: (item[0]._meta.label, item[1])
+    with transaction.atomic():
+        for (_, ignore_conflicts), group in groupby(sorted(items, key=key), key=key):
+            group = list(group)
+            group[0][0].objects.bulk_create(
+                [obj for _, _, obj in group], ignore_conflicts=ignore_conflicts
+            )
+
+
+def _run():
+    while True:
+        items = [_queue.get()]
+        while len(items) < MAX_BATCH:
+            try:
+                items.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _write_with_retries(items)
+        finally:
+            connection.close_if_unusable_or_obsolete()
+            for _ in items:
+                _queue.task_done()
+
+
+def _write_with_retries(items):
+    # Lock timeouts and dropped connections usually clear up after a moment
+    for attempt in range(RETRIES):
+        try:
+            _write(items)
+            return
+        except Exception:
+            logger.warning('Queued low-priority writes failed (attempt %d)', attempt + 1, exc_info=True)
+            connection.close_if_unusable_or_obsolete()
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+
+    # Keep every row that can be written on its own
+    dropped = 0
+    for item in items:
+        try:
+            _write([item])
+        except Exception:
+            dropped += 1
+            logger.exception('Dropped queued %s write', item[0]._meta.label)
+    if dropped:
+        logger.error('Dropped %d of %d queued low-priority writes', dropped, len(items))
+
+
+def _ensure_writer():
+    global _writer, _writer_pid
+    # A forked worker inherits the queue but not the thread
+    if _writer is not None and _writer_pid == os.getpid() and _writer.is_alive():
+        return
+    with _lock:
+        if _writer is None or _writer_pid != os.getpid() or not _writer.is_alive():
+            _writer = threading.Thread(target=_run, name='low-priority-writer', daemon=True)
+            _writer.start()
+            _writer_pid = os.getpid()
+
+
+def enabled():
+    return getattr(settings, 'ASYNC_LOW_PRIORITY_WRITES', False)
+
+
+def enqueue(objects, ignore_conflicts=False):
+    """Insert unsaved model instances, in the background when enabled"""
+    objects = list(objects)
+    if not objects:
+        return
+
+    if enabled():
+        _ensure_writer()
+        try:
+            for obj in objects:
+                _queue.put_nowait((type(obj), ignore_conflicts, obj))
+            return
+        except queue.Full:
+            logger.warning('Low-priority write queue full, writing synchronously')
+            objects = objects[objects.index(obj):]
+
+    _write([(type(obj), ignore_conflicts, obj) for obj in objects])
+
+
+def flush():
+    """Block until everything queued so far has been written"""
+    if _writer is not None and _writer.is_alive():
+        _queue.join()
+
+
+atexit.register(flush)
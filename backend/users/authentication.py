@@ -0,0 +1,114 @@
+"""
+Stateless JWT authentication using role claims.
+
+RoleClaimsJWTAuthentication builds request.user from the token's signed
+claims instead of querying the users table. The resulting User instance has
+only id, role, is_active and is_superuser loaded; views that need the full
+object call get_full_user(), which goes through a short-TTL cache that
+never holds the password hash.
+
+Role claims are revoked by revoke_role_claims(), which User.save() calls
+whenever role or account flags change. Tokens issued before the revocation
+are rejected until the client refreshes or logs in again.
+
+Revocations are kept in the cache, so trusting claims is only safe when
+every worker shares it. ROLE_CLAIMS_AUTH is therefore on by default only
+with a shared CACHE_BACKEND (settings refuse to start otherwise); without
+it the user is loaded from the database on every request.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+from .tokens import CLAIMS_ISSUED_AT, ROLE_CLAIMS
+
+
+USER_CACHE_KEY = 'auth:user:{}'
+REVOKED_KEY = 'auth:claims-revoked:{}'
+
+
+def _user_cache_ttl():
+    return getattr(settings, 'LIBRARY_SETTINGS', {}).get('USER_CACHE_TTL', 60)
+
+
+def get_cached_user(user_id):
+    """
+    User object with every field but the password hash, served from the
+    cache for USER_CACHE_TTL seconds. The hash never goes into the cache;
+    reading user.password loads it from the database.
+    """
+    key = USER_CACHE_KEY.format(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = User.objects.defer('password').filter(id=user_id).first()
+        if user is not None:
+            cache.set(key, user, _user_cache_ttl())
+    return user
+
+
+def invalidate_cached_user(user_id):
+    cache.delete(USER_CACHE_KEY.format(user_id))
+
+
+def get_full_user(request):
+    """request.user with every field loaded, for views that need more than role"""
+    user = request.user
+    # The cached user still defers the password, so only claim-built users are swapped
+    if user.is_authenticated and user.get_deferred_fields() - {'password'}:
+        return get_cached_user(user.id) or user
+    return user
+
+
+def revoke_role_claims(user_id, at_time):
+    """Reject tokens for this user whose claims were issued before at_time"""
+    lifetime = api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+    cache.set(REVOKED_KEY.format(user_id), at_time.timestamp(), int(lifetime) + 60)
+    invalidate_cached_user(user_id)
+
+
+def claims_revoked(user_id, issued_at):
+    """Whether claims issued at issued_at (epoch seconds) predate the user's last revocation"""
+    revoked_at = cache.get(REVOKED_KEY.format(user_id))
+    return revoked_at is not None and issued_at < revoked_at
+
+
+class RoleClaimsJWTAuthentication(JWTAuthentication):
+    """JWT authentication that trusts signed role claims instead of loading the user"""
+
+    def get_user(self, validated_token):
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        # iat is whole seconds; the claims' own sub-second stamp is compared when present
+        issued_at = validated_token.get(CLAIMS_ISSUED_AT, validated_token.get('iat', 0))
+        if claims_revoked(user_id, issued_at):
+            raise AuthenticationFailed('Token claims have been revoked', code='token_revoked')
+
+        # Without a shared cache, and for tokens issued before role claims existed, load the user
+        if not settings.ROLE_CLAIMS_AUTH or any(claim not in validated_token for claim in ROLE_CLAIMS):
+            return super().get_user(validated_token)
+        if not validated_token['is_active']:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+
+        # from_db expects values in concrete field order; the rest stay deferred
+        claims = {'id': user_id, **{claim: validated_token[claim] for claim in ROLE_CLAIMS}}
+        field_names = [f.attname for f in User._meta.concrete_fields if f.attname in claims]
+        return User.from_db(DEFAULT_DB_ALIAS, field_names, [claims[name] for name in field_names])
+
+
+def is_admin_request(request):
+    """
+    Whether a plain Django request comes from an admin, by bearer token claims
+    or session. For middleware and non-DRF views.
+    """
+    try:
+        result = RoleClaimsJWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        result = None
+    user = result[0] if result else getattr(request, 'user', None)
+    return bool(
+        user is not None and user.is_authenticated
+        and (getattr(user, 'role', None) == 'admin' or user.is_superuser)
+    )
@@ -0,0 +1,203 @@
+"""
+Bulk student enrollment from CSV.
+
+Rows are validated against AUTH_PASSWORD_VALIDATORS and de-duplicated
+(within the file and against the database in one query, emails compared
+case-insensitively), passwords are hashed across a process pool since PBKDF2
+dominates the cost, and users are inserted with bulk_create one batch at a
+time.
+
+Hashing a large file takes minutes, so the upload endpoint only validates
+the file and leaves the import to a background job (borrowing.jobs); the
+`import_students` command runs it directly.
+"""
+import csv
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .models import User
+
+
+REQUIRED_COLUMNS = ('email', 'username', 'full_name', 'password')
+# Below this many rows a process pool costs more than it saves
+PARALLEL_THRESHOLD = 50
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _hash_password(raw_password):
+    return make_password(raw_password)
+
+
+@contextmanager
+def password_hasher(count, workers=None):
+    """
+    A function hashing a list of passwords in order, backed by one process
+    pool for all the batches of an import of count passwords
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or count < PARALLEL_THRESHOLD:
+        yield lambda passwords: [_hash_password(password) for password in passwords]
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        def hash_batch(passwords):
+            chunksize = max(1, len(passwords) // (workers * 4))
+            return list(executor.map(_hash_password, passwords, chunksize=chunksize))
+        yield hash_batch
+
+
+def hash_passwords(passwords, workers=None):
+    """Hash passwords in parallel, preserving order"""
+    with password_hasher(len(passwords), workers) as hash_batch:
+        return hash_batch(passwords)
+
+
+def _password_problem(row):
+    """The validators' complaint about a row's password, or None"""
+    user = User(email=row['email'], username=row['username'], full_name=row['full_name'])
+    try:
+        validate_password(row['password'], user=user)
+    except ValidationError as exc:
+        return ' '.join(exc.messages)
+    return None
+
+
+def parse_rows(csv_file):
+    """
+    Read and validate CSV rows. Returns (valid rows, rejected rows), where
+    each row carries its 1-based line number and rejected rows a reason.
+    """
+    if isinstance(csv_file, bytes):
+        csv_file = io.StringIO(csv_file.decode('utf-8-sig'))
+    reader = csv.DictReader(csv_file)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValidationError(f"CSV is missing columns: {', '.join(missing)}")
+
+    valid, rejected = [], []
+    seen_emails, seen_usernames = set(), set()
+    for line, raw in enumerate(reader, start=2):
+        row = {column: (raw.get(column) or '').strip() for column in REQUIRED_COLUMNS}
+        row['email'] = row['email'].lower()
+        row['line'] = line
+
+        reason = None
+        if not all(row[column] for column in REQUIRED_COLUMNS):
+            reason = 'Missing required value'
+        elif row['email'] in seen_emails:
+            reason = 'Duplicate email in file'
+        elif row['username'] in seen_usernames:
+            reason = 'Duplicate username in file'
+        else:
+            try:
+                validate_email(row['email'])
+            except ValidationError:
+                reason = 'Invalid email'
+            else:
+                reason = _password_problem(row)
+
+        if reason:
+            rejected.append({'line': line, 'email': row['email'], 'reason': reason})
+        else:
+            seen_emails.add(row['email'])
+            seen_usernames.add(row['username'])
+            valid.append(row)
+    return valid, rejected
+
+
+def exclude_existing(rows):
+    """
+    Split rows into new ones and ones clashing with existing users (one
+    query). File emails are already lower case; stored ones are compared
+    through the LOWER(email) index.
+    """
+    emails = [row['email'] for row in rows]
+    usernames = [row['username'] for row in rows]
+    existing_emails, existing_usernames = set(), set()
+    for email, username in User.objects.annotate(email_key=Lower('email')).filter(
+        Q(email_key__in=emails) | Q(username__in=usernames)
+    ).values_list('email', 'username'):
+        existing_emails.add(email.lower())
+        existing_usernames.add(username)
+
+    new_rows, rejected = [], []
+    for row in rows:
+        if row['email'] in existing_emails:
+            rejected.append({'line': row['line'], 'email': row['email'], 'reason': 'Email already registered'})
+        elif row['username'] in existing_usernames:
+            rejected.append({'line': row['line'], 'email': row['email'], 'reason': 'Username already taken'})
+        else:
+            new_rows.append(row)
+    return new_rows, rejected
+
+
+def _insert_batch(users, rows, rejected):
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+        return len(users)
+    except IntegrityError:
+        pass
+
+    # A row raced with another insert; fall back to row-by-row for this batch
+    created = 0
+    for user, row in zip(users, rows):
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create([user])
+            created += 1
+        except IntegrityError:
+            rejected.append({'line': row['line'], 'email': row['email'], 'reason': 'Already exists'})
+    return created
+
+
+def import_students(csv_file, batch_size=500, workers=None, dry_run=False, progress=None):
+    """
+    Import students from a CSV with email, username, full_name and password
+    columns. Returns {'created': n, 'rejected': [...]} with rejected rows
+    sorted by line number.
+    """
+    rows, rejected = parse_rows(csv_file)
+    rows, clashes = exclude_existing(rows)
+    rejected += clashes
+
+    created = 0
+    if rows and not dry_run:
+        with password_hasher(len(rows), workers) as hash_batch:
+            for start in range(0, len(rows), batch_size):
+                batch_rows = rows[start:start + batch_size]
+                hashes = hash_batch([row['password'] for row in batch_rows])
+                users = [
+                    User(
+                        email=row['email'],
+                        username=row['username'],
+                        full_name=row['full_name'],
+                        password=password_hash,
+                        role='student'
+                    )
+                    for row, password_hash in zip(batch_rows, hashes)
+                ]
+                created += _insert_batch(users, batch_rows, rejected)
+                if progress:
+                    progress(created, len(rows))
+
+    rejected.sort(key=lambda row: row['line'])
+    return {
+        'created': created,
+        'valid': len(rows),
+        'rejected': rejected
+    }
@@ -0,0 +1,42 @@
+"""
+Management command to bulk-enroll students from a CSV file
+"""
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from users.importing import import_students
+
+
+class Command(BaseCommand):
+    help = 'Import students from a CSV with email, username, full_name and password columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', help='Path to the CSV file')
+        parser.add_argument('--batch-size', type=int, default=500, help='Users inserted per bulk_create')
+        parser.add_argument('--workers', type=int, help='Password hashing processes (default: CPU count)')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the file without creating users')
+
+    def handle(self, *args, **options):
+        progress = lambda created, total: self.stdout.write(f'  {created}/{total} students created')
+        try:
+            with open(options['csv_path'], encoding='utf-8-sig', newline='') as csv_file:
+                result = import_students(
+                    csv_file,
+                    batch_size=options['batch_size'],
+                    workers=options['workers'],
+                    dry_run=options['dry_run'],
+                    progress=progress
+                )
+        except (OSError, ValidationError) as exc:
+            raise CommandError(str(exc))
+
+        for row in result['rejected']:
+            self.stdout.write(self.style.WARNING(f"Line {row['line']} ({row['email']}): {row['reason']}"))
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f"{result['valid']} rows would be imported, {len(result['rejected'])} rejected"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Created {result['created']} students, {len(result['rejected'])} rows rejected"
+            ))
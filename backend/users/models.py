@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Lower
 
 
 class User(AbstractUser):
@@ -23,6 +25,40 @@ class User(AbstractUser):
     def __str__(self):
         return f"{self.full_name} ({self.role})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored claim values so save() can detect changes
+        instance._loaded_claims = instance._claims()
+        return instance
+    
+    def _claims(self):
+        from .tokens import ROLE_CLAIMS
+        deferred = self.get_deferred_fields()
+        return {claim: getattr(self, claim) for claim in ROLE_CLAIMS if claim not in deferred}
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        
+        from django.utils import timezone
+        from .authentication import invalidate_cached_user, revoke_role_claims
+        loaded = getattr(self, '_loaded_claims', {})
+        current = self._claims()
+        if any(claim in current and current[claim] != value for claim, value in loaded.items()):
+            # Role or account flags changed: tokens carrying the old claims must go
+            revoke_role_claims(self.pk, timezone.now())
+        else:
+            invalidate_cached_user(self.pk)
+        self._loaded_claims = current
+    
+    def delete(self, *args, **kwargs):
+        from django.utils import timezone
+        from .authentication import revoke_role_claims
+        user_id = self.pk
+        result = super().delete(*args, **kwargs)
+        revoke_role_claims(user_id, timezone.now())
+        return result
+    
     @property
     def is_admin(self):
         return self.role == 'admin'
@@ -37,3 +73,9 @@ class User(AbstractUser):
     
     class Meta:
         db_table = 'users'
+        indexes = [
+            # Case-insensitive prefix search in the user directory
+            models.Index(F('role'), Lower('full_name'), name='user_role_name_lower_idx'),
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+            models.Index(Lower('username'), name='user_username_lower_idx'),
+        ]
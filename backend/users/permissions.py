@@ -153,10 +153,23 @@ class RoleMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
 
+    def _get_user(self, request):
+        # Prefer the signed role claims of a bearer token, which need no query
+        from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+        from .authentication import RoleClaimsJWTAuthentication
+        try:
+            result = RoleClaimsJWTAuthentication().authenticate(request)
+        except (InvalidToken, AuthenticationFailed):
+            result = None
+        if result is not None:
+            return result[0]
+        return getattr(request, 'user', None)
+
     def __call__(self, request):
         # Add role information to request
-        if hasattr(request, 'user') and request.user.is_authenticated:
-            request.user_role = getattr(request.user, 'role', None)
+        user = self._get_user(request)
+        if user is not None and user.is_authenticated:
+            request.user_role = getattr(user, 'role', None)
             request.is_admin = request.user_role == 'admin'
             request.is_librarian = request.user_role in ['admin', 'librarian']
             request.is_student = request.user_role == 'student'
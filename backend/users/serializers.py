@@ -69,3 +69,15 @@ class UserCreateSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         return User.objects.create_user(**validated_data)
+
+
+class UserDirectorySerializer(serializers.ModelSerializer):
+    """Minimal user fields for borrower pickers"""
+    class Meta:
+        model = User
+        fields = ('id', 'full_name', 'email', 'username', 'role')
+
+
+class StudentImportJobSerializer(serializers.Serializer):
+    """Parameters of a background student import: the stored upload to read"""
+    upload = serializers.RegexField(r'^[0-9a-f]{32}\.csv$')
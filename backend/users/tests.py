@@ -1,3 +1,125 @@
-from django.test import TestCase
+import os
+import pickle
+import tempfile
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient, APIRequestFactory
+
+from borrowing.jobs import claim_next, run_job, upload_path
+from borrowing.models import ReportJob
+from library_system.throttling import AuthThrottle
+from .authentication import USER_CACHE_KEY, get_cached_user
+from .models import User
+from .tokens import LibraryRefreshToken
+
+
+class RoleClaimsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='librarian@example.com', username='librarian', full_name='Librarian',
+            password='pass12345', role='librarian'
+        )
+        self.client = APIClient()
+
+    def get_statistics(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        return self.client.get('/api/borrowing/statistics/')
+
+    @override_settings(ROLE_CLAIMS_AUTH=True)
+    def test_demotion_revokes_old_claims_but_not_a_token_refreshed_straight_after(self):
+        refresh = LibraryRefreshToken.for_user(self.user)
+        self.assertEqual(self.get_statistics(refresh.access_token).status_code, 200)
+
+        self.user.role = 'student'
+        self.user.save()
+        self.assertEqual(self.get_statistics(refresh.access_token).status_code, 401)
+
+        # Within the same second as the revocation
+        refreshed = self.client.post('/api/token/refresh/', {'refresh': str(refresh)})
+        self.assertEqual(refreshed.status_code, 200, refreshed.data)
+        self.assertEqual(self.get_statistics(refreshed.data['access']).status_code, 403)
+
+    def test_cached_users_leave_the_password_hash_out(self):
+        get_cached_user(self.user.id)
+        cached = cache.get(USER_CACHE_KEY.format(self.user.id))
+        self.assertIn('password', cached.get_deferred_fields())
+        self.assertNotIn(self.user.password, pickle.dumps(cached).decode('latin-1'))
+        # Still there when something asks for it
+        self.assertTrue(cached.check_password('pass12345'))
+
+    @override_settings(ROLE_CLAIMS_AUTH=False)
+    def test_without_a_shared_cache_the_user_is_loaded_on_every_request(self):
+        access = LibraryRefreshToken.for_user(self.user).access_token
+        # A change no revocation was recorded for, as another worker would see it
+        User.objects.filter(id=self.user.id).update(role='student')
+        self.assertEqual(self.get_statistics(access).status_code, 403)
+
+
+@override_settings(JOB_RESULT_DIR=tempfile.mkdtemp())
+class StudentImportTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            email='admin@example.com', username='admin', full_name='Admin',
+            password='pass12345', role='admin', is_staff=True
+        )
+        User.objects.create_user(
+            email='Taken@Example.com', username='taken', full_name='Taken',
+            password='pass12345', role='student'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def upload(self, rows, **data):
+        content = 'email,username,full_name,password\n' + ''.join(f'{",".join(row)}\n' for row in rows)
+        csv_file = SimpleUploadedFile('students.csv', content.encode(), content_type='text/csv')
+        return self.client.post('/api/auth/students/import/', {'file': csv_file, **data}, format='multipart')
+
+    def test_rows_are_checked_at_once_and_created_by_a_job(self):
+        response = self.upload([
+            ('new@example.com', 'new', 'New Student', 'correct-horse-battery'),
+            ('taken@example.COM', 'other', 'Other Student', 'correct-horse-battery'),
+            ('weak@example.com', 'weak', 'Weak Password', '12345678'),
+        ])
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertEqual(response.data['valid'], 1)
+        self.assertEqual([problem['line'] for problem in response.data['rejected']], [3, 4])
+        self.assertFalse(User.objects.filter(username='new').exists())
+
+        job = ReportJob.objects.get(id=response.data['job']['id'])
+        self.assertEqual(job.kind, 'import_students')
+        run_job(claim_next('test'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'succeeded', job.error)
+        self.assertTrue(User.objects.get(username='new').check_password('correct-horse-battery'))
+        self.assertFalse(os.path.exists(upload_path(job.params['upload'])))
+
+    def test_dry_run_queues_nothing(self):
+        response = self.upload([('new@example.com', 'new', 'New Student', 'correct-horse-battery')], dry_run='true')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertFalse(ReportJob.objects.exists())
+
+
+class AuthThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def throttle(self, now):
+        throttle = AuthThrottle()
+        throttle.rate = '2/min'
+        throttle.num_requests, throttle.duration = throttle.parse_rate(throttle.rate)
+        throttle.timer = lambda: now
+        return throttle
+
+    def allowed(self, now):
+        request = APIRequestFactory().post('/api/auth/login/')
+        return self.throttle(now).allow_request(request, None)
+
+    def test_limit_slides_across_windows(self):
+        start = 600.0
+        self.assertEqual([self.allowed(start), self.allowed(start + 1), self.allowed(start + 2)], [True, True, False])
+        # Half way into the next window, the two requests still weigh one
+        self.assertEqual([self.allowed(start + 90), self.allowed(start + 91)], [True, False])
+        self.assertTrue(self.allowed(start + 125))
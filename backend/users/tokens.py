@@ -0,0 +1,50 @@
+"""
+JWT tokens carrying signed role claims.
+
+Access tokens issued at login/registration include the user's role and
+account flags so permission checks can run without loading the user row.
+Refreshing a token re-reads those claims from the database.
+"""
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+ROLE_CLAIMS = ('role', 'is_active', 'is_superuser')
+CLAIMS_ISSUED_AT = 'claims_at'  # Epoch seconds with a fraction, unlike iat
+
+
+def add_role_claims(token, user):
+    for claim in ROLE_CLAIMS:
+        token[claim] = getattr(user, claim)
+    token[CLAIMS_ISSUED_AT] = timezone.now().timestamp()
+    return token
+
+
+class LibraryRefreshToken(RefreshToken):
+    """Refresh token whose access tokens carry the user's role claims"""
+
+    @classmethod
+    def for_user(cls, user):
+        return add_role_claims(super().for_user(user), user)
+
+
+class RoleClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh that rebuilds role claims from the current user row"""
+
+    def validate(self, attrs):
+        from .models import User
+
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(
+            **{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]}
+        ).first()
+        if user is None or not user.is_active:
+            raise InvalidToken('User not found or inactive')
+
+        # Stamp a new issue time so the refreshed claims outlive any revocation
+        add_role_claims(refresh, user)
+        refresh.set_iat()
+        return super().validate({**attrs, 'refresh': str(refresh)})
@@ -11,6 +11,9 @@ urlpatterns = [
     # User management (Admin only)
     path('users/', views.UserListCreateView.as_view(), name='user_list_create'),
     path('users/<int:pk>/', views.UserDetailView.as_view(), name='user_detail'),
+    path('users/<int:pk>/revoke-tokens/', views.revoke_user_tokens, name='revoke_user_tokens'),
     path('students/', views.students_list, name='students_list'),
+    path('students/import/', views.import_students_csv, name='import_students'),
     path('librarians/', views.librarians_list, name='librarians_list'),
+    path('directory/', views.user_directory, name='user_directory'),
 ]
@@ -1,12 +1,21 @@
 from rest_framework import generics, status, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+from library_system.changelists import prefix_range
+from library_system.throttling import AuthThrottle
+from .authentication import get_full_user, revoke_role_claims
+from .importing import import_students
 from .models import User
+from .pagination import UserDirectoryPagination
+from .tokens import LibraryRefreshToken
 from .serializers import (
     UserRegistrationSerializer, UserLoginSerializer, UserSerializer,
-    UserProfileSerializer, UserCreateSerializer
+    UserProfileSerializer, UserCreateSerializer, UserDirectorySerializer
 )
 
 
@@ -26,6 +35,7 @@ class IsAdminOrLibrarian(permissions.BasePermission):
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([AuthThrottle])
 def register(request):
     """Register a new user (public endpoint for students)"""
     serializer = UserRegistrationSerializer(data=request.data)
@@ -35,7 +45,7 @@ def register(request):
         validated_data['role'] = 'student'
         
         user = serializer.save()
-        refresh = RefreshToken.for_user(user)
+        refresh = LibraryRefreshToken.for_user(user)
         
         return Response({
             'user': UserSerializer(user).data,
@@ -50,12 +60,13 @@ def register(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([AuthThrottle])
 def login(request):
     """Login user and return JWT tokens"""
     serializer = UserLoginSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.validated_data['user']
-        refresh = RefreshToken.for_user(user)
+        refresh = LibraryRefreshToken.for_user(user)
         
         return Response({
             'user': UserSerializer(user).data,
@@ -72,7 +83,7 @@ def login(request):
 @permission_classes([permissions.IsAuthenticated])
 def profile(request):
     """Get current user profile"""
-    serializer = UserProfileSerializer(request.user)
+    serializer = UserProfileSerializer(get_full_user(request))
     return Response(serializer.data)
 
 
@@ -81,7 +92,7 @@ def profile(request):
 def update_profile(request):
     """Update current user profile"""
     serializer = UserProfileSerializer(
-        request.user, 
+        get_full_user(request), 
         data=request.data, 
         partial=request.method == 'PATCH'
     )
@@ -129,3 +140,78 @@ def librarians_list(request):
     librarians = User.objects.filter(role='librarian')
     serializer = UserSerializer(librarians, many=True)
     return Response(serializer.data)
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def revoke_user_tokens(request, pk):
+    """Reject all current access tokens of a user, forcing a token refresh (Admin only)"""
+    if not User.objects.filter(pk=pk).exists():
+        return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    revoke_role_claims(pk, timezone.now())
+    return Response({'message': 'Tokens revoked'})
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def import_students_csv(request):
+    """Bulk-enroll students from an uploaded CSV file (Admin only)"""
+    csv_file = request.FILES.get('file')
+    if csv_file is None:
+        return Response({'error': 'A CSV file is required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    dry_run = request.data.get('dry_run', 'false').lower() == 'true'
+    content = csv_file.read()
+    # Validate now so problems are reported at once; hashing is left to a background job
+    try:
+        result = import_students(content, dry_run=True)
+    except (UnicodeDecodeError, ValidationError) as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    del result['created']
+    if dry_run or not result['valid']:
+        return Response(result)
+    
+    from borrowing import jobs
+    from borrowing.serializers import ReportJobSerializer
+    job = jobs.submit('import_students', {'upload': jobs.save_upload(content)}, request.user)
+    return Response(
+        {**result, 'job': ReportJobSerializer(job, context={'request': request}).data},
+        status=status.HTTP_202_ACCEPTED
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminOrLibrarian])
+def user_directory(request):
+    """
+    Paginated user directory with prefix search on name, email and username.
+    Librarians can only look up students; admins may pass ?role=.
+    """
+    role = request.query_params.get('role', 'student')
+    if role not in dict(User.ROLE_CHOICES):
+        return Response({'error': 'Invalid role'}, status=status.HTTP_400_BAD_REQUEST)
+    if role != 'student' and not request.user.is_admin:
+        return Response(
+            {'error': 'Only admins can search non-student users'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    users = User.objects.filter(role=role, is_active=True).annotate(
+        name_key=Lower('full_name'),
+        email_key=Lower('email'),
+        username_key=Lower('username')
+    ).only('id', 'full_name', 'email', 'username', 'role')
+    
+    query = request.query_params.get('q', '').strip().lower()
+    if query:
+        users = users.filter(
+            prefix_range('name_key', query) |
+            prefix_range('email_key', query) |
+            prefix_range('username_key', query)
+        )
+    
+    paginator = UserDirectoryPagination()
+    page = paginator.paginate_queryset(users, request)
+    serializer = UserDirectorySerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
@@ -14,7 +14,7 @@ const StudentDashboard: React.FC = () => {
 
   const loadCurrentBorrows = async () => {
     try {
-      const borrows = await apiService.getCurrentBorrows();
+      const borrows = await apiService.allPages((next) => apiService.getCurrentBorrows(next));
       setCurrentBorrows(borrows);
     } catch (error) {
       console.error('Failed to load current borrows:', error);
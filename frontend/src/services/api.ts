@@ -63,6 +63,12 @@ export interface ApiResponse<T> {
   results: T[];
 }
 
+export interface CursorPage<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
 class ApiService {
   private api: any;
 
@@ -255,6 +261,15 @@ class ApiService {
     return response.data;
   }
 
+  async searchUsers(params: {
+    q?: string;
+    role?: string;
+    page_size?: number;
+  }): Promise<CursorPage<Pick<User, 'id' | 'full_name' | 'email' | 'username' | 'role'>>> {
+    const response = await this.api.get('/auth/directory/', { params });
+    return response.data;
+  }
+
   // Book methods
   async getBooks(params?: {
     search?: string;
@@ -389,13 +404,13 @@ class ApiService {
     return response.data;
   }
 
-  async getMyBorrows(): Promise<BorrowRecord[]> {
-    const response = await this.api.get('/borrowing/my-borrows/');
+  async getMyBorrows(next?: string | null): Promise<CursorPage<BorrowRecord>> {
+    const response = await this.api.get(next || '/borrowing/my-borrows/');
     return response.data;
   }
 
-  async getCurrentBorrows(): Promise<BorrowRecord[]> {
-    const response = await this.api.get('/borrowing/my-current-borrows/');
+  async getCurrentBorrows(next?: string | null): Promise<CursorPage<BorrowRecord>> {
+    const response = await this.api.get(next || '/borrowing/my-current-borrows/');
     return response.data;
   }
 
@@ -413,11 +428,23 @@ class ApiService {
     return response.data;
   }
 
-  async getUserBorrowHistory(userId: number): Promise<BorrowRecord[]> {
-    const response = await this.api.get(`/borrowing/user/${userId}/history/`);
+  async getUserBorrowHistory(userId: number, next?: string | null): Promise<CursorPage<BorrowRecord>> {
+    const response = await this.api.get(next || `/borrowing/user/${userId}/history/`);
     return response.data;
   }
 
+  // Follows `next` links to the last page; for lists a caller needs whole
+  async allPages<T>(fetchPage: (next?: string | null) => Promise<CursorPage<T>>): Promise<T[]> {
+    const items: T[] = [];
+    let next: string | null = null;
+    do {
+      const page: CursorPage<T> = await fetchPage(next);
+      items.push(...page.results);
+      next = page.next;
+    } while (next);
+    return items;
+  }
+
   // Statistics
   async getBookStatistics(): Promise<any> {
     const response = await this.api.get('/books/statistics/');